@@ -10,15 +10,20 @@ import webbrowser
 
 from dask.distributed import Client, LocalCluster
 
-from phenolo import atoms, settings, reader, viz, output, analysis as aa, executor
+from phenolo import atoms, cache, settings, reader, viz, output, analysis as aa, executor, export, points, runplan
 
 logger = logging.getLogger(__name__)
 
 
 def main(param):
     start_time = time.process_time()
-    print('\rReading Cube', end='')
-    cube = reader.ingest(param)
+    cube = None
+    if param.points is None and param.ext is not None and len(param.ext) == 2:
+        # single point, only its series is read
+        cube = reader.read_pixel(param)
+    if cube is None:
+        print('\rReading Cube', end='')
+        cube = reader.ingest(param)
 
     print('\rInfo -- Cube read', end='')
     _log_info(logging.getLogger('paramters'), param)
@@ -30,7 +35,7 @@ def main(param):
         param.add_px_list(cube.compute())
 
         if param.col_nm is not None and param.row_nm is not None:
-            ts = cube.isel(dict([(param.col_nm, 0), (param.row_nm, 0)])).to_series().astype(float)
+            ts = cube.isel(dict([(param.col_nm, 0), (param.row_nm, 0)])).to_series()
         else:
             ts = cube.to_series()
 
@@ -43,48 +48,52 @@ def main(param):
         param.col_val = [1]
         param.row_val = [1]
 
-        sng_pnt = aa.phenolo(pxldrl, settings=param)
+        sng_pnt = aa.phenolo(pxldrl, settings=param, plan=runplan.RunPlan(param, ts.index))
 
         viz.plot(sng_pnt)
 
-    elif len(cube.coords.get(param.col_nm)) is not 1 and len(cube.coords.get(param.row_nm)) is not 1:
-        cluster = param.cluster
-        localproc = param.processes
-        n_workers = param.n_workers
-        threads_per_worker = param.threads_per_worker
+    elif param.points is not None:
+        # batch of points, a table of results
+        located = points.locate(points.read_points(param.points), param)
+        if located.empty:
+            print('No point inside the grid of the input')
+            sys.exit(1)
 
-        out = output.OutputCointainer(cube, param, name=param.outName)
-        print('\rInfo -- Output ready', end='')
+        client = _client(param)
+        records = executor.analyse_points(cube, client, param, aa.phenolo, located)
+        pth = points.write(points.table(located, records, runplan.RunPlan(param).years), param)
+        print(f'\rInfo -- {len(records)} of {len(located)} points analysed, results in {pth}')
+        _cache_stats(client, param)
 
-        if not cluster and localproc and n_workers and threads_per_worker:
-            cluster = LocalCluster(processes=localproc,
-                                   n_workers=n_workers,
-                                   threads_per_worker=threads_per_worker,
-                                   host='localhost')
+    elif len(cube.coords.get(param.col_nm)) is not 1 and len(cube.coords.get(param.row_nm)) is not 1:
+        if param.out_format == 'netcdf':
+            out = output.OutputCointainer(cube, param, name=param.outName, update=param.incremental)
+            if param.incremental and not out.update:
+                print('\rInfo -- The output can not be updated incrementally, full run (see the log)')
         else:
-            from dask_jobqueue import PBSCluster
-
-            cluster = PBSCluster(cores=threads_per_worker,
-                                 memory="4 GB",
-                                 project='DASK_Parabellum',
-                                 queue='long_fast',
-                                 local_directory='/local0/maraspi/',
-                                 walltime='120:00:00')
+            out = output.ZarrContainer(cube, param, name=param.outName)
+        print('\rInfo -- Output ready', end='')
 
-            workers = n_workers
-            cluster.scale(workers)
+        client = _client(param)
 
-        client = Client(cluster)
+        if param.out_format == 'netcdf':
+            result_cube = executor.analyse(cube, client, param, aa.phenolo, out)
+        else:
+            result_cube = executor.analyse_tiles(cube, client, param, aa.phenolo, out)
+            if param.out_format == 'zarr_netcdf':
+                print('\rInfo -- Conversion to netCDF', end='')
+                result_cube.to_netcdf(cube, param, name=param.outName)
 
-        if client:
-            print('\rInfo -- Client up and running', end='')
-            http = 'http://localhost:8787/status'
-            print('\rInfo -- Analysis is up and running')
-            webbrowser.open(http, new=2, autoraise=True)
+        result_cube.close()
 
-        result_cube = executor.analyse(cube, client, param, aa.phenolo, out)
+        if param.cog_export:
+            if param.out_format == 'zarr':
+                logger.info('COG export needs a netCDF output, skipped')
+            else:
+                print('\rInfo -- COG export', end='')
+                export.export_cogs(os.path.join(param.outFilePth, param.outName + '.nc'), workers=param.n_workers)
 
-        result_cube.close()
+        _cache_stats(client, param)
 
     else:
         raise ValueError
@@ -97,6 +106,50 @@ def main(param):
     logger.info('Process ended @{} after a total time of {}'.format(datetime.now(), end))
 
 
+def _cache_stats(client, param):
+    """Hit/miss of the chunk cache of the run, the single point mode reads its series without the cache"""
+    if param.cache_size:
+        stats = cache.gather_stats(client)
+        logger.info(f'Chunk cache: {stats["hits"]} hits, {stats["misses"]} misses, {stats["evicted"]} evicted')
+        print(f'\rInfo -- Chunk cache: {stats["hits"]} hits, {stats["misses"]} misses')
+
+
+def _client(param):
+    """Dask client on a local or PBS cluster as by the settings"""
+    cluster = param.cluster
+    localproc = param.processes
+    n_workers = param.n_workers
+    threads_per_worker = param.threads_per_worker
+
+    if not cluster and localproc and n_workers and threads_per_worker:
+        cluster = LocalCluster(processes=localproc,
+                               n_workers=n_workers,
+                               threads_per_worker=threads_per_worker,
+                               host='localhost')
+    else:
+        from dask_jobqueue import PBSCluster
+
+        cluster = PBSCluster(cores=threads_per_worker,
+                             memory="4 GB",
+                             project='DASK_Parabellum',
+                             queue='long_fast',
+                             local_directory='/local0/maraspi/',
+                             walltime='120:00:00')
+
+        workers = n_workers
+        cluster.scale(workers)
+
+    client = Client(cluster)
+
+    if client:
+        print('\rInfo -- Client up and running', end='')
+        http = 'http://localhost:8787/status'
+        print('\rInfo -- Analysis is up and running')
+        webbrowser.open(http, new=2, autoraise=True)
+
+    return client
+
+
 def _log_info(logger, param):
     logger.debug('-------------------- start values --------------------')  # TODO must be according to the level
     if hasattr(param, '__dict__'):
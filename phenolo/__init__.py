@@ -7,14 +7,25 @@ Post fata resurgo
 
 """
 name = "Phenolo"
+from .ard import *
+from .catalog import *
 from .atoms import *
+from .cache import *
 from .chronos import *
+from .cycles import *
+from .export import *
 from .filters import *
 from .metrics import *
 from .nodata import *
 from .outlier import *
 from .output import *
+from .parts import *
 from .peaks import *
+from .points import *
+from .qc import *
 from .reader import *
+from .results import *
+from .runplan import *
+from .scratch import *
 from .settings import *
 from .executor import *
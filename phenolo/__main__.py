@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""__main__.py
+
+Phenolo tools, invoked as `python -m phenolo <command>` or `phenolo <command>`
+
+    rechunk  -- write the input of a configuration as an analysis ready store
+
+"""
+import argparse
+import sys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='phenolo')
+    commands = parser.add_subparsers(dest='command')
+
+    rck = commands.add_parser('rechunk', help='Write the input as a time contiguous analysis ready store')
+    rck.add_argument('-c', '--conf', help='Configuration file position', required=True)
+    rck.add_argument('-o', '--out', help='Store position (.zarr or .nc), next to the input if not given')
+    rck.add_argument('-t', '--tile', type=int, default=64, help='Spatial size of the chunks in pixels')
+    rck.add_argument('-m', '--memory', type=int, default=512, help='Memory available per block in MiB')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'rechunk':
+        from phenolo import ard, settings
+
+        param = settings.ProjectParameters(path=args.conf, type='ini')
+        store = ard.rechunk(param, args.out, tile=args.tile, memory=args.memory)
+        print(f'\rAnalysis ready store written in {store}')
+    else:
+        parser.print_help()
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
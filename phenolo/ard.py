@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from phenolo import reader
+from phenolo.executor import print_progress_bar
+
+logger = logging.getLogger(__name__)
+
+
+def _blocks(size, tile, step):
+    """Slices of `step` length (multiple of tile) covering size"""
+    step = max(tile, step // tile * tile)
+    return [slice(i, min(i + step, size)) for i in range(0, size, step)]
+
+
+def _write_zarr(cube, store, chunks, blocks):
+    ds = cube.to_dataset(name='NDVI')
+    ds.attrs['phenolo_ard'] = 'time contiguous'
+    # raw values are kept, fill values read without decoding go back to the encoding
+    for var in ds.variables.values():
+        var.encoding.pop('chunks', None)
+        var.encoding['_FillValue'] = var.attrs.pop('_FillValue', None)
+    encoding = {'NDVI': {'chunks': chunks}}
+
+    # metadata and coordinates only, data are streamed block by block
+    ds.to_zarr(store, mode='w', compute=False, encoding=encoding)
+
+    dim_nm, row_nm, col_nm = cube.dims
+    for i, (rows, cols) in enumerate(blocks):
+        region = {row_nm: rows, col_nm: cols}
+        block = ds.isel(region).drop_vars([dim_nm]).load()
+        block.to_zarr(store, region=region)
+        print_progress_bar(i + 1, len(blocks))
+
+
+def _write_netcdf(cube, store, chunks, blocks):
+    from netCDF4 import Dataset, date2num
+
+    dim_nm, row_nm, col_nm = cube.dims
+
+    root = Dataset(store, 'w', format='NETCDF4')
+    root.phenolo_ard = 'time contiguous'
+
+    for name in cube.dims:
+        root.createDimension(name, cube.sizes[name])
+
+    time_v = root.createVariable(dim_nm, 'f8', (dim_nm,))
+    time_v.units = 'days since 1970-01-01 00:00:00'
+    time_v.calendar = 'gregorian'
+    time_v[:] = date2num(pd.DatetimeIndex(cube[dim_nm].values).to_pydatetime(),
+                         units=time_v.units, calendar=time_v.calendar)
+
+    for name in (row_nm, col_nm):
+        crd_v = root.createVariable(name, 'f8', (name,))
+        crd_v[:] = cube[name].values
+
+    var = root.createVariable('NDVI', cube.dtype, cube.dims, zlib=True, complevel=1, shuffle=True,
+                              chunksizes=chunks)
+    for key, value in cube.attrs.items():
+        if isinstance(value, (str, int, float, np.number)):
+            var.setncattr(key, value)
+
+    for i, (rows, cols) in enumerate(blocks):
+        var[:, rows, cols] = cube[:, rows, cols].values
+        print_progress_bar(i + 1, len(blocks))
+
+    root.close()
+
+
+def rechunk(prmts, store=None, tile=64, memory=512):
+    """
+    Write the input of a run as an analysis ready store.
+
+    The store is chunked by full time series and small tiles, so reading a pixel or a row touches few
+    chunks. The input is streamed in blocks of whole tiles holding at most `memory` MiB, once the store
+    exists reader.ingest opens it in place of the original input.
+
+    The whole input is written, extent and time window of the configuration are ignored so that the
+    store can serve any run on the same input.
+
+    :param prmts: ProjectParameters object, the input is taken from it
+    :param store: path of the store (.zarr or .nc), next to the input by default
+    :param tile: spatial size of the chunks in pixels
+    :param memory: memory available for a block in MiB
+    :return: path of the store
+    """
+    start = time.time()
+
+    if store is None:
+        store = reader._ard_path(prmts.inFilePth) + '.zarr'
+
+    # the parameters of the run are left untouched, ingest adds the dimensions of the whole input
+    prmts = copy.copy(prmts)
+    prmts.ext, prmts.exm_start, prmts.exm_end = None, pd.NaT, pd.NaT
+    cube = reader.ingest(prmts, ard=False)
+    cube = cube.transpose(prmts.dim_nm, prmts.row_nm, prmts.col_nm)
+
+    n_dim, n_row, n_col = cube.shape
+    chunks = (n_dim, min(tile, n_row), min(tile, n_col))
+
+    # number of pixels whose full time series fit in memory
+    pixels = max(1, memory * 2 ** 20 // (n_dim * cube.dtype.itemsize))
+    if pixels >= n_col * tile:
+        col_blocks = [slice(0, n_col)]
+        row_blocks = _blocks(n_row, tile, pixels // n_col)
+    else:
+        col_blocks = _blocks(n_col, tile, pixels // tile)
+        row_blocks = _blocks(n_row, tile, tile)
+    blocks = [(rows, cols) for rows in row_blocks for cols in col_blocks]
+
+    logger.info(f'Rechunking {cube.shape} into {store} with chunks {chunks} in {len(blocks)} blocks')
+
+    if store.rstrip('/\\').endswith('.zarr'):
+        _write_zarr(cube, store, chunks, blocks)
+    elif store.endswith('.nc'):
+        _write_netcdf(cube, store, chunks, blocks)
+    else:
+        raise ValueError(f'Unknown store type: {store}, use .zarr or .nc')
+
+    logger.info(f'Rechunking required:{time.time() - start}')
+
+    return store
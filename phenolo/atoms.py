@@ -15,35 +15,84 @@ class PixelDrill(object):
     a single pixel drill rappresent the minimum unit of analye
     """
 
+    __slots__ = ('ts_raw', 'position', 'tst', 'ts', 'ts_resc', 'ts_filtered', 'ts_cleaned', 'ts_interpolated',
+                 'season_ts', 'season_lng', 'expSeason', 'seasons', 'trend', 'trend_ts', 'medspan', 'ts_d', 'trend_d',
+                 'ts_sv', 'ps', 'mpd_val', 'pks', 'sincys', 'phen', 'msdd',
+                 'sb', 'se', 'sl', 'spi', 'si', 'cf', 'afi', 'warn', 'error', 'errtyp', 'restart', 'tail')
+
     def __init__(self, ts, px):
+        for ith in self.__slots__:
+            setattr(self, ith, None)
+
         self.ts_raw = ts
         self.position = px
-        self.tst = None
-        self.ts_filtered = None
-        self.ts_interpolated = None
-        self.season_ts = None
-        self.season_lng = None
-        self.expSeason = None
-        self.trend_ts = None
-        self.medspan = None
-        self.ts_d = None
-        self.ts_sv = None
-        self.mpd_val = None
-        self.pks = None
-        self.seasons = None
         self.sincys = []
-        self.error = None
         self.phen = []
         self.error = False
-        self.errtyp = None
 
     def __del__(self):
-        for ith in self.__dict__.keys():
+        for ith in self.__slots__:
             setattr(self, ith, None)
 
 
+class PixelRecord(object):
+    """
+    Compact result of a pixel drill, the only object sent back by the workers.
+
+    Attributes:
+        position: (row, col) of the pixel
+        values: per year metrics as float32 array (len(PixelRecord.metrics) x years)
+        season: number of seasons per year, season length in days if longer than a year
+        errtyp: error code of the analysis, 0 if the pixel has been processed
+        period: season period in samples, 0 if not estimated
+        valley: restart valley in days since 1970-01-01, the cycles from it on are analysed again by an
+                incremental update (see analysis.restart)
+        tail: smoothed series at the observations of the year before the restart valley, None if not set
+        since: index of the first year of values computed, earlier years are kept from the previous run
+
+    :param pxldrl: processed pixel drill
+    :param years: years of the output
+    :param since: index of the first year computed
+    """
+
+    __slots__ = ('position', 'values', 'season', 'errtyp', 'period', 'valley', 'tail', 'since')
+
+    metrics = ('sb', 'se', 'sl', 'spi', 'si', 'cf', 'afi', 'warn')
+
+    def __init__(self, pxldrl, years, since=0):
+        self.position = tuple(pxldrl.position)
+        self.values = np.full((len(self.metrics), len(years)), np.nan, dtype=np.float32)
+        self.season = 0
+        self.errtyp = 0
+        self.period = 0
+        self.valley = np.nan
+        self.tail = None
+        self.since = since
+
+        if pxldrl.error:
+            self.errtyp = pxldrl.errtyp
+            return
+
+        if pxldrl.seasons is not None:
+            self.period = len(pxldrl.seasons)
+        if pxldrl.restart is not None:
+            self.valley = (pxldrl.restart - pd.Timestamp(0)) / pd.Timedelta(1, unit='D')
+            self.tail = pxldrl.tail
+
+        for i, name in enumerate(self.metrics):
+            attr = getattr(pxldrl, name)
+            if isinstance(attr, pd.Series):
+                self.values[i] = attr.reindex(years).values
+
+        if pxldrl.season_lng:
+            if pxldrl.season_lng <= 365.0:
+                self.season = int(365 / pxldrl.season_lng)
+            else:
+                self.season = int(pxldrl.season_lng)
+
+
 class SingularCycle(object):
-    def __init__(self, ts, sd, ed):
+    def __init__(self, ts, sd, ed, posix=None):
         """
         Rappresent a singular cycle defined as the curve between two minima
 
@@ -66,6 +115,7 @@ class SingularCycle(object):
             ref_yr: reference yr
 
         :param : Time series as pandas.Series object
+        :param posix: POSIX seconds of the time series index (optional, computed from the index if missing)
         """
         self.err = False
         self.warn = None
@@ -81,7 +131,7 @@ class SingularCycle(object):
         self.mpi = self.__integral(self.mpf)  # permanent fraction integral
         self.vox = self.__difference(self.mms, self.mpf)  # Values between two min subtracted the permanent fraction
         self.voxi = self.__integral(self.vox)  # integral of vox
-        self.cbc = self.__barycenter()  # cycle barycenter / ex season barycenter
+        self.cbc = self.__barycenter(ts, posix)  # cycle barycenter / ex season barycenter
         self.cbcd = self.__to_gregorian_date(self.cbc)
         self.csd = self.__cycle_deviation_standard()  # cycle deviation standard / Season deviation standard
         self.csdd = self.__to_gregorian(self.csd)  # cycle deviation standard in days /Season deviation standard in days
@@ -162,11 +212,15 @@ class SingularCycle(object):
             logger.debug('Warning! Maximum research went wrong')
             return None
 
-    def __barycenter(self):
+    def __barycenter(self, ts, posix):
         """Barycenter"""
         cbc = 0
         try:
-            self.posix_time = self.vox.index.astype(np.int64) / 10 ** 9
+            if posix is not None:
+                start = ts.index.searchsorted(self.vox.index[0])
+                self.posix_time = posix[start:start + len(self.vox)]
+            else:
+                self.posix_time = self.vox.index.astype(np.int64) / 10 ** 9
             cbc = (self.posix_time * self.vox).sum() / self.vox.sum()
         except(RuntimeError, Exception, ValueError):
             self.err = True
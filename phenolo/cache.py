@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import os
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# hit/miss counters of the process
+_STATS = {'hits': 0, 'misses': 0, 'evicted': 0}
+
+
+class ChunkCache(object):
+    """
+    Local read-through cache of the input chunks.
+
+    Chunks are stored as .npy files under the cache folder, the mtime of a file is refreshed at every
+    hit and the least recently used files are evicted when the size cap is exceeded. The object
+    holds only the folder and the cap, it is cheap to pickle and every worker uses the same folder.
+
+    :param root: cache folder (usually on a local SSD)
+    :param size: size cap in bytes
+    """
+
+    def __init__(self, root, size):
+        self.root = root
+        self.size = size
+        self.__used = None
+
+    def __getstate__(self):
+        return {'root': self.root, 'size': self.size}
+
+    def __setstate__(self, state):
+        self.__init__(state['root'], state['size'])
+
+    def __files(self):
+        with os.scandir(self.root) as entries:
+            return [(i.stat().st_mtime, i.stat().st_size, i.path) for i in entries
+                    if i.is_file() and i.name.endswith('.npy')]
+
+    def __evict(self):
+        files = sorted(self.__files())
+        self.__used = sum(size for _, size, _ in files)
+
+        # down to 90% of the cap, oldest first
+        for _, size, path in files:
+            if self.__used <= self.size * 0.9:
+                break
+            try:
+                os.remove(path)
+                self.__used -= size
+                _STATS['evicted'] += 1
+            except OSError:
+                pass
+
+    def get(self, token, read):
+        """
+        Chunk from the cache, read and stored if missing
+
+        :param token: key of the chunk
+        :param read: function returning the chunk
+        :return: numpy array
+        """
+        path = os.path.join(self.root, token + '.npy')
+        try:
+            data = np.load(path)
+            os.utime(path)
+            _STATS['hits'] += 1
+            return data
+        except (OSError, ValueError):
+            pass
+
+        data = read()
+        _STATS['misses'] += 1
+
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            # written aside and moved, concurrent readers never see a partial chunk
+            tmp = os.path.join(self.root, f'.{token}.{uuid.uuid4().hex}.tmp')
+            with open(tmp, 'wb') as f:
+                np.save(f, data)
+            os.replace(tmp, path)
+
+            if self.__used is None:
+                self.__evict()
+            else:
+                self.__used += data.nbytes
+                if self.__used > self.size:
+                    self.__evict()
+        except OSError:
+            logger.debug(f'Chunk cache {self.root} not writable')
+
+        return data
+
+
+class CachedArray(object):
+    """
+    Lazy array read through a ChunkCache.
+
+    :param source: lazy array (shape, dtype, ndim and __getitem__)
+    :param cache: ChunkCache object
+    :param token: key of the source (file, variable, mtime, window)
+    """
+
+    def __init__(self, source, cache, token):
+        self.source = source
+        self.cache = cache
+        self.token = token
+        self.shape = tuple(source.shape)
+        self.dtype = np.dtype(source.dtype)
+        self.ndim = len(self.shape)
+
+    def __getitem__(self, key):
+        chunk = hashlib.sha1(f'{self.token}|{key!r}'.encode()).hexdigest()
+        return self.cache.get(chunk, lambda: np.asarray(self.source[key]))
+
+
+def source_token(path, *args):
+    """Key of a file based source, changes with the file"""
+    stat = os.stat(path)
+    return '|'.join(str(i) for i in (os.path.abspath(path), stat.st_mtime, stat.st_size) + args)
+
+
+def stats():
+    """Hit/miss counters of the process"""
+    return dict(_STATS)
+
+
+def _pid_stats():
+    return os.getpid(), stats()
+
+
+def gather_stats(client=None):
+    """
+    Hit/miss counters of the run, summed over the process and the dask workers
+
+    :param client: dask distributed Client, None for the local process only
+    :return: dict
+    """
+    total = stats()
+    if client is not None:
+        try:
+            for pid, worker in client.run(_pid_stats).values():
+                # threaded workers share the counters of this process
+                if pid == os.getpid():
+                    continue
+                for key, value in worker.items():
+                    total[key] += value
+        except Exception:
+            logger.debug('Chunk cache statistics not available from the workers')
+    return total
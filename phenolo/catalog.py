@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+import glob
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# sidecar manifest written in the directory of the files
+INDEX_NAME = 'phenolo_index.json'
+INDEX_VERSION = 1
+
+
+class NcArray(object):
+    """
+    Lazy array of a variable stored in a netCDF file.
+
+    The file is opened only when data are requested, the object is cheap to pickle and can be
+    shipped to the workers inside a dask graph. Values are returned raw (no mask and scale).
+
+    :param path: path of the netCDF file
+    :param entry: index entry of the file as by scan
+    :param rows: window of rows exposed
+    :param cols: window of columns exposed
+    """
+
+    def __init__(self, path, entry, rows=slice(None), cols=slice(None)):
+        self.path = path
+        self.variable = entry['variable']
+        self.dtype = np.dtype(entry['dtype'])
+        n_time, n_rows, n_cols = entry['shape']
+        self.rows = slice(*rows.indices(n_rows)[:2])
+        self.cols = slice(*cols.indices(n_cols)[:2])
+        self.shape = (n_time, self.rows.stop - self.rows.start, self.cols.stop - self.cols.start)
+        self.ndim = 3
+
+    def __getitem__(self, key):
+        from netCDF4 import Dataset
+
+        with Dataset(self.path, 'r') as root:
+            var = root.variables[self.variable]
+            var.set_auto_maskandscale(False)
+            return np.asarray(var[self.__file_key(key)])
+
+    def __file_key(self, key):
+        """Key of the window moved on the file"""
+        key = key if isinstance(key, tuple) else (key,)
+        key = key + (slice(None),) * (3 - len(key))
+
+        file_key = [key[0]]
+        for k, win in zip(key[1:], (self.rows, self.cols)):
+            size = win.stop - win.start
+            if isinstance(k, slice):
+                start, stop, step = k.indices(size)
+                file_key.append(slice(win.start + start, win.start + stop, step))
+            elif np.ndim(k) == 0:
+                file_key.append(win.start + int(k) % size)
+            else:
+                file_key.append(win.start + np.asarray(k) % size)
+        return tuple(file_key)
+
+
+def _data_var(root):
+    """The NDVI variable if available, otherwise the first variable with three dimensions"""
+    if 'NDVI' in root.variables:
+        return root.variables['NDVI']
+    for var in root.variables.values():
+        if var.ndim == 3:
+            return var
+    raise ValueError(f'No three dimensional variable in {root.filepath()}')
+
+
+def _crs(root, var):
+    """Spatial reference of the variable as stored in its grid mapping"""
+    mapping = getattr(var, 'grid_mapping', None)
+    if mapping and mapping in root.variables:
+        attrs = root.variables[mapping].__dict__
+        return attrs.get('spatial_ref') or attrs.get('crs_wkt')
+    return getattr(root, 'crs', None)
+
+
+def _transform(values):
+    """(origin, step) of a regular coordinate"""
+    values = np.asarray(values, dtype=float)
+    step = float(values[1] - values[0]) if values.size > 1 else 0.0
+    return [float(values[0]), step]
+
+
+def scan(path):
+    """
+    Describe a netCDF file without reading its data
+
+    :param path: path of the file
+    :return: dict index entry
+    """
+    from netCDF4 import Dataset, num2date
+
+    stat = os.stat(path)
+    with Dataset(path, 'r') as root:
+        var = _data_var(root)
+        time_nm, row_nm, col_nm = var.dimensions
+
+        time_v = root.variables[time_nm]
+        if hasattr(time_v, 'units'):
+            dates = num2date(time_v[:], units=time_v.units, calendar=getattr(time_v, 'calendar', 'standard'),
+                             only_use_cftime_datetimes=False, only_use_python_datetimes=True)
+            times = [pd.Timestamp(i).isoformat() for i in dates]
+        else:
+            times = [float(i) for i in time_v[:]]
+
+        chunking = var.chunking()
+
+        return {'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                'variable': var.name,
+                'dims': list(var.dimensions),
+                'shape': list(var.shape),
+                'dtype': var.dtype.str,
+                'chunks': None if chunking == 'contiguous' else list(chunking),
+                'time': times,
+                'crs': _crs(root, var),
+                'transform': _transform(root.variables[col_nm][:]) + _transform(root.variables[row_nm][:])}
+
+
+def grid(path, entry):
+    """Coordinates and attributes shared by all the files, read from the first one"""
+    from netCDF4 import Dataset
+
+    with Dataset(path, 'r') as root:
+        var = root.variables[entry['variable']]
+        time_nm, row_nm, col_nm = var.dimensions
+        return {'dims': list(var.dimensions),
+                'attrs': {k: np.asarray(v).tolist() for k, v in var.__dict__.items()},
+                'coords': {row_nm: np.asarray(root.variables[row_nm][:], dtype=float).tolist(),
+                           col_nm: np.asarray(root.variables[col_nm][:], dtype=float).tolist()}}
+
+
+def load_index(pattern):
+    """
+    Index of the files matching a glob pattern.
+
+    The manifest is kept next to the files, entries are reused as long as mtime and size of their
+    file don't change, so only new or modified files are opened.
+
+    :param pattern: glob of the netCDF files
+    :return: (list of (path, entry) sorted by path, grid of the first file)
+    """
+    files = sorted(glob.glob(pattern))
+    if not files:
+        raise FileNotFoundError(pattern)
+
+    index_pth = os.path.join(os.path.dirname(files[0]), INDEX_NAME)
+
+    index = {}
+    if os.path.isfile(index_pth):
+        try:
+            with open(index_pth, 'r') as f:
+                index = json.load(f)
+            if index.get('version') != INDEX_VERSION:
+                index = {}
+        except (ValueError, OSError):
+            logger.debug(f'Index {index_pth} unreadable, rebuilt')
+            index = {}
+
+    entries = index.get('files', {})
+    changed = False
+
+    folder = os.path.dirname(files[0])
+    for name in [i for i in entries if not os.path.isfile(os.path.join(folder, i))]:
+        del entries[name]
+        changed = True
+
+    for path in files:
+        name = os.path.basename(path)
+        stat = os.stat(path)
+        entry = entries.get(name)
+        if entry is None or entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+            entries[name] = scan(path)
+            changed = True
+
+    first = entries[os.path.basename(files[0])]
+    shared = index.get('grid')
+    if shared is None or shared.get('file') != os.path.basename(files[0]) or changed:
+        shared = dict(grid(files[0], first), file=os.path.basename(files[0]))
+        changed = True
+
+    for path in files:
+        entry = entries[os.path.basename(path)]
+        if entry['shape'][1:] != first['shape'][1:] or entry['transform'] != first['transform']:
+            raise ValueError(f'{path} is not on the grid of {files[0]}')
+
+    if changed:
+        try:
+            with open(index_pth, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'grid': shared, 'files': entries}, f)
+            logger.debug(f'Index {index_pth} updated')
+        except OSError:
+            logger.debug(f'Index {index_pth} not writable, kept in memory')
+
+    return [(path, entries[os.path.basename(path)]) for path in files], shared
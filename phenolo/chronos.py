@@ -53,5 +53,7 @@ def medspan(season_lng, param):
     return medspan
 
 
-def time_resample(ts):
-    return ts.asfreq('D').interpolate(method='linear').fillna(0)
+def time_resample(ts, index=None):
+    if index is None:
+        return ts.asfreq('D').interpolate(method='linear').fillna(0)
+    return ts.reindex(index).interpolate(method='linear').fillna(0)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from phenolo import metrics, parts
+
+logger = logging.getLogger(__name__)
+
+# rows of a tile, the partition key of the dataset
+TILE_ROWS = 256
+
+# columns stored as dates and as small integers
+_DATES = ('sd', 'ed', 'sbd', 'sed', 'max_idx')
+_INTEGERS = ('sb', 'se', 'sl', 'warn', 'ref_yr')
+
+
+class CycleWriter(parts.PartWriter):
+    """
+    Per cycle table written as a Parquet dataset partitioned by tile (tile=row // TILE_ROWS).
+
+    Every process buffers the cycles of its pixels and writes them as record batches to its own files
+    (see parts.PartWriter), one per tile touched. Rows are keyed by (row, col, cycle).
+
+    :param root: folder of the dataset
+    """
+
+    # cycles buffered before a record batch is written
+    limit = 65536
+
+    def append(self, pxldrl):
+        """
+        Add the cycles of a pixel drill, written with the next batch
+
+        :param pxldrl: processed pixel drill
+        """
+        if not pxldrl.phen:
+            return
+        table = metrics.cycle_table(pxldrl)
+        n = len(pxldrl.phen)
+        table['row'] = np.full(n, pxldrl.position[0], dtype=np.int32)
+        table['col'] = np.full(n, pxldrl.position[1], dtype=np.int32)
+        table['cycle'] = np.arange(n, dtype=np.int16)
+        self.push(table, n)
+
+    def _write(self, items):
+        """Write the buffered cycles, a file per tile"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        columns = {i: np.concatenate([j[i] for j in items]) for i in items[0]}
+        tiles = columns['row'] // TILE_ROWS
+        batch = uuid.uuid4().hex[:8]
+
+        for tile in np.unique(tiles):
+            sel = tiles == tile
+            folder = os.path.join(self.root, f'tile={tile}')
+            os.makedirs(folder, exist_ok=True)
+            pq.write_table(pa.table(_arrays({i: j[sel] for i, j in columns.items()})),
+                           os.path.join(folder, f'{self.part}-{batch}.parquet'), compression='zstd')
+
+
+def writer(root):
+    """Cycle writer of the process for a folder"""
+    return CycleWriter.get(root)
+
+
+def read(root, rows=None, cols=None):
+    """
+    Per cycle table of a dataset
+
+    :param root: folder of the dataset
+    :param rows: (first, last) rows to be read, all if None
+    :param cols: (first, last) columns to be read, all if None
+    :return: pandas DataFrame sorted by row, col and cycle
+    """
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(root, format='parquet', partitioning='hive')
+    flt = None
+    for name, rng in (('row', rows), ('col', cols)):
+        if rng is not None:
+            cond = (ds.field(name) >= rng[0]) & (ds.field(name) <= rng[1])
+            flt = cond if flt is None else flt & cond
+    if rows is not None:
+        # partitions outside the rows are skipped
+        flt = flt & (ds.field('tile') >= rows[0] // TILE_ROWS) & (ds.field('tile') <= rows[1] // TILE_ROWS)
+
+    table = dataset.to_table(filter=flt).to_pandas()
+    return table.drop(columns='tile').sort_values(['row', 'col', 'cycle']).reset_index(drop=True)
+
+
+def _arrays(columns):
+    """Arrow columns, dates as timestamps and small integers as nullable int16"""
+    import pyarrow as pa
+
+    arrays = {'row': pa.array(columns['row']), 'col': pa.array(columns['col']), 'cycle': pa.array(columns['cycle'])}
+    for name in metrics.CYCLE_COLUMNS:
+        values = columns[name]
+        mask = ~np.isfinite(values)
+        if name in _DATES:
+            dates = (pd.Timestamp(0) + pd.to_timedelta(np.where(mask, 0, values), unit='D')).values
+            arrays[name] = pa.array(dates.astype('datetime64[s]'), mask=mask)
+        elif name in _INTEGERS:
+            arrays[name] = pa.array(np.where(mask, 0, values).astype(np.int16), mask=mask)
+        else:
+            arrays[name] = pa.array(values)
+    return arrays
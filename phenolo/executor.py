@@ -6,7 +6,7 @@ import numpy as np
 import pandas as pd
 from dask.distributed import as_completed
 
-from phenolo import atoms
+from phenolo import atoms, output, points, runplan
 
 logger = logging.getLogger(__name__)
 
@@ -37,25 +37,56 @@ def print_progress_bar(iteration, total, prefix='', suffix='', decimals=1, lengt
         print()
 
 
-def process(px, **kwargs):
+def process(px, window=None, **kwargs):
     """
     Wrapper for a function pass as "action" over a Pandas time series.
 
     :param px: pandas time series position {int}
-    :param kwargs: **{'data': xarray cube,
+    :param window: trailing window of an incremental update as by OutputCointainer.windows, None for the
+                   whole series
+    :param kwargs: **{'data': raw values of the row (time x columns) in their native type,
                       'action': function to be apply,
                       'param': param object
+                      'plan': run plan object
                       'row': row position in the cube as {int}
-    :return: Obj{pxdrl}
+                      'col': column position in the cube if px is not (point lists), px if not provided
+    :return: Obj{PixelRecord}, the pixel drill goes to the scratch store if the scratch is retained
     """
     cube = kwargs.pop('data', '')
     action = kwargs.pop('action', '')
     param = kwargs.pop('param', '')
+    plan = kwargs.pop('plan', None)
     row = kwargs.pop('row', '')
+    col = kwargs.pop('col', px)
 
-    pxldrl = atoms.PixelDrill(cube.isel(dict([(param.col_nm, px)])).to_series().astype(float), [row, px])
+    if plan is None:
+        plan = runplan.RunPlan(param)
 
-    return action(pxldrl, settings=param)
+    # the series share the time axis of the plan, values are decoded by the preprocessing
+    ts = pd.Series(cube[:, px], index=plan.time)
+
+    pxldrl = action(atoms.PixelDrill(ts, [row, col]), settings=param, plan=plan, window=window)
+
+    if window is not None and pxldrl.error:
+        # the trailing window doesn't fit the pixel anymore (since 0), the whole series is processed again
+        logger.info(f'Trailing window failed ({_error_decoder(pxldrl.errtyp)}) in position:{pxldrl.position}, '
+                    f'whole series processed')
+        window = None
+        pxldrl = action(atoms.PixelDrill(ts, [row, col]), settings=param, plan=plan)
+
+    if param.ovr_scratch:
+        output.scratch_dump(pxldrl, param)
+    if param.cycle_out:
+        output.cycle_dump(pxldrl, param)
+
+    return atoms.PixelRecord(pxldrl, plan.years, _since(plan.years, window))
+
+
+def _since(years, window):
+    """Index of the first year computed in a window"""
+    if window is None:
+        return 0
+    return int(years.searchsorted(window['since']))
 
 
 def _pre_feeder(nxt_row, param):
@@ -76,44 +107,61 @@ def _pxl_lst(row, param):
     return y_lst
 
 
-def _cache_def(dim_val, col_val):
+def _cache_def(dim_val, col_val, n_tail):
     """
+    Row cache of the results
 
-    :param dim_val:
-    :param col_val:
-    :return:
+    :param dim_val: years of the output
+    :param col_val: columns of the row
+    :param n_tail: length of the smoothed tail of the state
+    :return: dict with the per year metrics (metrics x col x years), season count, error code and state per column
     """
-    attr = ['sb', 'se', 'sl', 'spi', 'si', 'cf', 'afi', 'warn']
-    cache = {name: pd.DataFrame(index=dim_val, columns=col_val) for name in attr}
-    cache['sl'] = pd.DataFrame(pd.Timedelta(0, unit='D'), index=dim_val, columns=col_val)
-    cache['season'] = pd.Series(0, index=col_val)
-    cache['err'] = pd.Series(0, index=col_val)
-    return cache
+    return {'metrics': np.full((len(atoms.PixelRecord.metrics), len(col_val), len(dim_val)), np.nan,
+                               dtype=np.float32),
+            'season': np.zeros(len(col_val), dtype=np.int64),
+            'err': np.zeros(len(col_val), dtype=np.int64),
+            'period': np.zeros(len(col_val), dtype=np.int32),
+            'valley': np.full(len(col_val), np.nan),
+            'tail': np.full((len(col_val), n_tail), np.nan, dtype=np.float32)}
 
 
 def _cache_cleaner(cache, dim_val, col_val):
-    attr = ['sb', 'se', 'sl', 'spi', 'si', 'cf', 'afi', 'warn']
-    for name in attr:
-        cache[name] = cache[name][0:0].reindex(dim_val)
-    cache['sl'] = pd.DataFrame(pd.Timedelta(0, unit='D'), index=dim_val, columns=col_val)
-    cache['season'] = cache['season'][0:0].reindex(col_val)
-    cache['err'] = cache['err'][0:0].reindex(col_val)
+    cache['metrics'].fill(np.nan)
+    cache['season'].fill(0)
+    cache['err'].fill(0)
+    cache['period'].fill(0)
+    cache['valley'].fill(np.nan)
+    cache['tail'].fill(np.nan)
+    return cache
+
+
+def _cache_loader(cache, out, row):
+    """Fill the row cache with the results of the previous run, they are kept where not computed again"""
+    for i, name in enumerate(atoms.PixelRecord.metrics):
+        cache['metrics'][i] = np.ma.filled(getattr(out, name)[row, :, :].astype(np.float32), np.nan)
+    cache['season'][:] = np.ma.filled(out.n_seasons[row, :], 0)
+    cache['err'][:] = np.ma.filled(out.err[row, :], 0)
+    cache['period'][:] = np.ma.filled(out.period[row, :], 0)
+    cache['valley'][:] = np.ma.filled(out.valley[row, :], np.nan)
+    cache['tail'][:] = np.ma.filled(out.tail[row, :, :].astype(np.float32), np.nan)
     return cache
 
 
-def _filler(key, pxldrl, att, col):
+def _filler(cache, record):
     """
-    Fill the dictionary with the passes key and values
-    :param key: specific key to be filled
-    :param pxldrl:
-    :param att:
-    :param col:
+    Fill the row cache with a pixel record
+
+    :param cache: row cache
+    :param record: PixelRecord
     :return:
     """
-    try:
-        key[col] = getattr(pxldrl, att)[:]
-    except:
-        print(f'{att} | {pxldrl.position}')
+    col = record.position[1]
+    cache['metrics'][:, col, record.since:] = record.values[:, record.since:]
+    cache['season'][col] = record.season
+    cache['err'][col] = record.errtyp
+    cache['period'][col] = record.period
+    cache['valley'][col] = record.valley
+    cache['tail'][col] = np.nan if record.tail is None else record.tail
     return
 
 
@@ -126,6 +174,36 @@ def _error_decoder(err):
     return err_cod[err]
 
 
+def _block_rows(cube, param):
+    """Rows of a block read at once, rows x columns x time x itemsize within chunk_memory (one row at least)"""
+    row_bytes = cube.dtype.itemsize * cube.size // max(1, cube.sizes[param.row_nm])
+    return max(1, param.chunk_mem // max(1, row_bytes))
+
+
+def _row_blocks(cube, row_nm, start=0, rows=None):
+    """
+    Row slices following the dask chunks of the cube
+
+    :param cube: xarray DataArray
+    :param row_nm: name of the row dimension
+    :param start: first row
+    :param rows: maximum rows of a slice, a chunk with more rows is split
+    :return: generator of slices
+    """
+    if cube.chunks is None:
+        sizes = [cube.sizes[row_nm]]
+    else:
+        sizes = cube.chunks[cube.get_axis_num(row_nm)]
+
+    stop = 0
+    for size in sizes:
+        stop += size
+        while stop > start:
+            end = stop if rows is None else min(stop, start + rows)
+            yield slice(start, end)
+            start = end
+
+
 def analyse(cube, client, param, action, out):
     """
 
@@ -136,78 +214,75 @@ def analyse(cube, client, param, action, out):
     :param out:
     :return:
     """
+    plan = runplan.RunPlan(param)
     s_param = client.scatter(param, broadcast=True)
+    s_plan = client.scatter(plan, broadcast=True)
 
     try:
         nxt_row, nxt_y_lst, nxt_cache = [None] * 3
 
-        dim_val = pd.to_datetime(param.dim_val).year.unique()
+        dim_val = plan.years
         col_val = range(0, len(param.col_val))
 
         cache = None
+        block, blk = None, None
+        updated, fallback = 0, 0
+        # rows of the blocks read, the whole columns of a row are needed by the row cache
+        n_block = _block_rows(cube, param)
 
         for rowi in range(len(param.row_val)):
+            # rows are taken from blocks read in the same order of the dask chunks
+            if blk is None or rowi >= blk.stop:
+                blk = next(_row_blocks(cube, param.row_nm, rowi, n_block))
+                block = cube.isel(dict([(param.row_nm, blk)])).compute()
+                logger.debug(f'Rows {blk.start}:{blk.stop} loaded')
+
+            row = block.isel(dict([(param.row_nm, rowi - blk.start)]))
+            y_lst = _pxl_lst(row, param)
+
             if rowi == 0:
-                row = cube.isel(dict([(param.row_nm, rowi)])).compute()
-                y_lst = _pxl_lst(row, param)
-                cache = _cache_def(dim_val, col_val)
+                cache = _cache_def(dim_val, col_val, plan.yr_dek)
             else:
-                row = cube.isel(dict([(param.row_nm, rowi)])).compute()
-                y_lst = _pxl_lst(row, param)
                 cache = _cache_cleaner(cache, dim_val, col_val)
 
+            # incremental update, only the trailing window of the pixels with a state is processed
+            # (the scratch files need the whole series)
+            windows = [None] * len(col_val)
+            if out.update and not param.ovr_scratch:
+                cache = _cache_loader(cache, out, rowi)
+                windows = out.windows(rowi, plan.yr_dys)
+
+            # rows without valid pixels are written as well, their pixels are counted by the QC statistics
             if y_lst.any():
-                s_row = client.scatter(row, broadcast=True)
-            else:
-                print_progress_bar(rowi, len(param.row_val))
-                logger.debug(f'Row {rowi} processed')
-                continue
-
-            futures = client.map(process, y_lst, **{'data': s_row, 'row': rowi, 'param': s_param, 'action': action})
-
-            for future, result in as_completed(futures, with_results=True):
-                pxldrl = result
-                col = pxldrl.position[1]
-
-                if param.ovr_scratch:
-                    try:
-                        import phenolo.output as output
-                        output.scratch_dump(pxldrl, param)
-                    except Exception:
-                        raise Exception
-
-                if pxldrl.error:
-                    cache['err'].iloc[col] = 1
-                    cache['season'].iloc[col] = 0
-                    logger.debug(f'Error: {_error_decoder(pxldrl.errtyp)} in position:{pxldrl.position}')
-                else:
-                    try:
-                        for key in cache:
-                            if key is not 'season' and key is not 'err':
-                                _filler(cache[key], pxldrl, key, col)
-
-                        if pxldrl.season_lng:
-                            if pxldrl.season_lng <= 365.0:
-                                cache['season'].iloc[col] = int(365 / pxldrl.season_lng)
-                            else:
-                                cache['season'].iloc[col] = int(pxldrl.season_lng)
-                    except (RuntimeError, Exception, ValueError):
-                        continue
-
-            client.cancel(s_row)
-            client.cancel(futures)
-
-            out.sb[rowi, :, :] = cache['sb'].transpose().values
-            out.se[rowi, :, :] = cache['se'].transpose().values
-            out.sl[rowi, :, :] = cache['sl'].transpose().values
-            out.spi[rowi, :, :] = cache['spi'].transpose().values
-            out.si[rowi, :, :] = cache['si'].transpose().values
-            out.cf[rowi, :, :] = cache['cf'].transpose().values
-
-            out.warn[rowi, :, :] = cache['warn'].transpose().values
-
-            out.n_seasons[rowi] = cache['season'].values
-            out.err[rowi] = cache['err'].values
+                # raw values only, without the xarray wrapping
+                s_row = client.scatter(np.ascontiguousarray(row.transpose(param.dim_nm, param.col_nm).values),
+                                       broadcast=True)
+
+                futures = client.map(process, y_lst, [windows[i] for i in y_lst],
+                                     **{'data': s_row, 'row': rowi, 'param': s_param, 'plan': s_plan,
+                                        'action': action})
+
+                for future, result in as_completed(futures, with_results=True):
+                    record = result
+                    col = record.position[1]
+
+                    if record.errtyp:
+                        logger.debug(f'Error: {_error_decoder(record.errtyp)} in position:{record.position}')
+                    if windows[col] is not None:
+                        updated += 1
+                        fallback += record.since == 0
+
+                    _filler(cache, record)
+
+                client.cancel(s_row)
+                client.cancel(futures)
+
+            # a tile of one row, nan are stored as fill values
+            tile = dict(zip(atoms.PixelRecord.metrics, cache['metrics'][:, np.newaxis]))
+            tile.update({'n_seasons': cache['season'][np.newaxis], 'err': cache['err'][np.newaxis],
+                         'period': cache['period'][np.newaxis], 'valley': cache['valley'][np.newaxis],
+                         'tail': cache['tail'][np.newaxis]})
+            out.fill(slice(rowi, rowi + 1), tile)
 
             try:
                 if rowi in range(0, len(param.row_val), 250):
@@ -219,6 +294,13 @@ def analyse(cube, client, param, action, out):
 
             logger.debug(f'Row {rowi} processed')
 
+        if out.update:
+            logger.info(f'{updated} pixels updated on their trailing window, {fallback} of them processed on the '
+                        f'whole series')
+
+        if param.ovr_scratch or param.cycle_out:
+            _flush(client)
+
         return out
 
     except Exception as ex:
@@ -228,3 +310,196 @@ def analyse(cube, client, param, action, out):
         print(message)
 
         logger.debug(f'Critical error in the main loop, latest position row {rowi}, col {col}, error type {message}')
+
+
+def process_tile(data, rows, pixels, **kwargs):
+    """
+    Process a tile of rows and write its results straight to the store.
+
+    :param data: raw values of the tile (time x rows x columns) in their native type
+    :param rows: slice of the rows of the tile
+    :param pixels: list per row of the columns to be analysed
+    :param kwargs: **{'store': ZarrContainer object,
+                      'action': function to be apply,
+                      'param': param object
+                      'plan': run plan object}
+    :return: (rows, number of pixels in error, QCStats of the tile)
+    """
+    store = kwargs.pop('store')
+    param = kwargs.pop('param', '')
+    plan = kwargs.pop('plan', None)
+
+    if plan is None:
+        plan = runplan.RunPlan(param)
+
+    col_val = range(0, data.shape[2])
+    caches = []
+    errors = 0
+    for i, y_lst in enumerate(pixels):
+        cache = _cache_def(plan.years, col_val, plan.yr_dek)
+        for px in y_lst:
+            record = process(px, data=data[:, i, :], row=rows.start + i, param=param, plan=plan, **kwargs)
+            if record.errtyp:
+                logger.debug(f'Error: {_error_decoder(record.errtyp)} in position:{record.position}')
+                errors += 1
+
+            _filler(cache, record)
+        caches.append(cache)
+
+    tile = dict(zip(atoms.PixelRecord.metrics, np.stack([i['metrics'] for i in caches], axis=1)))
+    tile['n_seasons'] = np.stack([i['season'] for i in caches])
+    tile['err'] = np.stack([i['err'] for i in caches])
+    tile['period'] = np.stack([i['period'] for i in caches])
+    tile['valley'] = np.stack([i['valley'] for i in caches])
+    tile['tail'] = np.stack([i['tail'] for i in caches])
+
+    return rows, errors, store.write(rows, tile)
+
+
+def _drain(pending, keep):
+    """Results of the completed tiles until no more than keep are in flight"""
+    while pending.count() > keep:
+        rows, err, stats = next(pending).result()
+        logger.debug(f'Rows {rows.start}:{rows.stop} processed')
+        yield rows, err, stats
+
+
+def analyse_tiles(cube, client, param, action, store):
+    """
+    Analyse the cube tile by tile, the workers write the results to the store and only the
+    completion of the tiles comes back to the driver.
+
+    :param cube: xarray DataArray
+    :param client: dask distributed Client
+    :param param: param object
+    :param action: function to be apply
+    :param store: ZarrContainer object
+    :return: the store
+    """
+    plan = runplan.RunPlan(param)
+    s_param = client.scatter(param, broadcast=True)
+    s_plan = client.scatter(plan, broadcast=True)
+
+    n_rows = len(param.row_val)
+    # tiles in flight, the next ones are read while the workers are busy
+    n_flight = 2 * max(1, len(client.scheduler_info()['workers']))
+
+    pending = as_completed()
+    done, errors = 0, 0
+    block, blk = None, None
+    # rows of the blocks read, a tile is read whole even if it is larger
+    n_block = max(_block_rows(cube, param), store.rows)
+
+    for rows in store.tiles(n_rows):
+        # tiles are taken from blocks read in the same order of the dask chunks
+        if blk is None or rows.stop > blk.stop:
+            blk = next(_row_blocks(cube, param.row_nm, rows.start, n_block))
+            blk = slice(blk.start, max(blk.stop, rows.stop))
+            block = cube.isel(dict([(param.row_nm, blk)])).compute()
+            logger.debug(f'Rows {blk.start}:{blk.stop} loaded')
+
+        tile = block.isel(dict([(param.row_nm, slice(rows.start - blk.start, rows.stop - blk.start))]))
+        pixels = [_pxl_lst(tile.isel(dict([(param.row_nm, i)])), param) for i in range(rows.stop - rows.start)]
+        data = np.ascontiguousarray(tile.transpose(param.dim_nm, param.row_nm, param.col_nm).values)
+
+        pending.add(client.submit(process_tile, data, rows, pixels, store=store, param=s_param, plan=s_plan,
+                                  action=action, pure=False))
+
+        for rows, err, stats in _drain(pending, n_flight):
+            done, errors = done + rows.stop - rows.start, errors + err
+            store.qc.merge(stats)
+            print_progress_bar(done, n_rows)
+
+    for rows, err, stats in _drain(pending, 0):
+        done, errors = done + rows.stop - rows.start, errors + err
+        store.qc.merge(stats)
+        print_progress_bar(done, n_rows)
+
+    if errors:
+        logger.info(f'{errors} pixels in error')
+
+    if param.ovr_scratch or param.cycle_out:
+        _flush(client)
+
+    return store
+
+
+def process_points(data, index, rows, cols, **kwargs):
+    """
+    Process the points of an input chunk
+
+    :param data: raw values of the points (time x points) in their native type
+    :param index: positions of the points in the point list
+    :param rows: rows of the points in the cube
+    :param cols: columns of the points in the cube
+    :param kwargs: **{'action': function to be apply,
+                      'param': param object
+                      'plan': run plan object}
+    :return: list of (position in the point list, PixelRecord)
+    """
+    return [(i, process(j, data=data, row=int(row), col=int(col), **dict(kwargs)))
+            for i, j, row, col in zip(index, range(data.shape[1]), rows, cols)]
+
+
+def analyse_points(cube, client, param, action, located):
+    """
+    Analyse a list of points, the points are grouped by input chunk so that every chunk is read only
+    once and a group is processed by a worker while the next ones are read.
+
+    :param cube: xarray DataArray
+    :param client: dask distributed Client
+    :param param: param object
+    :param action: function to be apply
+    :param located: points located on the grid of the cube (see points.locate)
+    :return: dict of position in the point list: PixelRecord, for the points analysed
+    """
+    import xarray as xr
+
+    plan = runplan.RunPlan(param)
+    s_param = client.scatter(param, broadcast=True)
+    s_plan = client.scatter(plan, broadcast=True)
+
+    groups = points.chunk_groups(cube, param, located)
+    # groups in flight, the next chunks are read while the workers are busy
+    n_flight = 2 * max(1, len(client.scheduler_info()['workers']))
+
+    pending = as_completed()
+    records = {}
+
+    for done, group in enumerate(groups):
+        rows, cols = located['row'].values[group], located['col'].values[group]
+        # pointwise selection, dask reads the chunk once
+        drill = cube.isel({param.row_nm: xr.DataArray(rows, dims='point'),
+                           param.col_nm: xr.DataArray(cols, dims='point')}).compute()
+        valid = _pxl_lst(drill, param)
+
+        if valid.size:
+            data = np.ascontiguousarray(drill.transpose(param.dim_nm, 'point').values[:, valid])
+            pending.add(client.submit(process_points, data, group[valid], rows[valid], cols[valid],
+                                      param=s_param, plan=s_plan, action=action, pure=False))
+
+        records.update(_drain_points(pending, n_flight))
+        print_progress_bar(done + 1, len(groups))
+
+    records.update(_drain_points(pending, 0))
+    logger.info(f'{len(records)} of {len(located)} points analysed')
+
+    if param.ovr_scratch or param.cycle_out:
+        _flush(client)
+
+    return records
+
+
+def _drain_points(pending, keep):
+    """Records of the completed groups of points until no more than keep are in flight"""
+    while pending.count() > keep:
+        for i, record in next(pending).result():
+            if record.errtyp:
+                logger.debug(f'Error: {_error_decoder(record.errtyp)} in position:{record.position}')
+            yield i, record
+
+
+def _flush(client):
+    """Write what is still buffered by the scratch stores and the cycle tables of the workers"""
+    client.run(output.flush)
+    output.flush()
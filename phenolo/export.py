@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+
+import numpy as np
+
+from phenolo import output
+
+logger = logging.getLogger(__name__)
+
+# internal tiles of the GeoTIFFs and rows read at a time
+_BLOCK = 512
+
+
+def export_cogs(pth, folder=None, variables=None, workers=None, crs=None):
+    """
+    Export an output as Cloud Optimized GeoTIFFs, one per variable and year (one per variable without years).
+
+    Files are tiled, deflate compressed and carry internal overviews, they are written in parallel by a pool
+    of processes, each one reading its layer from the output by strips of rows. Sparse outputs are densified.
+
+    :param pth: path of the netCDF output
+    :param folder: destination folder, name of the output + _cog if not provided
+    :param variables: names of the variables to be exported, all the results if not provided
+    :param workers: number of processes, as many as the CPUs if not provided
+    :param crs: spatial reference of the grid, EPSG:4326 for lat/lon grids if not provided
+    :return: list of the paths written
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from netCDF4 import Dataset
+
+    if folder is None:
+        folder = os.path.splitext(pth)[0] + '_cog'
+    os.makedirs(folder, exist_ok=True)
+
+    if variables is None:
+        variables = list(output.OutputCointainer._variables.values())
+
+    layers = []
+    with Dataset(pth, 'r') as root:
+        row_nm, col_nm = _grid_dims(root)
+        if crs is None and row_nm.lower().startswith('lat'):
+            crs = 'EPSG:4326'
+
+        for name in variables:
+            var = root[name]
+            if var.dimensions[-1] not in (row_nm, col_nm, 'pixel'):
+                years = root[var.dimensions[-1]][:].astype(int).tolist()
+                layers += [(name, i, os.path.join(folder, f'{name}_{year}.tif')) for i, year in enumerate(years)]
+            else:
+                layers.append((name, None, os.path.join(folder, f'{name}.tif')))
+
+    logger.info(f'Export of {len(layers)} layers to {folder}')
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        written = list(pool.map(_write_cog, *zip(*[(pth, name, band, dst, crs) for name, band, dst in layers])))
+
+    return written
+
+
+def _grid_dims(root):
+    """Names of the row and column dimensions of an output"""
+    if 'pixel' in root.variables:
+        return root['pixel'].compress.split()
+    return list(root['PixelCriticalError'].dimensions)
+
+
+def _transform(root, row_nm, col_nm):
+    """Affine transform of the pixel corners from the coordinates of the centres"""
+    from affine import Affine
+
+    rows, cols = np.asarray(root[row_nm][:], dtype=float), np.asarray(root[col_nm][:], dtype=float)
+    d_row = rows[1] - rows[0] if rows.size > 1 else -1.0
+    d_col = cols[1] - cols[0] if cols.size > 1 else 1.0
+    # north up, rows are flipped if the coordinate increases
+    return Affine(d_col, 0, cols[0] - d_col / 2, 0, -abs(d_row), rows.max() + abs(d_row) / 2), d_row > 0
+
+
+def _write_cog(pth, name, band, dst, crs):
+    """
+    Write a layer of a variable as COG
+
+    :param pth: path of the netCDF output
+    :param name: name of the variable
+    :param band: index of the year, None for variables without years
+    :param dst: path of the GeoTIFF
+    :param crs: spatial reference
+    :return: dst
+    """
+    import rasterio
+    from rasterio.shutil import copy as rio_copy
+    from rasterio.windows import Window
+    from netCDF4 import Dataset
+
+    tmp = dst + '.tmp.tif'
+    with Dataset(pth, 'r') as root:
+        row_nm, col_nm = _grid_dims(root)
+        height, width = len(root.dimensions[row_nm]), len(root.dimensions[col_nm])
+        transform, flip = _transform(root, row_nm, col_nm)
+
+        var = root[name]
+        # packed values are unpacked to float
+        if 'scale_factor' in var.ncattrs() or 'add_offset' in var.ncattrs() or var.dtype.kind == 'f':
+            dtype, nodata = 'float32', np.nan
+        else:
+            dtype, nodata = var.dtype.name, getattr(var, '_FillValue', None)
+
+        profile = {'driver': 'GTiff', 'width': width, 'height': height, 'count': 1, 'dtype': dtype,
+                   'nodata': nodata, 'crs': crs, 'transform': transform, 'tiled': True,
+                   'blockxsize': _BLOCK, 'blockysize': _BLOCK, 'compress': 'deflate'}
+
+        with rasterio.open(tmp, 'w', **profile) as tif:
+            for start in range(0, height, _BLOCK):
+                rows = slice(start, min(start + _BLOCK, height))
+                values = output.densify(var, rows)
+                if band is not None:
+                    values = values[..., band]
+                values = np.ma.filled(values.astype(dtype), nodata if nodata is not None else 0)
+
+                top = rows.start
+                if flip:
+                    values, top = values[::-1], height - rows.stop
+                tif.write(values, 1, window=Window(0, top, width, rows.stop - rows.start))
+
+    rio_copy(tmp, dst, driver='COG', COMPRESS='DEFLATE', BLOCKSIZE=_BLOCK, OVERVIEWS='AUTO',
+             OVERVIEW_RESAMPLING='NEAREST')
+    os.remove(tmp)
+    logger.debug(f'{dst} written')
+    return dst
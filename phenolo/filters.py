@@ -2,13 +2,18 @@
 
 
 import pandas as pd
+from scipy.ndimage import convolve1d
 from scipy.signal import savgol_filter
 
 
-def sv(pxldrl, param):
+def sv(pxldrl, param, coeffs=None):
     if param.smp != 0:  # TODO Check the smp value meanong
         # Savinsky Golet filter
-        pxldrl.ps = savgol_filter(pxldrl.ts_d, param.medspan, param.smp, mode='nearest')
+        if coeffs is not None:
+            # precomputed coefficients, same convolution done by savgol_filter
+            pxldrl.ps = convolve1d(pxldrl.ts_d.values, coeffs, mode='nearest')
+        else:
+            pxldrl.ps = savgol_filter(pxldrl.ts_d, param.medspan, param.smp, mode='nearest')
         # TODO automatic selection of savgol window
         return pd.Series(pxldrl.ps, pxldrl.ts_d.index)
     else:
@@ -2,6 +2,7 @@
 
 import logging
 import sys
+from datetime import timedelta
 
 import numpy as np
 import pandas as pd
@@ -23,28 +24,6 @@ def rescale(ts,  **kwargs):
         sys.exit()
 
 
-def offset(ts,  **kwargs):
-    # add the offset
-    param = kwargs.pop('param',  '')
-    try:
-        return ts - param.offset
-    except (RuntimeError,  Exception,  ValueError):
-        print('Error in rescaling,  in position')
-        logger.debug('Error in rescaling')
-        sys.exit()
-
-
-def scale(ts,  **kwargs):
-    # scale according to the metadata
-    param = kwargs.pop('param',  '')
-    try:
-        return ts * param.scale
-    except (RuntimeError,  Exception,  ValueError):
-        print('Error in rescaling,  in position')
-        logger.debug('Error in rescaling')
-        sys.exit()
-
-
 def to_timeseries(values,  index):
     if len(values) != len(index):
         logger.debug('Lenght of the time series is different than the index provided')
@@ -53,19 +32,20 @@ def to_timeseries(values,  index):
     return pd.Series(values,  index=index)
 
 
-def valley_detection(pxldrl,  param):
+def valley_detection(pxldrl,  param,  mpd_val=None):
     # Valley detection
     # Detrending to catch better points
 
     vtrend = pd.Series(pxldrl.trend_d,  index=pxldrl.ps.index)
     vdetr = pxldrl.ps - vtrend
 
-    if 200.0 < pxldrl.season_lng < 400.0:
-        mpd_val = int(pxldrl.season_lng * 2 / 3)
-    elif pxldrl.season_lng < 200:
-        mpd_val = int(pxldrl.season_lng * 1 / 3)
-    else:
-        mpd_val = int(pxldrl.season_lng * (param.tr - param.tr * 1 / 3) / 100)
+    if mpd_val is None:
+        if 200.0 < pxldrl.season_lng < 400.0:
+            mpd_val = int(pxldrl.season_lng * 2 / 3)
+        elif pxldrl.season_lng < 200:
+            mpd_val = int(pxldrl.season_lng * 1 / 3)
+        else:
+            mpd_val = int(pxldrl.season_lng * (param.tr - param.tr * 1 / 3) / 100)
 
     ind = peaks.detect_peaks(vdetr,  mph=vdetr.mean(), 
                              mpd=mpd_val, 
@@ -81,11 +61,12 @@ def valley_detection(pxldrl,  param):
     return pks
 
 
-def cycle_metrics(pxldrl):
+def cycle_metrics(pxldrl,  posix=None):
     """
     Create an array of cycles with all the attributes populated
 
     :param pxldrl: a pixel drill object
+    :param posix: POSIX seconds of the smoothed time series index,  calculated per cycle if not provided
     :return: an array of single cycles
     """
 
@@ -95,7 +76,7 @@ def cycle_metrics(pxldrl):
     for i in range(len(pxldrl.pks) - 1):
 
         # Minimum minimum time series
-        sincy = atoms.SingularCycle(pxldrl.ps,  pxldrl.pks.index[i],  pxldrl.pks.index[i + 1])
+        sincy = atoms.SingularCycle(pxldrl.ps,  pxldrl.pks.index[i],  pxldrl.pks.index[i + 1],  posix=posix)
 
         # avoid unusual results
         if sincy.ref_yr not in range(pxldrl.pks.index[i].year - 1,  pxldrl.pks.index[i + 1].year + 1):
@@ -320,16 +301,66 @@ def __mas(tsl,  mavmet,  sdd):
     # TODO to be reviewed
 
 
+def __numeric(value):
+    """
+    Convert a cycle attribute to a plain number
+
+    :param value: attribute as scalar,  one element index or time delta
+    :return: number,  time deltas are expressed in days
+    """
+    if isinstance(value,  (pd.Index,  np.ndarray)):
+        value = value[0] if len(value) else np.NaN
+    if isinstance(value,  (pd.Timedelta,  timedelta,  np.timedelta64)):
+        return pd.Timedelta(value).days
+    if value is None:
+        return np.NaN
+    return value
+
+
+# per cycle attributes of the cycle table,  dates are expressed in days since 1970-01-01
+CYCLE_COLUMNS = ('sd',  'ed',  'sbd',  'sed',  'max_idx',  'sb',  'se',  'sl',  'spi',  'si',  'cf',  'afi',  'sslp',  'mas',
+                 'warn',  'ref_yr')
+
+
+def cycle_table(pxldrl):
+    """
+    Per cycle attributes of a pixel drill
+
+    :param pxldrl: processed pixel drill
+    :return: dict of column: float64 array with a value per cycle in pxldrl.phen
+    """
+    table = {name: np.full(len(pxldrl.phen),  np.NaN) for name in CYCLE_COLUMNS}
+    for i,  phency in enumerate(pxldrl.phen):
+        for name in CYCLE_COLUMNS:
+            table[name][i] = __cycle_value(phency,  name)
+    return table
+
+
+def __cycle_value(phency,  name):
+    """Cycle attribute as float,  dates in days since 1970-01-01"""
+    value = getattr(phency,  name,  None)
+    if name in ('sbd',  'sed') and value is not None:
+        value = value.index
+    if isinstance(value,  (pd.Index,  np.ndarray)):
+        value = value[0] if len(value) else None
+    if isinstance(value,  (pd.Timestamp,  np.datetime64)):
+        return (pd.Timestamp(value) - pd.Timestamp(0)) / pd.Timedelta(1,  unit='D')
+    try:
+        return float(__numeric(value))
+    except (TypeError,  ValueError):
+        return np.NaN
+
+
 def attribute_extractor(pxldrl,  attribute):
     try:
         values = list(
             map(lambda phency:
                 {'index': phency.ref_yr.values[0], 
-                 'value': getattr(phency,  attribute)},  pxldrl.phen))
+                 'value': __numeric(getattr(phency,  attribute))},  pxldrl.phen))
         if len(values) == 0:
             raise Exception
 
-        return pd.DataFrame(values).groupby('index').sum(numeric_only=True).squeeze()
+        return pd.DataFrame(values).groupby('index').sum(numeric_only=True)['value']
 
     except (RuntimeError,  Exception):
         raise RuntimeError('Impossible to extract the attribute requested')
@@ -340,10 +371,10 @@ def attribute_extractor_se(pxldrl,  attribute):
         values = list(
             map(lambda phency:
                 {'index': phency.ref_yr.values[0], 
-                 'value': getattr(phency,  attribute)},  pxldrl.phen))
+                 'value': __numeric(getattr(phency,  attribute))},  pxldrl.phen))
         if not values:
             raise Exception
-        return pd.DataFrame(values).groupby('index').min(numeric_only=True).squeeze()
+        return pd.DataFrame(values).groupby('index').min(numeric_only=True)['value']
 
     except (RuntimeError,  Exception):
         raise RuntimeError('Impossible to extract the attribute requested')
@@ -1,35 +1,152 @@
 # -*- coding: utf-8 -*-
 
+import warnings
 
-def climate_fx(ts, **kwargs):
-    singleinterp = True
+import numpy as np
+import pandas as pd
+
+
+class ClimateAxis(object):
+    """
+    Climatological slots of a time axis.
+
+    Every observation is mapped once to its year and to its (month, day) slot so that
+    the climatology of a whole block of pixels can be computed over a (pixels x years x slots) cube.
+    """
+
+    def __init__(self, index):
+        index = pd.DatetimeIndex(index)
+
+        slots, self.slot = np.unique(index.month * 100 + index.day, return_inverse=True)
+        self.year = np.asarray(index.year - index.year.min())
+        self.n_slots = slots.size
+        self.n_years = int(self.year.max()) + 1
+
+        # slots are sorted by month, so months and quarters are contiguous groups of slots
+        months = slots // 100
+        quarters = (months - 1) // 3 + 1
+        self.mth_starts, self.mth_grp = self.__groups(months)
+        self.qrt_starts, self.qrt_grp = self.__groups(quarters)
+
+    @staticmethod
+    def __groups(keys):
+        values, starts, grp = np.unique(keys, return_index=True, return_inverse=True)
+        return starts, grp
+
+
+class RawDecoder(object):
+    """
+    Decode descriptor of the raw input values.
+
+    Pixels travel in their native (integer) type, they are decoded only inside the preprocessing
+    kernels: to float32 for integer values (exact), in their own type for float values. Scale and
+    offset are applied last, in double precision.
+
+    Attributes:
+        scale: scale factor of the values, None if not used
+        offset: offset of the values (subtracted after the scaling), None if not used
+        valid_max: values above are no data codes (SPOT, fixed)
+        snow: code of snow, filled as 0 by climate_fill
+        codes: no data codes (mask, cloud, sea)
+
+    :param param: ProjectParameters object
+    """
+
+    # SPOT codes are above 250 whatever the range of the values (rng) used for the rescaling
+    valid_max = 250
 
-    tsm = ts.mask(ts > 250)
+    def __init__(self, param=None):
+        self.scale = getattr(param, 'scale', None)
+        self.offset = getattr(param, 'offset', None)
+
+        snow = getattr(param, 'snow', None)
+        self.snow = 253 if snow is None else snow
+
+        codes = list(getattr(param, 'mask', None) or [])
+        codes += [i for i in (getattr(param, 'cloud', None), getattr(param, 'sea', None)) if i is not None]
+        self.codes = np.unique(np.asarray(codes, dtype=float))
+
+    @staticmethod
+    def dtype(raw):
+        """Type of the decoded values"""
+        return raw.dtype if raw.dtype.kind == 'f' else np.dtype(np.float32)
+
+    def decode(self, raw):
+        """Physical values, no data codes as nan"""
+        raw = np.asarray(raw)
+        data = raw.astype(self.dtype(raw))
+        if self.codes.size:
+            data[np.isin(raw, self.codes)] = np.nan
+        return self.physical(data)
+
+    def physical(self, data):
+        """Decoded values scaled and shifted, as they are if neither scale nor offset is set"""
+        if self.scale is None and self.offset is None:
+            return data
+
+        data = np.asarray(data, dtype=np.float64)
+        if self.scale is not None:
+            data = data * self.scale
+        if self.offset is not None:
+            data = data - self.offset
+        return data
+
+
+def climate_fill(data, axis, decoder=None):
+    """
+    Fill the gaps of a block of pixels with their climatology.
+
+    :param data: 2D array (pixels x time) of raw values, in their native type
+    :param axis: ClimateAxis of the time dimension
+    :param decoder: RawDecoder of the values, SPOT codes if not provided
+    :return: 2D array (pixels x time) of physical values without gaps, float32 for integer values,
+             double if scaled or shifted
+    """
+    if decoder is None:
+        decoder = RawDecoder()
+
+    data = np.asarray(data)
+    tsm = data.astype(decoder.dtype(data))
+    tsm[data > decoder.valid_max] = np.nan
 
     # interpolate single values
-    if singleinterp:
-        ts_s = tsm.where(~(tsm.shift(-1).notnull() & tsm.shift(1).notnull()), tsm.interpolate(method='linear'))
-    else:
-        ts_s = tsm
+    prv, cur, nxt = tsm[:, :-2], tsm[:, 1:-1], tsm[:, 2:]
+    single = np.isnan(cur) & ~np.isnan(prv) & ~np.isnan(nxt)
+    cur[single] = ((prv + nxt) / 2)[single]
+
+    tsm[data == decoder.snow] = 0
 
-    tsm = ts_s.mask(ts == 253, 0)
+    if not np.isnan(tsm).any():
+        return decoder.physical(tsm)
 
-    if ts_s.isnull().sum():
-        # Rough climatic indices without nan included
-        count = tsm.groupby([ts.index.month, ts.index.day]).count()
-        cl = tsm.groupby([ts.index.month, ts.index.day]).median()
-        clm = cl.mask(count < count.max() * 0.2)
+    # Rough climatic indices without nan included
+    cube = np.full((tsm.shape[0], axis.n_years, axis.n_slots), np.nan, dtype=tsm.dtype)
+    cube[:, axis.year, axis.slot] = tsm
 
-        if clm.isnull().sum():
-            clm = clm.mask(clm.isnull(), tsm.groupby([ts.index.month]).min())
-        if clm.isnull().sum():
-            clm = clm.mask(clm.isnull(), tsm.groupby([ts.index.quarter]).min())
-        if clm.isnull().sum():
-            clm = clm.mask(clm.isnull(), tsm.min())
+    count = np.count_nonzero(~np.isnan(cube), axis=1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        clm = np.nanmedian(cube, axis=1)
+    clm[count < count.max(axis=1, keepdims=True) * 0.2] = np.nan
 
-        nans = ts.where(tsm.isnull()).dropna()
+    # fallback on the monthly, quarterly and overall minimum
+    slot_min = np.fmin.reduce(cube, axis=1)
+    for starts, grp in ((axis.mth_starts, axis.mth_grp), (axis.qrt_starts, axis.qrt_grp)):
+        if not np.isnan(clm).any():
+            break
+        clm = np.where(np.isnan(clm), np.fmin.reduceat(slot_min, starts, axis=1)[:, grp], clm)
+    if np.isnan(clm).any():
+        clm = np.where(np.isnan(clm), np.fmin.reduce(slot_min, axis=1)[:, np.newaxis], clm)
 
-        for ith in nans.index:
-            tsm.loc[ith] = clm.loc[ith.month, ith.day]
+    return decoder.physical(np.where(np.isnan(tsm), clm[:, axis.slot], tsm))
+
+
+def climate_fx(ts, **kwargs):
+    axis = kwargs.pop('axis', None)
+    decoder = kwargs.pop('decoder', None)
+    if axis is None:
+        axis = ClimateAxis(ts.index)
 
-    return tsm
+    # float32 is exact for the integer values, the single pixel pipeline goes on in double precision
+    return pd.Series(climate_fill(ts.values[np.newaxis, :], axis, decoder)[0], index=ts.index, name=ts.name,
+                     dtype=float)
@@ -2,6 +2,7 @@
 
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import as_strided
 
 """
 Based on:
@@ -18,35 +19,144 @@ Journal of the American Statistical Association, December 1993, pp. 1273-1283.
 """
 
 
-def mad_segments(x):
-    m = np.nanmedian(x)  # calculate the median inside the window
+def _nanmedian(x):
+    """
+    Median along the last axis ignoring NaN.
+
+    Complete rows are reduced with np.partition, rows with gaps with a single sort
+    where NaN are pushed at the end of the row.
+    """
+    n_val = np.count_nonzero(~np.isnan(x), axis=-1)
+    n = x.shape[-1]
+
+    if n == 0:
+        return np.full(x.shape[:-1], np.nan)
+
+    if (n_val == n).all():
+        part = np.partition(x, [(n - 1) // 2, n // 2], axis=-1)
+        return (part[..., (n - 1) // 2] + part[..., n // 2]) / 2
+
+    srt = np.sort(x, axis=-1)
+    lo = np.take_along_axis(srt, np.maximum((n_val - 1) // 2, 0)[..., np.newaxis], axis=-1)
+    hi = np.take_along_axis(srt, np.minimum(n_val // 2, n - 1)[..., np.newaxis], axis=-1)
+    return ((lo + hi) / 2)[..., 0]
+
+
+def mad_segments(x, m=None):
+    x = np.asarray(x, dtype=float)
+
+    if m is None:
+        m = _nanmedian(x)[..., np.newaxis]  # calculate the median inside the window
     abs_dev = np.abs(x - m)  # absolute deviation
 
-    lower = np.nanmedian(np.where(np.less_equal(x, m), abs_dev, np.NaN))  # median of the lower part
-    higher = np.nanmedian(np.where(np.greater_equal(x, m), abs_dev, np.NaN))  # median of the higher part
+    lower = _nanmedian(np.where(np.less_equal(x, m), abs_dev, np.nan))  # median of the lower part
+    higher = _nanmedian(np.where(np.greater_equal(x, m), abs_dev, np.nan))  # median of the higher part
 
     return lower, higher
 
 
+def _mad_filter(x, median, lower, higher, mad_pwr):
+    madMap = np.where(x < median, lower, higher)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        MAD = np.divide(np.abs(np.subtract(x, median)), madMap)
+
+    MAD_cld = np.where(x == median, 0, MAD)
+
+    fx = np.where(MAD_cld >= mad_pwr, np.nan, x)
+
+    # values with a null median are left untouched
+    return np.where(median == 0, x, fx)
+
+
 def dblMAD(x, mad_pwr=2.575):
-    median = np.median(x)
+    """
+    Double MAD outlier filter along the last axis.
 
-    lower, higher = mad_segments(x)
+    :param x: 1D array (time) or 2D array (pixels x time)
+    :param mad_pwr: threshold over which a value is considered an outlier
+    :return: array shaped as x with the outliers replaced by NaN
+    """
+    x = np.asarray(x, dtype=float)
 
-    madMap = np.where(x < median, lower, higher)
+    median = _nanmedian(x)[..., np.newaxis]
 
-    MAD = np.divide(np.abs(np.subtract(x, median)), madMap)
+    lower, higher = mad_segments(x, median)
 
-    MAD_cld = np.where(x == median, 0, MAD)
+    return _mad_filter(x, median, lower[..., np.newaxis], higher[..., np.newaxis], mad_pwr)
+
+
+def _sliding_windows(x, window):
+    """Read only strided view (..., n - window + 1, window) over the last axis"""
+    shape = x.shape[:-1] + (x.shape[-1] - window + 1, window)
+    strides = x.strides + (x.strides[-1],)
+    return as_strided(x, shape=shape, strides=strides, writeable=False)
+
+
+def _window_mad(win):
+    """
+    Median, lower and higher MAD of every window with a single sort.
+
+    Once a window is sorted the values below and above its median are a prefix and a suffix
+    of the sorted window, so the three medians are read by position.
+    """
+    srt = np.sort(win, axis=-1)
+    last = srt.shape[-1] - 1
+    n = np.count_nonzero(~np.isnan(srt), axis=-1)
+
+    def pick(start, length):
+        lo = np.take_along_axis(srt, np.clip(start + (length - 1) // 2, 0, last)[..., np.newaxis], axis=-1)
+        hi = np.take_along_axis(srt, np.clip(start + length // 2, 0, last)[..., np.newaxis], axis=-1)
+        return ((lo + hi) / 2)[..., 0]
+
+    m = pick(0, n)
+    n_lower = np.count_nonzero(srt <= m[..., np.newaxis], axis=-1)
+    n_below = np.count_nonzero(srt < m[..., np.newaxis], axis=-1)
+
+    lower = m - pick(0, n_lower)
+    higher = pick(n_below, n - n_below) - m
+
+    return m, lower, higher
+
+
+def dblMAD_local(x, mad_pwr=2.575, window=None):
+    """
+    Double MAD outlier filter computed over a window sliding along the last axis.
+
+    Each value is compared with the median and the MADs of the window centred on it, windows are
+    kept inside the series so the first and last values share the first and last window.
+
+    :param x: 1D array (time) or 2D array (pixels x time)
+    :param mad_pwr: threshold over which a value is considered an outlier
+    :param window: window length in number of observations, None or longer than the series for the global filter
+    :return: array shaped as x with the outliers replaced by NaN
+    """
+    x = np.ascontiguousarray(x, dtype=float)
+    n = x.shape[-1]
+
+    if not window or window >= n:
+        return dblMAD(x, mad_pwr)
+
+    window = int(window) // 2 * 2 + 1
+    start = np.clip(np.arange(n) - window // 2, 0, n - window)
+
+    if x.ndim == 1:
+        m, lower, higher = _window_mad(_sliding_windows(x, window))
+        return _mad_filter(x, m[start], lower[start], higher[start], mad_pwr)
 
-    fx = np.where(MAD_cld >= mad_pwr, np.NaN, x)
+    # bound the memory of the sorted windows
+    fx = np.empty_like(x)
+    step = max(1, 2 ** 22 // (n * window))
+    for i in range(0, x.shape[0], step):
+        m, lower, higher = _window_mad(_sliding_windows(x[i:i + step], window))
+        fx[i:i + step] = _mad_filter(x[i:i + step], m[:, start], lower[:, start], higher[:, start], mad_pwr)
 
     return fx
 
 
-def doubleMAD(ts, mad_pwr=2.575):
+def doubleMAD(ts, mad_pwr=2.575, window=None):
     if ts.median() == 0:
         return ts
     else:
-        r = dblMAD(ts.values, mad_pwr)
+        r = dblMAD_local(ts.values, mad_pwr, window)
         return pd.Series(r, ts.index)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import logging
 import os
 from datetime import datetime
 
@@ -7,6 +8,13 @@ import numpy as np
 import pandas as pd
 from netCDF4 import Dataset, date2num
 
+from phenolo import atoms, cycles, parts, qc, scratch
+
+logger = logging.getLogger(__name__)
+
+# size cap of an output chunk
+_CHUNK_BYTES = 2 ** 20
+
 
 def create(path, orig_ds, yrs_in):
     """
@@ -125,12 +133,61 @@ class OutputCointainer(object):
     """
     Create a netCDF file to be used as memory dump for the pixeldrill analysis.
 
+    The per pixel state needed by an incremental update (season period, restart valley and smoothed tail
+    before it, see analysis.restart) is kept in the "state" group of the file, with the last observation of
+    the run (obs_end).
+
+    Variables are stored with the compact encodings below, each one can be changed in the [OUTPUT_ENCODING]
+    section of the settings. Chunks hold whole rows (the block written by the executor) up to _CHUNK_BYTES.
+
+    In sparse mode only the pixels with results are stored, along a "pixel" dimension whose coordinate holds
+    their position row * columns + col (CF compression by gathering), see densify.
+
+    QC statistics of the results are kept while the tiles are written and saved next to the file
+    (name + _qc.json) on closing, see qc.QCStats.
+
     :param param: configuration parameters object
-    :param kwargs: name of the object
+    :param kwargs: name of the object,
+                   update: open the output of a previous run on the same grid and years to update it
     """
 
+    _variables = {'sb': 'StartWeek', 'se': 'EndWeek', 'sl': 'SeasonLenght', 'spi': 'SeasonPermanentIntegral',
+                  'si': 'SeasonIntegral', 'cf': 'CycleFraction', 'afi': 'ActiveFractionIntegral',
+                  'warn': 'CycleWarning', 'n_seasons': 'NumberOfSeasons', 'err': 'PixelCriticalError'}
+
+    # days and counts fit in int16, the integrals are kept with two decimals
+    _encodings = {'StartWeek': {'dtype': 'i2', 'fill_value': -32767},
+                  'EndWeek': {'dtype': 'i2', 'fill_value': -32767},
+                  'SeasonLenght': {'dtype': 'i2', 'fill_value': -32767},
+                  'SeasonPermanentIntegral': {'dtype': 'f4', 'fill_value': np.nan, 'least_significant_digit': 2},
+                  'SeasonIntegral': {'dtype': 'f4', 'fill_value': np.nan, 'least_significant_digit': 2},
+                  'CycleFraction': {'dtype': 'f4', 'fill_value': np.nan, 'least_significant_digit': 2},
+                  'ActiveFractionIntegral': {'dtype': 'f4', 'fill_value': np.nan, 'least_significant_digit': 2},
+                  'CycleWarning': {'dtype': 'i2', 'fill_value': -32767},
+                  'NumberOfSeasons': {'dtype': 'i2', 'fill_value': -32767},
+                  'PixelCriticalError': {'dtype': 'i2', 'fill_value': -32767}}
+
     def __init__(self, cube, param, **kwargs):
         pth = os.path.join(param.outFilePth, '.'.join((kwargs.pop('name', ''), 'nc')))
+        self.path = pth
+        self.param = param
+        self.qc = qc.QCStats(self._yrs_reducer(param.dim_val), self._variables)
+
+        self.sparse = getattr(param, 'out_sparse', False)
+        self.update = kwargs.pop('update', False) and self._resumable(pth, param)
+        if self.update:
+            self.sparse = False
+            logger.info(f'Incremental update of {pth}')
+            self.root = Dataset(pth, 'a')
+            for attr, name in self._variables.items():
+                setattr(self, attr, self.root.variables[name])
+            self.state = self.root.groups['state']
+            self.period = self.state.variables['Period']
+            self.valley = self.state.variables['RestartValley']
+            self.tail = self.state.variables['Tail']
+            self.state.obs_end = str(pd.DatetimeIndex(param.dim_val).max())
+            return
+
         self.root = Dataset(pth, 'w', format='NETCDF4')
 
         row = self.root.createDimension(param.row_nm, len(param.row_val))
@@ -141,68 +198,389 @@ class OutputCointainer(object):
         self.col_v = self.root.createVariable(param.col_nm, 'f8', (param.col_nm,))
         self.dim_v = self.root.createVariable(param.dim_nm, 'f8', (param.dim_nm,))
 
-        self.sb = self.root.createVariable('StartWeek', 'f8', (param.row_nm, param.col_nm, param.dim_nm), zlib=True, complevel=4)
-        self.se = self.root.createVariable('EndWeek', 'f8', (param.row_nm, param.col_nm, param.dim_nm), zlib=True, complevel=4)
-
-        self.sl = self.root.createVariable('SeasonLenght', 'i8', (param.row_nm, param.col_nm, param.dim_nm), zlib=True, complevel=4)
-        self.spi = self.root.createVariable('SeasonPermanentIntegral', 'f8', (param.row_nm, param.col_nm, param.dim_nm), zlib=True, complevel=4)
-        self.si = self.root.createVariable('SeasonIntegral', 'f8', (param.row_nm, param.col_nm, param.dim_nm), zlib=True, complevel=4)
-        self.cf = self.root.createVariable('CycleFraction', 'f8', (param.row_nm, param.col_nm, param.dim_nm), zlib=True, complevel=4)
-        self.afi = self.root.createVariable('ActiveFractionIntegral', 'f8', (param.row_nm, param.col_nm, param.dim_nm), zlib=True, complevel=4)
-
-        self.warn = self.root.createVariable('CycleWarning', 'f8', (param.row_nm, param.col_nm, param.dim_nm), zlib=True, complevel=4)
+        dims = (param.row_nm, param.col_nm, param.dim_nm)
+        if self.sparse:
+            self.root.createDimension('pixel', None)
+            self.pixel = self.root.createVariable('pixel', 'i8', ('pixel',), zlib=True, chunksizes=(_CHUNK_BYTES // 8,))
+            self.pixel.compress = f'{param.row_nm} {param.col_nm}'
+            dims = ('pixel', param.dim_nm)
 
-        self.n_seasons = self.root.createVariable('NumberOfSeasons', 'i8', (param.row_nm, param.col_nm), zlib=True, complevel=4)
-        self.err = self.root.createVariable('PixelCriticalError', 'i8', (param.row_nm, param.col_nm), zlib=True, complevel=4)
+        for attr, name in self._variables.items():
+            ndim = len(dims) if attr in atoms.PixelRecord.metrics else len(dims) - 1
+            setattr(self, attr, self._variable(name, dims[:ndim], param))
 
         self.row_v[:] = param.row_val
         self.col_v[:] = param.col_val
         self.dim_v[:] = pd.to_datetime(param.dim_val).year.unique().tolist()
         # ^^^ pd.to_datetime(pd.to_datetime(param.dim_val).year.unique(), format='%Y') ^^^
 
+        # state of the pixels for the incremental updates
+        self.state = self.root.createGroup('state')
+        self.state.obs_end = str(pd.DatetimeIndex(param.dim_val).max())
+        self.state.createDimension('tail', param.yr_dek)
+        dims = ('pixel',) if self.sparse else (param.row_nm, param.col_nm)
+        self.period = self.state.createVariable('Period', 'i4', dims, zlib=True, fill_value=0)
+        self.valley = self.state.createVariable('RestartValley', 'f8', dims, zlib=True, fill_value=np.nan)
+        self.valley.units = 'days since 1970-01-01'
+        self.tail = self.state.createVariable('Tail', 'f4', dims + ('tail',), zlib=True, fill_value=np.nan)
+
+    def _variable(self, name, dims, param):
+        """Create a variable with its encoding"""
+        dtype, packing, encoding = _encoding(name, param)
+
+        var = self.root.createVariable(name, dtype, dims, zlib=True, complevel=getattr(param, 'out_complevel', 4),
+                                       shuffle=getattr(param, 'out_shuffle', True),
+                                       chunksizes=self._chunks(dims, dtype, getattr(param, 'out_chunk_rows', 1)),
+                                       **encoding)
+        # values are packed by netCDF4 on writing
+        for key, value in packing.items():
+            var.setncattr(key, value)
+        return var
+
+    def _chunks(self, dims, dtype, rows):
+        """Whole rows of the output, columns are split if a chunk exceeds _CHUNK_BYTES"""
+        sizes = [len(self.root.dimensions[i]) for i in dims]
+        if dims[0] == 'pixel':
+            pixel_bytes = np.dtype(dtype).itemsize * int(np.prod(sizes[1:]))
+            return [max(1, _CHUNK_BYTES // pixel_bytes)] + sizes[1:]
+
+        rows = max(1, min(rows, sizes[0]))
+        col_bytes = np.dtype(dtype).itemsize * int(np.prod(sizes[2:]))
+        cols = max(1, min(sizes[1], _CHUNK_BYTES // (rows * col_bytes)))
+        return [rows, cols] + sizes[2:]
+
+    def fill(self, rows, tile):
+        """
+        Write a tile of results
+
+        :param rows: slice of the rows
+        :param tile: dict of attribute: values (rows x cols [x years]), nan if missing
+        """
+        self.qc.update(tile, _valid(tile))
+        if self.sparse:
+            return self.__gather(rows, tile)
+
+        for attr, values in tile.items():
+            var = getattr(self, attr)
+            var[rows] = np.nan_to_num(values) if attr == 'sl' else np.ma.masked_invalid(values)
+
+    def __gather(self, rows, tile):
+        """Append the pixels of a tile with results"""
+        n_cols = len(self.root.dimensions[self.pixel.compress.split()[1]])
+        idx_row, idx_col = np.nonzero(_valid(tile))
+        if not idx_row.size:
+            return
+
+        start = len(self.root.dimensions['pixel'])
+        sel = slice(start, start + idx_row.size)
+        self.pixel[sel] = (rows.start + idx_row) * n_cols + idx_col
+        for attr, values in tile.items():
+            values = np.asarray(values)[idx_row, idx_col]
+            getattr(self, attr)[sel] = np.nan_to_num(values) if attr == 'sl' else np.ma.masked_invalid(values)
+
+    @staticmethod
+    def _resumable(pth, param):
+        """The output of a previous run has the state, the grid and the years of this run, the input extends it"""
+        if not os.path.isfile(pth):
+            return False
+        years = OutputCointainer._yrs_reducer(param.dim_val).values
+        obs_end = pd.DatetimeIndex(param.dim_val).max()
+        try:
+            with Dataset(pth, 'r') as root:
+                same = ('state' in root.groups and 'pixel' not in root.dimensions and
+                        root.dimensions[param.row_nm].size == len(param.row_val) and
+                        root.dimensions[param.col_nm].size == len(param.col_val) and
+                        root['state'].dimensions['tail'].size == param.yr_dek)
+                stored = np.asarray(root.variables[param.dim_nm][:]).astype(int)
+                stored_end = pd.Timestamp(root['state'].obs_end)
+        except (OSError, KeyError, AttributeError):
+            same, stored, stored_end = False, None, None
+
+        if not same:
+            logger.info(f'{pth} can not be updated (grid or state changed), full run')
+        elif obs_end < stored_end:
+            logger.info(f'{pth} can not be updated, the input ends before its last observation ({stored_end}), '
+                        f'full run')
+            same = False
+        elif not np.array_equal(stored, years):
+            # the years of an output are fixed at its creation
+            new = sorted(set(years.tolist()) - set(stored.tolist()))
+            if new:
+                logger.info(f'{pth} can not be updated, the input has years not in the output '
+                            f'({", ".join(str(i) for i in new)}), full run')
+            else:
+                logger.info(f'{pth} can not be updated (years changed), full run')
+            same = False
+        elif obs_end == stored_end:
+            logger.info(f'No observation after {stored_end} in the input, the trailing windows are processed again')
+        return same
+
+    def windows(self, row, yr_dys):
+        """
+        Trailing windows of the pixels of a row to be processed again in an incremental update
+
+        :param row: row of the pixels
+        :param yr_dys: days per observation
+        :return: list per column of windows as by window, None if the pixel must be fully processed
+        """
+        if not self.update:
+            return [None] * self.period.shape[1]
+
+        periods = np.ma.filled(self.period[row, :], 0)
+        valleys = np.ma.filled(self.valley[row, :], np.nan)
+        tails = np.ma.filled(self.tail[row, :, :].astype(np.float32), np.nan)
+        return [window(period, valley, tail, yr_dys, self.param)
+                for period, valley, tail in zip(periods, valleys, tails)]
+
     @staticmethod
     def _yrs_reducer(dim_val):
         return pd.DatetimeIndex(dim_val).year.unique()
 
     def close(self):
         self.root.close()
+        self.qc.write(os.path.splitext(self.path)[0] + '_qc.json')
+
+
+def window(period, valley, tail, yr_dys, param):
+    """
+    Trailing window of a pixel to be processed again in an incremental update
+
+    The cycles are analysed again from the restart valley, the years after the one of the valley are computed
+    again. Observations are processed from span days before the valley (the smoothing and the outlier windows,
+    so that the smoothed series is warmed up at the valley), the series before it is the stored tail.
+
+    :param period: season period in samples as stored in the state
+    :param valley: restart valley in days since 1970-01-01 as stored in the state
+    :param tail: smoothed series before the restart valley as stored in the state
+    :param yr_dys: days per observation
+    :param param: configuration parameters object
+    :return: dict {'start': restart valley, 'span', 'period', 'tail', 'since': first year computed},
+             None if the pixel must be fully processed
+    """
+    if period <= 0 or not np.isfinite(valley):
+        return None
+
+    start = pd.Timestamp(0) + pd.Timedelta(int(round(valley)), unit='D')
+    span = param.medspan + (param.mad_wnd or 0) * yr_dys / 2
+    return {'start': start, 'span': span, 'period': int(period), 'tail': tail, 'since': start.year + 1}
+
+
+def _valid(tile):
+    """Pixels of a tile with results (analysed or in error)"""
+    return (np.nan_to_num(tile['n_seasons']) > 0) | (np.nan_to_num(tile['err']) > 0) | \
+        np.isfinite(np.asarray(tile['sb'], dtype=float)).any(axis=-1)
+
+
+def densify(var, rows=slice(None)):
+    """
+    Values of an output variable on the (row, col) grid, dense variables are read as they are
+
+    :param var: netCDF4 variable of an output, sparse (pixel dimension) or dense
+    :param rows: slice of the rows to be read
+    :return: masked array (rows x cols [x years]), pixels not stored are masked
+    """
+    if 'pixel' not in var.dimensions:
+        return var[rows]
+
+    root = var.group()
+    while root.parent is not None:
+        root = root.parent
+    row_nm, col_nm = root['pixel'].compress.split()
+    n_rows, n_cols = len(root.dimensions[row_nm]), len(root.dimensions[col_nm])
+    rows = range(n_rows)[rows]
+
+    pixel = root['pixel'][:]
+    pixel_row = pixel // n_cols
+    sel = np.nonzero((pixel_row >= rows.start) & (pixel_row < rows.stop))[0]
+
+    dense = np.ma.masked_all((len(rows), n_cols) + var.shape[1:], dtype=var.dtype)
+    if var.name == OutputCointainer._variables['sl']:
+        # season lengths have no missing values in the dense layout (see fill)
+        dense[:] = 0
+    if sel.size:
+        dense[pixel_row[sel] - rows.start, pixel[sel] % n_cols] = var[sel.min():sel.max() + 1][sel - sel.min()]
+    return dense
+
+
+def _encoding(name, param):
+    """
+    Encoding of an output variable, the settings override the defaults (all of them if dtype is set)
+
+    :param name: name of the variable
+    :param param: configuration parameters object
+    :return: (dtype, packing attributes, other keywords of the variable)
+    """
+    custom = getattr(param, 'out_encoding', {}).get(name.lower(), {})
+    encoding = dict(custom) if 'dtype' in custom else dict(OutputCointainer._encodings.get(name, {}), **custom)
+
+    dtype = encoding.pop('dtype', 'f8')
+    packing = {i: encoding.pop(i) for i in ('scale_factor', 'add_offset') if i in encoding}
+    return dtype, packing, encoding
+
+
+class ZarrContainer(object):
+    """
+    Zarr store of the results written directly by the workers.
+
+    Chunks are tiles of whole rows and every tile is written by the task that computed it, so two workers
+    never write the same chunk and the driver only tracks the completed tiles. Variables, dimensions and
+    encodings are the ones of OutputCointainer, the store can be converted to netCDF with to_netcdf.
+    The object shipped to the workers holds only the path of the store, the QC statistics of the tiles
+    come back from write and are merged on the driver.
+
+    :param param: configuration parameters object
+    :param kwargs: name of the object
+    """
+
+    # results and state of the pixels (as in the state group of OutputCointainer)
+    _variables = dict(OutputCointainer._variables, period='Period', valley='RestartValley', tail='Tail')
+    _state = {'Period': {'dtype': 'i4', 'fill_value': 0}, 'RestartValley': {'dtype': 'f8', 'fill_value': np.nan},
+              'Tail': {'dtype': 'f4', 'fill_value': np.nan}}
+
+    def __init__(self, cube, param, **kwargs):
+        import zarr
+        from numcodecs import Blosc, Quantize
+
+        self.path = os.path.join(param.outFilePth, '.'.join((kwargs.pop('name', ''), 'zarr')))
+        self.rows = max(1, min(getattr(param, 'out_chunk_rows', 1), len(param.row_val)))
+        self.update = False
+
+        years = OutputCointainer._yrs_reducer(param.dim_val)
+        self.years = [int(i) for i in years]
+        self.qc = qc.QCStats(self.years, OutputCointainer._variables)
+        dims = (param.row_nm, param.col_nm, param.dim_nm)
+        shape = (len(param.row_val), len(param.col_val), len(years))
+
+        root = zarr.open_group(self.path, mode='w')
+        for name, values in ((param.row_nm, param.row_val), (param.col_nm, param.col_val), (param.dim_nm, years)):
+            crd = root.array(name, np.asarray(values, dtype='f8'))
+            crd.attrs['_ARRAY_DIMENSIONS'] = [name]
+
+        shuffle = Blosc.SHUFFLE if getattr(param, 'out_shuffle', True) else Blosc.NOSHUFFLE
+        compressor = Blosc(cname='zlib', clevel=getattr(param, 'out_complevel', 4), shuffle=shuffle)
+
+        for attr, name in self._variables.items():
+            ndim = 3 if attr in atoms.PixelRecord.metrics else 2
+            var_dims, var_shape = dims[:ndim], shape[:ndim]
+            if attr == 'tail':
+                var_dims, var_shape = dims[:2] + ('tail',), shape[:2] + (param.yr_dek,)
+            if name in self._state:
+                dtype, packing, encoding = self._state[name]['dtype'], {}, self._state[name]
+            else:
+                dtype, packing, encoding = _encoding(name, param)
+
+            filters = None
+            if 'least_significant_digit' in encoding and np.dtype(dtype).kind == 'f':
+                filters = [Quantize(digits=encoding['least_significant_digit'], dtype=dtype)]
+
+            var = root.create(name, shape=var_shape, chunks=(self.rows,) + var_shape[1:], dtype=dtype,
+                              fill_value=encoding.get('fill_value'), compressor=compressor, filters=filters)
+            var.attrs['_ARRAY_DIMENSIONS'] = list(var_dims)
+            var.attrs.update(packing)
+
+        # metadata don't change anymore, the workers write only chunks
+        zarr.consolidate_metadata(self.path)
+        logger.debug(f'Zarr store {self.path} ready, tiles of {self.rows} rows')
+
+    def __getstate__(self):
+        # the statistics stay on the driver
+        return dict(self.__dict__, qc=None)
+
+    def tiles(self, n_rows):
+        """Row slices of the tiles"""
+        for start in range(0, n_rows, self.rows):
+            yield slice(start, min(start + self.rows, n_rows))
+
+    def write(self, rows, tile):
+        """
+        Write a tile of results, called by the worker that computed it
+
+        :param rows: slice of the rows, aligned to the tiles
+        :param tile: dict of attribute: values (rows x cols [x years]), nan if missing
+        :return: QCStats of the tile, to be merged in the ones of the store
+        """
+        import zarr
+
+        stats = qc.QCStats(self.years, OutputCointainer._variables)
+        stats.update(tile, _valid(tile))
+
+        root = zarr.open_group(self.path, mode='r+')
+        for attr, values in tile.items():
+            var = root[self._variables[attr]]
+            values = np.asarray(values, dtype=float)
+            if attr == 'sl':
+                values = np.nan_to_num(values)
+
+            values = (values - var.attrs.get('add_offset', 0)) / var.attrs.get('scale_factor', 1)
+            if var.dtype.kind in 'iu':
+                values = np.where(np.isfinite(values), np.rint(values), var.fill_value)
+            var[rows] = values.astype(var.dtype)
+        return stats
+
+    def read(self, rows):
+        """
+        Tile of results
+
+        :param rows: slice of the rows
+        :return: dict of attribute: float values, nan if missing
+        """
+        import zarr
+
+        root = zarr.open_group(self.path, mode='r')
+        tile = {}
+        for attr, name in self._variables.items():
+            var = root[name]
+            values = var[rows]
+            missing = values == var.fill_value if var.fill_value is not None else np.zeros(values.shape, bool)
+            values = values.astype(float) * var.attrs.get('scale_factor', 1) + var.attrs.get('add_offset', 0)
+            values[missing] = np.nan
+            tile[attr] = values
+        return tile
+
+    def to_netcdf(self, cube, param, **kwargs):
+        """
+        Convert the store to the netCDF layout of OutputCointainer
+
+        :param param: configuration parameters object
+        :param kwargs: name of the netCDF file
+        :return: closed OutputCointainer
+        """
+        out = OutputCointainer(cube, param, **kwargs)
+        for rows in self.tiles(len(param.row_val)):
+            out.fill(rows, self.read(rows))
+        # QC of the values computed, not of the ones read back quantized
+        out.qc = self.qc
+        out.close()
+        logger.info(f'{self.path} converted to netCDF')
+        return out
+
+    def close(self):
+        self.qc.write(os.path.splitext(self.path)[0] + '_qc.json')
 
 
 def scratch_dump(pxldrl, param):
-    import os
-    import pickle
-    """
-    Create a feather file for this parameters:
-        - ts 
-        - ts_resc 
-        - ts_cleaned
-        - ts_filtered 
-        - ts_d
-        - trend_d
-        - ps
-        - pks 
-    and a pickle file for:
-        - sincy 
-        - phen
-
-    :param pxldrl: a pixel drill as by phenolo 
+    """
+    Append the intermediate series and the cycles of a pixel drill to the scratch store
+    (scratch_path/scratch), see scratch.ScratchStore.
+
+    :param pxldrl: a pixel drill as by phenolo
+    :param param: configuration parameters object
     :return: N/A
     """
-    lst = ['ts', 'ts_resc', 'ts_cleaned', 'ts_filtered', 'ts_d', 'trend_d', 'ps', 'pks']
-    #
-    # for nm in lst:
-    #     file_name = nm + '.' + str(pxldrl.position[0]) + '_' + str(pxldrl.position[1]) + '.pickle'
-    #
-    #     getattr(pxldrl, nm).to_pickle(file_path)
-    #
-    # lst1 = ['sincy', 'phen']
-    #
-    # for nm in lst:
-    #     file_name = nm + '.' + str(pxldrl.position[0]) + '_' + str(pxldrl.position[1]) + '.pickle'
-    #     with open(file_name, 'wb') as handle:
-    #         pickle.dump(getattr(pxldrl, nm), handle, protocol=pickle.HIGHEST_PROTOCOL)
-
-    file_name = 'pxldrl_' + '.' + str(pxldrl.position[0]) + '_' + str(pxldrl.position[1]) + '.pickle'
-    file_path = os.path.join(param.scratch_pth, file_name)
-    with open(file_path, 'wb') as handle:
-        pickle.dump(pxldrl, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    scratch.store(os.path.join(param.scratch_pth, 'scratch')).append(pxldrl)
+
+
+def cycle_dump(pxldrl, param):
+    """
+    Append the cycles of a pixel drill to the per cycle table (out_file name + _cycles), see cycles.CycleWriter.
+
+    :param pxldrl: a pixel drill as by phenolo
+    :param param: configuration parameters object
+    :return: N/A
+    """
+    cycles.writer(os.path.join(param.outFilePth, param.outName + '_cycles')).append(pxldrl)
+
+
+def flush():
+    """Write what is still buffered by the scratch store and by the cycle table of the process"""
+    parts.flush()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import atexit
+import logging
+import os
+import socket
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# writers of the process, one per class and folder
+_WRITERS = {}
+
+
+class PartWriter(object):
+    """
+    Base of the append only writers of the workers.
+
+    Every process buffers what it has to write and appends it to its own part files, named
+    part-<host>-<pid>-<id>, so the workers write in parallel without locks and never share a file.
+    There is one writer per folder in a process (see get), the buffers left are written when the
+    process exits (see flush). The object shipped to the workers holds only the folder.
+
+    Subclasses push what they have to write, set `limit` and write the buffered items in _write.
+
+    :param root: folder of the part files
+    """
+
+    # size of the buffer (as counted by push) that triggers a write
+    limit = 1
+
+    def __init__(self, root):
+        self.root = root
+        self._buffer = []
+        self._size = 0
+        self.__part = None
+
+    def __getstate__(self):
+        return {'root': self.root}
+
+    def __setstate__(self, state):
+        self.__init__(state['root'])
+
+    @classmethod
+    def get(cls, root):
+        """Writer of the process for a folder"""
+        key = (cls, root)
+        if key not in _WRITERS:
+            _WRITERS[key] = cls(root)
+        return _WRITERS[key]
+
+    @property
+    def part(self):
+        """Name of the part files of the process, without extension"""
+        if self.__part is None:
+            self.__part = f'part-{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        return self.__part
+
+    def push(self, item, size=1):
+        """
+        Buffer an item, the buffer is written when it reaches the limit
+
+        :param item: item as expected by _write
+        :param size: size of the item
+        """
+        self._buffer.append(item)
+        self._size += size
+        if self._size >= self.limit:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered items"""
+        if not self._buffer:
+            return
+        self._write(self._buffer)
+        logger.debug(f'{self._size} items of {len(self._buffer)} appended to {self.root}')
+        self._buffer = []
+        self._size = 0
+
+    def _write(self, items):
+        raise NotImplementedError
+
+
+@atexit.register
+def flush():
+    """Write the buffers of all the writers of the process"""
+    for i in _WRITERS.values():
+        i.flush()
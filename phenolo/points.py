@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from phenolo import atoms, results
+
+logger = logging.getLogger(__name__)
+
+# column names accepted for the coordinates of the points, x first
+_X_NAMES = ('x', 'lon', 'longitude', 'e', 'easting')
+_Y_NAMES = ('y', 'lat', 'latitude', 'n', 'northing')
+
+
+def read_points(path):
+    """
+    Read a list of points from a CSV (x/lon/e and y/lat/n columns, optional id) or a GeoJSON of Point features
+
+    :param path: path of the file
+    :return: pandas DataFrame with the columns id, x, y
+    """
+    if os.path.splitext(path)[1].lower() in ('.geojson', '.json'):
+        with open(path, 'r') as f:
+            collection = json.load(f)
+
+        table = []
+        for i, feature in enumerate(collection.get('features', [])):
+            geometry = feature.get('geometry') or {}
+            if geometry.get('type') != 'Point':
+                logger.info(f'Feature {i} of {path} is not a point, skipped')
+                continue
+            properties = feature.get('properties') or {}
+            table.append((feature.get('id', properties.get('id', i)), *geometry['coordinates'][:2]))
+        points = pd.DataFrame(table, columns=['id', 'x', 'y'])
+    else:
+        points = pd.read_csv(path)
+        columns = {i.lower(): i for i in points.columns}
+        x_nm = next((columns[i] for i in _X_NAMES if i in columns), None)
+        y_nm = next((columns[i] for i in _Y_NAMES if i in columns), None)
+        if x_nm is None or y_nm is None:
+            raise ValueError(f'{path} has no coordinate columns (x, y / lon, lat / e, n)')
+        ids = points[columns['id']] if 'id' in columns else points.index
+        points = pd.DataFrame({'id': np.asarray(ids), 'x': points[x_nm].astype(float),
+                               'y': points[y_nm].astype(float)})
+
+    logger.info(f'{len(points)} points read from {path}')
+    return points.reset_index(drop=True)
+
+
+def locate(points, param):
+    """
+    Pixels of the cube nearest to the points, points further than half a pixel from the grid are dropped
+
+    :param points: DataFrame with the columns x and y
+    :param param: param object with the grid of the cube (row_val, col_val)
+    :return: points with the columns row and col added
+    """
+    row_val = np.asarray(param.row_val, dtype=float)
+    col_val = np.asarray(param.col_val, dtype=float)
+
+    points = points.copy()
+    points['row'] = results.nearest(row_val, points['y'].values)
+    points['col'] = results.nearest(col_val, points['x'].values)
+
+    inside = (results.inside(row_val, points['y'].values) & results.inside(col_val, points['x'].values))
+    if not inside.all():
+        logger.info(f'{(~inside).sum()} points outside the grid, skipped')
+    return points[inside].reset_index(drop=True)
+
+
+def chunk_groups(cube, param, points):
+    """
+    Points grouped by the input chunk holding them, every chunk has to be read only once
+
+    :param cube: xarray DataArray (dask backed)
+    :param param: param object
+    :param points: located points (see locate)
+    :return: list of arrays of the positions (in points) of the points of a chunk
+    """
+    keys = []
+    for name in (param.row_nm, param.col_nm):
+        if cube.chunks is None:
+            keys.append(np.zeros(len(points), dtype=int))
+            continue
+        bounds = np.cumsum(cube.chunks[cube.get_axis_num(name)])
+        keys.append(np.searchsorted(bounds, points['row' if name == param.row_nm else 'col'].values, side='right'))
+
+    groups = pd.Series(np.arange(len(points))).groupby([keys[0], keys[1]])
+    return [i.values for _, i in groups]
+
+
+def table(points, records, years):
+    """
+    Results of the points in long format, a row per point and year
+
+    :param points: located points (see locate)
+    :param records: dict of position in points: PixelRecord, points without record have not been analysed
+    :param years: years of the output
+    :return: pandas DataFrame
+    """
+    n_pts, n_yrs = len(points), len(years)
+    values = np.full((n_pts, len(atoms.PixelRecord.metrics), n_yrs), np.nan, dtype=np.float32)
+    season, err = np.zeros(n_pts, dtype=np.int64), np.zeros(n_pts, dtype=np.int64)
+    analysed = np.zeros(n_pts, dtype=bool)
+
+    for i, record in records.items():
+        values[i] = record.values
+        season[i] = record.season
+        err[i] = record.errtyp
+        analysed[i] = True
+
+    frame = points.loc[np.repeat(np.arange(n_pts), n_yrs)].reset_index(drop=True)
+    frame['year'] = np.tile(np.asarray(years, dtype=int), n_pts)
+    for i, name in enumerate(atoms.PixelRecord.metrics):
+        frame[name] = values[:, i, :].ravel()
+    frame['n_seasons'] = np.repeat(season, n_yrs)
+    frame['err'] = np.repeat(err, n_yrs)
+    frame['analysed'] = np.repeat(analysed, n_yrs)
+    return frame
+
+
+def write(frame, param):
+    """
+    Write the results of the points as Parquet (out_file name + _points.parquet)
+
+    :param frame: DataFrame as by table
+    :param param: param object
+    :return: path of the file
+    """
+    pth = os.path.join(param.outFilePth, param.outName + '_points.parquet')
+    frame.to_parquet(pth, index=False, compression='zstd')
+    logger.info(f'Results of {frame["id"].nunique()} points written to {pth}')
+    return pth
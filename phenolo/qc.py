@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+from collections import Counter
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# fixed bins of the histograms, values below the first edge and above the last one are counted in the
+# first and in the last bin. Days of the year and lengths of the seasons on a linear scale, the integrals
+# (whose scale depends on the data) on a symmetric log scale by quarter of octave
+_LOG = 2 ** np.arange(-4, 24.25, 0.25)
+_EDGES = {'sb': np.arange(0, 371, 5), 'se': np.arange(0, 371, 5), 'sl': np.arange(0, 741, 10),
+          'spi': np.concatenate((-_LOG[::-1], [0], _LOG)), 'si': np.concatenate((-_LOG[::-1], [0], _LOG)),
+          'cf': np.concatenate((-_LOG[::-1], [0], _LOG)), 'afi': np.concatenate((-_LOG[::-1], [0], _LOG))}
+
+
+class QCStats(object):
+    """
+    Streaming QC statistics of the results, updated with every tile written so that no second pass
+    over the output is needed.
+
+    Per year and variable it keeps a fixed bin histogram and the moments (count, mean, variance by the
+    Welford/Chan update, min and max), per pixel the counts of PixelCriticalError codes and of
+    NumberOfSeasons and per year the counts of the CycleWarning codes. Missing values are not counted.
+
+    :param years: years of the output
+    :param names: dict of attribute: name of the variable in the output
+    """
+
+    def __init__(self, years, names):
+        self.years = [int(i) for i in years]
+        self.names = names
+        self.pixels = 0
+        self.with_results = 0
+        self.errors = Counter()
+        self.seasons = Counter()
+        self.warnings = {i: Counter() for i in self.years}
+
+        n_yrs = len(self.years)
+        self.__moments = {i: np.zeros((3, n_yrs)) for i in _EDGES}
+        self.__min = {i: np.full(n_yrs, np.inf) for i in _EDGES}
+        self.__max = {i: np.full(n_yrs, -np.inf) for i in _EDGES}
+        self.__hist = {i: np.zeros((n_yrs, len(j) + 1), dtype=np.int64) for i, j in _EDGES.items()}
+
+    def update(self, tile, valid):
+        """
+        Add a tile of results
+
+        :param tile: dict of attribute: values (rows x cols [x years]) as written, nan if missing
+        :param valid: pixels of the tile with results (rows x cols)
+        """
+        self.pixels += valid.size
+        self.with_results += int(valid.sum())
+        if not valid.any():
+            return
+
+        self.errors.update(np.nan_to_num(np.asarray(tile['err'], dtype=float)[valid]).astype(int).tolist())
+        self.seasons.update(np.nan_to_num(np.asarray(tile['n_seasons'], dtype=float)[valid]).astype(int).tolist())
+
+        warn = np.asarray(tile['warn'], dtype=float)[valid]
+        for i, year in enumerate(self.years):
+            codes = warn[:, i]
+            self.warnings[year].update(codes[np.isfinite(codes)].astype(int).tolist())
+
+        for attr in _EDGES:
+            if attr in tile:
+                self.__add(attr, np.asarray(tile[attr], dtype=float)[valid])
+
+    def __add(self, attr, values):
+        """Merge the moments and the histogram of a block (pixels x years) with the ones kept"""
+        finite = np.isfinite(values)
+        yr = np.nonzero(finite)[1]
+        values = values[finite]
+        if not values.size:
+            return
+        n_yrs = len(self.years)
+
+        # moments of the block, merged by the parallel form of the Welford update
+        n_b = np.bincount(yr, minlength=n_yrs).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_b = np.nan_to_num(np.bincount(yr, values, minlength=n_yrs) / n_b)
+        m2_b = np.bincount(yr, (values - mean_b[yr]) ** 2, minlength=n_yrs)
+        self.__moments[attr] = _merge_moments(self.__moments[attr], np.stack((n_b, mean_b, m2_b)))
+
+        np.minimum.at(self.__min[attr], yr, values)
+        np.maximum.at(self.__max[attr], yr, values)
+
+        n_bins = self.__hist[attr].shape[1]
+        bins = np.searchsorted(_EDGES[attr], values, side='right')
+        self.__hist[attr] += np.bincount(yr * n_bins + bins, minlength=n_yrs * n_bins).reshape(n_yrs, n_bins)
+
+    def merge(self, other):
+        """
+        Add the statistics of other tiles, e.g. the ones computed by a worker on the tiles it wrote
+
+        :param other: QCStats of the same years
+        """
+        self.pixels += other.pixels
+        self.with_results += other.with_results
+        self.errors.update(other.errors)
+        self.seasons.update(other.seasons)
+        for year, counts in other.warnings.items():
+            self.warnings[year].update(counts)
+
+        for attr in _EDGES:
+            self.__moments[attr] = _merge_moments(self.__moments[attr], other.__moments[attr])
+            self.__min[attr] = np.minimum(self.__min[attr], other.__min[attr])
+            self.__max[attr] = np.maximum(self.__max[attr], other.__max[attr])
+            self.__hist[attr] += other.__hist[attr]
+
+    def report(self):
+        """
+        QC report as a dict ready for json
+
+        Histograms are given as {bin: count} of the non empty bins, bin i counts the values in
+        [edges[i-1], edges[i]), bin 0 the ones below the first edge.
+
+        :return: dict
+        """
+        variables = {}
+        for attr, edges in _EDGES.items():
+            n, mean, m2 = self.__moments[attr]
+            years = {}
+            for i, year in enumerate(self.years):
+                if not n[i]:
+                    continue
+                hist = self.__hist[attr][i]
+                years[str(year)] = {'count': int(n[i]), 'mean': float(mean[i]),
+                                    'std': float(np.sqrt(m2[i] / n[i])),
+                                    'min': float(self.__min[attr][i]), 'max': float(self.__max[attr][i]),
+                                    'histogram': {str(j): int(hist[j]) for j in np.nonzero(hist)[0]}}
+            variables[self.names.get(attr, attr)] = {'edges': edges.tolist(), 'years': years}
+
+        return {'pixels': self.pixels, 'with_results': self.with_results,
+                self.names.get('err', 'err'): _counts(self.errors),
+                self.names.get('n_seasons', 'n_seasons'): _counts(self.seasons),
+                self.names.get('warn', 'warn'): {str(i): _counts(j) for i, j in self.warnings.items() if j},
+                'variables': variables}
+
+    def write(self, path):
+        """
+        Write the QC report as json
+
+        :param path: path of the report
+        :return: path
+        """
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, separators=(',', ':'))
+
+        errors = sum(j for i, j in self.errors.items() if i)
+        logger.info(f'QC report {path}: {self.with_results} of {self.pixels} pixels with results, {errors} in error')
+        return path
+
+
+def _counts(counter):
+    return {str(i): counter[i] for i in sorted(counter)}
+
+
+def _merge_moments(a, b):
+    """Moments (count, mean, sum of squared deviations) per year of the union of two sets, Chan et al."""
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    total = n_a + n_b
+    delta = mean_b - mean_a
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.stack((total,
+                         np.where(total > 0, mean_a + np.nan_to_num(delta * n_b / total), 0),
+                         m2_a + m2_b + np.nan_to_num(delta ** 2 * n_a * n_b / total)))
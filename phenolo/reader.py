@@ -4,15 +4,17 @@ import fnmatch
 import glob
 import logging
 import os
+import re
 import sys
 import time
 
 import numpy as np
-import numpy.ma as ma
 import pandas as pd
 import xarray as xr
 from pyhdf.SD import *
 
+from phenolo import cache, catalog
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,103 +23,563 @@ class Reader(object):
         return
 
 
-def _get_img(prmts, dim):
-    from phenolo import chronos as dk
+# ENVI data type codes
+_ENVI_DTYPES = {1: 'u1', 2: 'i2', 3: 'i4', 4: 'f4', 5: 'f8', 12: 'u2', 13: 'u4', 14: 'i8', 15: 'u8'}
 
-    try:
-        # dataset = xr.open_rasterio(prmts.inFilePth, chunks={'x': 500, 'y': 500})
-        dataset = xr.open_rasterio(prmts.inFilePth)
-    except IOError:
-        logger.debug('Error reading img file')
-        sys.exit(1)
+# memmap axes order of every ENVI interleave
+_ENVI_AXES = {'bsq': ('bands', 'lines', 'samples'),
+              'bil': ('lines', 'bands', 'samples'),
+              'bip': ('lines', 'samples', 'bands')}
+
+
+def _read_envi_hdr(path):
+    """
+    Parse an ENVI header file.
+
+    :param path: path of the .hdr file
+    :return: dict of the header fields, values in braces are returned as list of strings
+    """
+    with open(path, 'r') as hdr_file:
+        text = hdr_file.read()
+
+    if not text.lstrip().startswith('ENVI'):
+        raise IOError(f'{path} is not an ENVI header')
+
+    hdr = {}
+    for key, value in re.findall(r'^\s*([^=\n{}]+?)\s*=\s*(\{[^}]*\}|[^\n]*)', text, flags=re.M):
+        value = value.strip()
+        if value.startswith('{'):
+            value = [item.strip() for item in value[1:-1].split(',')]
+        hdr[key.strip().lower()] = value
+
+    return hdr
+
+
+class EnviArray(object):
+    """
+    Lazy (bands, lines, samples) view of an ENVI binary file.
+
+    The file is memory mapped only when data are requested, so the object is cheap to pickle and
+    can be shipped to the workers inside a dask graph. Every interleave is exposed as a transposed
+    view of the memmap, slicing it doesn't copy until the data are read.
+
+    :param path: path of the binary file
+    :param hdr: parsed header as by _read_envi_hdr
+    :param rows: window of lines exposed
+    :param cols: window of samples exposed
+    """
+
+    def __init__(self, path, hdr, rows=slice(None), cols=slice(None)):
+        self.path = path
+        self.interleave = hdr.get('interleave', 'bsq').lower()
+        self.offset = int(hdr.get('header offset', 0))
+
+        dtype = np.dtype(_ENVI_DTYPES[int(hdr['data type'])])
+        self.dtype = dtype.newbyteorder('>' if int(hdr.get('byte order', 0)) == 1 else '<')
+
+        sizes = {'bands': int(hdr['bands']), 'lines': int(hdr['lines']), 'samples': int(hdr['samples'])}
+        self.file_shape = tuple(sizes[ax] for ax in _ENVI_AXES[self.interleave])
+
+        self.rows = slice(*rows.indices(sizes['lines'])[:2])
+        self.cols = slice(*cols.indices(sizes['samples'])[:2])
+        self.shape = (sizes['bands'], self.rows.stop - self.rows.start, self.cols.stop - self.cols.start)
+        self.ndim = 3
+
+    def memmap(self):
+        """Zero copy (bands, lines, samples) view of the window"""
+        mm = np.memmap(self.path, dtype=self.dtype, mode='r', offset=self.offset, shape=self.file_shape)
+        mm = mm.transpose([_ENVI_AXES[self.interleave].index(ax) for ax in ('bands', 'lines', 'samples')])
+        return mm[:, self.rows, self.cols]
+
+    def __getitem__(self, key):
+        return np.asarray(self.memmap()[key])
+
+
+def _envi_coords(hdr, lines, samples):
+    """Pixel centre coordinates from the ENVI map info, pixel indexes if not available"""
+    if 'map info' not in hdr:
+        return np.arange(lines), np.arange(samples)
+
+    info = hdr['map info']
+    ref_x, ref_y = float(info[1]) - 1, float(info[2]) - 1
+    x, y = float(info[3]), float(info[4])
+    dx, dy = float(info[5]), float(info[6])
+
+    lon = x + (np.arange(samples) + 0.5 - ref_x) * dx
+    lat = y - (np.arange(lines) + 0.5 - ref_y) * dy
+    return lat, lon
+
+
+def _axis_window(slc, crd):
+    """Index slice of a coordinate selected by a slicer, with the same semantic of _slice_cube"""
+    crd = np.asarray(crd)
+    if slc.start is None and slc.stop is None:
+        return slice(0, crd.size)
+
+    # single pixel
+    if slc.start == slc.stop:
+        if isinstance(slc.start, int):
+            pos = np.arange(crd.size)[slc.start:slc.start + 1]
+        else:
+            pos = [int(np.abs(crd - slc.start).argmin())] if _inside(slc.start, crd) else []
+
+    # absolute
+    elif isinstance(slc.start, int) or isinstance(slc.stop, int):
+        pos = np.arange(crd.size)[slc.start:slc.stop]
+
+    # relative (prj), labels included as in sel
+    else:
+        desc = crd.size > 1 and crd[0] > crd[-1]
+        sel = np.ones(crd.size, dtype=bool)
+        if slc.start is not None:
+            sel &= crd <= slc.start if desc else crd >= slc.start
+        if slc.stop is not None:
+            sel &= crd >= slc.stop if desc else crd <= slc.stop
+        pos = np.flatnonzero(sel)
+        if len(pos) and not all(_inside(i, crd) for i in (slc.start, slc.stop) if i is not None):
+            logger.info(f'Extent {slc.start} -> {slc.stop} partly outside the data, clipped to '
+                        f'{crd[pos[0]]} -> {crd[pos[-1]]}')
+
+    if len(pos) == 0:
+        logger.info('Coordinates out of range')
+        raise ValueError('Extent outside the data')
+    return slice(int(pos[0]), int(pos[-1]) + 1)
+
+
+def _inside(value, crd):
+    """A coordinate falls in the pixels centred on crd (bounds of the coordinates plus half a pixel)"""
+    half = abs(crd[1] - crd[0]) / 2 if crd.size > 1 else 0
+    return crd.min() - half <= value <= crd.max() + half
+
+
+def _window(dim, y_crd, x_crd):
+    """
+    Pixel window of the extent requested, used by the readers to read only the bytes they need.
+
+    :param dim: slicers as by _get_slicers
+    :param y_crd: row coordinates of the whole raster
+    :param x_crd: column coordinates of the whole raster
+    :return: (row slice, col slice, slicers relative to the window)
+    """
+    rows, cols = _axis_window(dim['y'], y_crd), _axis_window(dim['x'], x_crd)
+
+    dim = dict(dim)
+    if dim['x'].start == dim['x'].stop and dim['y'].start == dim['y'].stop and dim['x'].start is not None:
+        dim['x'], dim['y'] = slice(0, 0), slice(0, 0)
+    elif dim['x'] != slice(None) or dim['y'] != slice(None):
+        dim['x'], dim['y'] = slice(0, cols.stop - cols.start), slice(0, rows.stop - rows.start)
+
+    logger.debug(f'Window rows {rows.start}:{rows.stop}, cols {cols.start}:{cols.stop}')
+    return rows, cols, dim
+
+
+def _time_domain(prmts, names, size):
+    """
+    Dates of the bands, from the setting file or from the band names
+
+    :param prmts: ProjectParameters object
+    :param names: band names, None if not available
+    :param size: number of bands
+    :return: DatetimeIndex
+    """
+    from phenolo import chronos as dk
 
     if prmts.start_time is not pd.NaT and prmts.end_time is not pd.NaT:
         logger.debug('Dates comes from the setting file')
         time_dom = dk.create(prmts.start_time, prmts.end_time, prmts.dek)
     else:
-        if 'band_names' in dataset.attrs:
-            import re
-            time_dom = pd.to_datetime(re.findall(r'\d\d\d\d\d\d\d\d', dataset.attrs['band_names']))
+        if names:
+            time_dom = pd.to_datetime(re.findall(r'\d\d\d\d\d\d\d\d', ','.join(i or '' for i in names)))
         else:
             logger.debug('Bands name doesn\'t contains datase')
             raise sys.exit(1)
 
-    if dict(dataset.sizes)['band'] == time_dom.size:
-        dt = dataset.assign_coords(band=time_dom)
-    else:
+    if size != time_dom.size:
         logger.debug('Ups! we have a problem with the time size. Doesn\'t mathc the datalenght')
         raise sys.exit(1)
 
-    dt = dt.rename(x='lon', y='lat', band='time')
+    return time_dom
+
+
+def _get_img(prmts, dim):
+    try:
+        hdr_pth = os.path.splitext(prmts.inFilePth)[0] + '.hdr'
+        if not os.path.isfile(hdr_pth):
+            hdr_pth = prmts.inFilePth + '.hdr'
+        hdr = _read_envi_hdr(hdr_pth)
+        envi = EnviArray(prmts.inFilePth, hdr)
+    except (IOError, KeyError, ValueError):
+        logger.debug('Error reading img file')
+        sys.exit(1)
+
+    time_dom = _time_domain(prmts, hdr.get('band names'), envi.shape[0])
+
+    lat, lon = _envi_coords(hdr, envi.shape[1], envi.shape[2])
+
+    # only the lines and samples of the extent are mapped
+    rows, cols, dim = _window(dim, lat, lon)
+    envi = EnviArray(prmts.inFilePth, hdr, rows, cols)
+    lat, lon = lat[rows], lon[cols]
+
+    # the binary file has no internal chunking
+    plan = _chunk_plan(('time', 'lat', 'lon'), envi.shape, envi.dtype.itemsize, {}, prmts.chunk_mem,
+                       name=f'ENVI {envi.interleave}')
+    chunks = (plan['time'], plan['lat'], plan['lon'])
+
+    data = _from_array(envi, chunks, f'envi-{os.path.abspath(prmts.inFilePth)}-{rows.start}-{rows.stop}-{cols.start}-{cols.stop}',
+                       prmts, cache.source_token(prmts.inFilePth, rows, cols))
+    dt = xr.DataArray(data, coords={'time': time_dom, 'lat': lat, 'lon': lon}, dims=('time', 'lat', 'lon'),
+                      name=os.path.splitext(os.path.basename(prmts.inFilePth))[0])
+
+    return _slice_cube(dt, dim)
+
+
+class RasterArray(object):
+    """
+    Lazy (bands, rows, cols) array of a window of a GDAL raster.
+
+    Every read opens the file and reads only the window requested with rasterio, the object is
+    cheap to pickle and can be shipped to the workers inside a dask graph.
+
+    :param path: path of the raster
+    :param rows: window of rows exposed
+    :param cols: window of columns exposed
+    :param profile: (count, height, width, dtype) of the raster, read from the file if not provided
+    """
+
+    def __init__(self, path, rows=slice(None), cols=slice(None), profile=None):
+        if profile is None:
+            profile = _raster_profile(path)
+        self.path = path
+        self.count, height, width, self.dtype = profile
+        self.rows = slice(*rows.indices(height)[:2])
+        self.cols = slice(*cols.indices(width)[:2])
+        self.shape = (self.count, self.rows.stop - self.rows.start, self.cols.stop - self.cols.start)
+        self.ndim = 3
+
+    def __getitem__(self, key):
+        import rasterio as rs
+        from rasterio.windows import Window
+
+        # the window covers the requested slices, integers and lists are applied after the read
+        key = key if isinstance(key, tuple) else (key,)
+        key = key + (slice(None),) * (3 - len(key))
+        span = [k if isinstance(k, slice) and k.step in (None, 1) else
+                slice(int(k), int(k) + 1) if np.ndim(k) == 0 else slice(None) for k in key]
+        bands, rows, cols = [slice(*k.indices(n)[:2]) for k, n in zip(span, self.shape)]
+        rest = tuple(slice(None) if isinstance(k, slice) and k.step in (None, 1) else
+                     0 if np.ndim(k) == 0 else k for k in key)
+
+        window = Window.from_slices((self.rows.start + rows.start, self.rows.start + rows.stop),
+                                    (self.cols.start + cols.start, self.cols.start + cols.stop))
+        with rs.open(self.path, 'r') as src:
+            data = src.read(list(range(bands.start + 1, bands.stop + 1)), window=window)
+
+        return data[rest]
+
+
+def _raster_profile(path):
+    import rasterio as rs
+
+    with rs.open(path, 'r') as src:
+        return src.count, src.height, src.width, np.dtype(src.dtypes[0])
+
+
+def _raster_coords(transform, height, width):
+    """Pixel centre coordinates of a north up raster"""
+    lon = transform.c + (np.arange(width) + 0.5) * transform.a
+    lat = transform.f + (np.arange(height) + 0.5) * transform.e
+    return lat, lon
+
+
+def _get_rasterio(prmts, dim):
+    """
+    Multi band raster (GeoTIFF, VRT...) with a band per date, only the window of the extent is read.
+
+    :param prmts: ProjectParameters object
+    :param dim: slicers as by _get_slicers
+    :return: xarray DataArray
+    """
+    import rasterio as rs
+
+    with rs.open(prmts.inFilePth, 'r') as src:
+        lat, lon = _raster_coords(src.transform, src.height, src.width)
+        names = src.descriptions if any(src.descriptions) else None
+        block_y, block_x = src.block_shapes[0]
+        count, dtype = src.count, np.dtype(src.dtypes[0])
+
+    time_dom = _time_domain(prmts, names, count)
+
+    rows, cols, dim = _window(dim, lat, lon)
+    raster = RasterArray(prmts.inFilePth, rows, cols, (count, lat.size, lon.size, dtype))
+    lat, lon = lat[rows], lon[cols]
+
+    plan = _chunk_plan(('time', 'lat', 'lon'), raster.shape, dtype.itemsize, {'lat': block_y, 'lon': block_x},
+                       prmts.chunk_mem, name=os.path.basename(prmts.inFilePth))
+    data = _from_array(raster, (plan['time'], plan['lat'], plan['lon']),
+                       f'raster-{os.path.abspath(prmts.inFilePth)}-{rows.start}-{rows.stop}-{cols.start}-{cols.stop}',
+                       prmts, cache.source_token(prmts.inFilePth, rows, cols))
+
+    dt = xr.DataArray(data, coords={'time': time_dom, 'lat': lat, 'lon': lon}, dims=('time', 'lat', 'lon'),
+                      name=os.path.splitext(os.path.basename(prmts.inFilePth))[0])
 
     return _slice_cube(dt, dim)
 
 
-def _get_rasterio(prmts):
+def _date_regex(fmt):
+    """Regular expression matching the dates written with a strftime format"""
+    fields = {'%Y': r'\d{4}', '%y': r'\d{2}', '%m': r'\d{2}', '%d': r'\d{2}', '%j': r'\d{3}',
+              '%H': r'\d{2}', '%M': r'\d{2}', '%S': r'\d{2}'}
+    regex = re.escape(fmt)
+    for field, pattern in fields.items():
+        regex = regex.replace(re.escape(field), pattern)
+    return re.compile(regex)
+
+
+def _file_dates(files, fmt):
+    """
+    Dates in the file names
+
+    :param files: list of paths
+    :param fmt: strftime format of the date in the names (%Y%m%d, %Y%j, ...)
+    :return: DatetimeIndex
+    """
+    regex = _date_regex(fmt)
+    dates = []
+    for path in files:
+        found = regex.search(os.path.basename(path))
+        if found is None:
+            logger.info(f'No date {fmt} in {path}')
+            raise ValueError(f'Date not found in {os.path.basename(path)}')
+        dates.append(found.group())
+    return pd.DatetimeIndex(pd.to_datetime(dates, format=fmt))
+
+
+def _get_multi_raster(prmts, dim):
+    """
+    Stack of single band rasters (GeoTIFF, COG...) with a file per date.
+
+    Dates come from the file names (date_format in the settings). The files share the grid of the
+    first one, every file is read lazily through windows aligned with its internal tiles and the
+    tiles are read in parallel by dask.
+
+    :param prmts: ProjectParameters object
+    :param dim: slicers as by _get_slicers
+    :return: xarray DataArray
+    """
+    import dask.array as da
     import rasterio as rs
 
-    with rs.Env(CPL_DEBUG=True):
-        dataset = rs.open(prmts.inFilePth, 'r')
-        return dataset
+    files = sorted(glob.glob(prmts.inFilePth))
+    if not files:
+        logger.info('File or directory not found')
+        raise FileNotFoundError(prmts.inFilePth)
+
+    dates = _file_dates(files, prmts.date_format or '%Y%m%d')
+    order = np.argsort(dates, kind='stable')
+    files, dates = [files[i] for i in order], dates[order]
+
+    with rs.open(files[0], 'r') as src:
+        lat, lon = _raster_coords(src.transform, src.height, src.width)
+        block_y, block_x = src.block_shapes[0]
+        profile = (1, src.height, src.width, np.dtype(src.dtypes[0]))
+
+    rows, cols, dim = _window(dim, lat, lon)
+    lat, lon = lat[rows], lon[cols]
+
+    plan = _chunk_plan(('time', 'lat', 'lon'), (len(files), lat.size, lon.size), profile[3].itemsize,
+                       {'lat': block_y, 'lon': block_x}, prmts.chunk_mem, name=prmts.inFilePth)
+
+    blocks = [_from_array(RasterArray(path, rows, cols, profile), (1, plan['lat'], plan['lon']),
+                          f'raster-{os.path.abspath(path)}-{os.path.getmtime(path)}-{rows}-{cols}',
+                          prmts, cache.source_token(path, rows, cols))
+              for path in files]
+    data = da.concatenate(blocks, axis=0).rechunk({0: plan['time']})
+
+    dt = xr.DataArray(data, coords={'time': dates, 'lat': lat, 'lon': lon}, dims=('time', 'lat', 'lon'),
+                      name='NDVI')
+
+    return _slice_cube(dt, dim)
+
+
+def _native_chunks(data):
+    """
+    On disk chunk shape of a variable
+
+    :param data: xarray DataArray as opened by the backend
+    :return: dict {dim: size}, empty for contiguous or unknown layouts
+    """
+    chunks = data.encoding.get('chunksizes') or data.encoding.get('chunks')
+    if chunks and len(chunks) == data.ndim:
+        return dict(zip(data.dims, chunks))
+    return dict(data.encoding.get('preferred_chunks', {}))
+
+
+def _chunk_plan(dims, shape, itemsize, native, budget, name=''):
+    """
+    Dask chunks made of whole native chunks.
+
+    Every chunk holds the full time series of its pixels, whole rows are preferred and as many rows as
+    fit in the budget are taken, so a row block is decoded only once.
+
+    :param dims: (time, row, col) dimension names
+    :param shape: (time, row, col) sizes
+    :param itemsize: bytes per value
+    :param native: on disk chunks as {dim: size}
+    :param budget: memory budget of a chunk in bytes
+    :param name: name used in the log
+    :return: dict {dim: size}
+    """
+    crd_t, crd_y, crd_x = dims
+    n_t, n_y, n_x = shape
+    ch_y, ch_x = min(native.get(crd_y, 1), n_y), min(native.get(crd_x, 1), n_x)
+
+    # pixels whose whole time series fit in the budget
+    pixels = max(1, budget // (n_t * itemsize))
+
+    if n_x * ch_y <= pixels:
+        cols = n_x
+    else:
+        cols = min(n_x, max(ch_x, pixels // ch_y // ch_x * ch_x))
+    rows = min(n_y, max(ch_y, pixels // cols // ch_y * ch_y))
+
+    plan = {crd_t: n_t, crd_y: rows, crd_x: cols}
+    logger.debug(f'Chunk plan {name}: native {native or "contiguous"} -> dask {plan}')
+    return plan
+
+
+class _XrSource(object):
+    """Positional reads of a lazily opened (not chunked) variable"""
+
+    def __init__(self, data):
+        self.data = data
+        self.shape = data.shape
+        self.dtype = data.dtype
+        self.ndim = data.ndim
+
+    def __getitem__(self, key):
+        return self.data[key].values
+
+
+def _chunk_cache(prmts):
+    """ChunkCache of the run, None if not requested"""
+    if getattr(prmts, 'cache_size', None) and getattr(prmts, 'scratch_pth', None):
+        return cache.ChunkCache(os.path.join(prmts.scratch_pth, 'chunk_cache'), prmts.cache_size)
+
+
+def _from_array(source, chunks, name, prmts, token):
+    """dask array of a lazy source, read through the chunk cache when requested"""
+    import dask.array as da
+
+    chunk_cache = _chunk_cache(prmts)
+    if chunk_cache is not None:
+        source = cache.CachedArray(source, chunk_cache, token)
+    return da.from_array(source, chunks=chunks, name=name)
+
+
+def _chunk_data(data, prmts):
+    """Chunk a lazily opened variable according to _chunk_plan"""
+    crd_x, crd_y, crd_t = _coord_names(data)
+    dims = (crd_t, crd_y, crd_x)
+    plan = _chunk_plan(dims, [data.sizes[i] for i in dims], data.dtype.itemsize, _native_chunks(data),
+                       prmts.chunk_mem, name=data.name)
+
+    source = data.encoding.get('source')
+    if _chunk_cache(prmts) is not None and source and os.path.exists(source) and not data.chunks:
+        chunks = tuple(plan[i] for i in data.dims)
+        token = cache.source_token(source, data.name, data.shape, data[crd_t].values[[0, -1]],
+                                   data[crd_y].values[[0, -1]], data[crd_x].values[[0, -1]])
+        return data.copy(data=_from_array(_XrSource(data), chunks, f'xr-{token}', prmts, token))
+
+    return data.chunk(plan)
 
 
 def _get_netcdf(prmts, dim):
     dataset = xr.open_dataset(prmts.inFilePth,
-                              chunks={'lat': 250, 'lon': 250},
                               mask_and_scale=False,
                               decode_times=True)
 
-    return _slice_cube(dataset, dim)
-
-
-def _get_multi_netcdf(path, dim, prmts):
-    dataset = xr.open_mfdataset(path,
-                                mask_and_scale=False,
-                                decode_times=prmts.decode)
-    return _slice_cube(dataset, dim)
+    # the lazy backend reads only the extent, chunks are set on the selection
+    data = _slice_cube(dataset, dim)
+    if data.ndim == 3:
+        data = _chunk_data(data, prmts)
 
+    return data
 
-def _get_hls(path):
-    hdf = SD(path, SDC.READ)
 
-    # dataset_dic = hdf.datasets()
+def _get_multi_netcdf(path, dim, prmts):
+    """
+    Stack of netCDF files assembled from their index (see phenolo.catalog), files are opened only
+    when their data are read.
+    """
+    import dask.array as da
+
+    files, grid = catalog.load_index(path)
+    crd_t, crd_y, crd_x = grid['dims']
+    first = files[0][1]
+
+    # only the window of the extent is read from every file
+    rows, cols, dim = _window(dim, grid['coords'][crd_y], grid['coords'][crd_x])
+    n_time = sum(entry['shape'][0] for _, entry in files)
+    native = dict(zip(grid['dims'], first['chunks'])) if first['chunks'] else {}
+    plan = _chunk_plan((crd_t, crd_y, crd_x), (n_time, rows.stop - rows.start, cols.stop - cols.start),
+                       np.dtype(first['dtype']).itemsize, native, prmts.chunk_mem, name=path)
+
+    blocks = [_from_array(catalog.NcArray(pth, entry, rows, cols), (entry['shape'][0], plan[crd_y], plan[crd_x]),
+                          f'nc-{os.path.abspath(pth)}-{entry["mtime"]}-{rows}-{cols}',
+                          prmts, cache.source_token(pth, entry['variable'], rows, cols))
+              for pth, entry in files]
+
+    times = [i for _, entry in files for i in entry['time']]
+    if isinstance(times[0], str):
+        times = pd.DatetimeIndex(times)
+
+    data = xr.DataArray(da.concatenate(blocks, axis=0),
+                        dims=(crd_t, crd_y, crd_x),
+                        coords={crd_t: times,
+                                crd_y: grid['coords'][crd_y][rows],
+                                crd_x: grid['coords'][crd_x][cols]},
+                        attrs=grid['attrs'],
+                        name=first['variable'])
+
+    return _slice_cube(data, dim)
+
+
+# HLS values flagged as no data
+_HLS_NODATA = -1000
+# HLS QA values accepted as clear
+_HLS_CLEAR = np.array([128, 192, 64, 4, 68, 132, 196, 0])
+# bits of the scene mask kept in the NDVI cache
+_HLS_MSK_NODATA, _HLS_MSK_QA, _HLS_MSK_RANGE = 1, 2, 4
+# NDVI scale of the int16 cache
+_HLS_NDVI_SCALE = 10000
+
+
+def _hls_meta(hdf):
+    """
+    Bands and geometry of an HLS scene
+
+    :param hdf: pyhdf SD object
+    :return: dict, None if the sensor is not supported
+    """
     attrib_dic = hdf.attributes()
 
     if 'SPACECRAFT_NAME' in attrib_dic and ('Sentinel-2A' in attrib_dic['SPACECRAFT_NAME'] or
                                             'NONE' in attrib_dic['SPACECRAFT_NAME']):
-        nir_band_nm = 'B8A'
-        r_band_nm = 'B04'
-        qa_band_nm = 'QA'
+        bands = ('B8A', 'B04', 'QA')
         scene_name = attrib_dic['TILE_ID']
-        n_rows = int(attrib_dic['NROWS'])
-        n_cols = int(attrib_dic['NCOLS'])
-        sp_res = int(attrib_dic['SPATIAL_RESOLUTION'])
-        ul_x = int(attrib_dic['ULX'])
-        ul_y = int(attrib_dic['ULY'])
-        lr_x = int(ul_x + n_cols * sp_res)
-        lr_y = int(ul_y - n_rows * sp_res)
         s_time = attrib_dic['SENSING_TIME']
         if "+" in s_time:
             s_time = s_time.split(' + ')
             s_time = pd.to_datetime(s_time[0]) + pd.to_datetime(pd.Series([s_time[0], s_time[1]])).diff().mean() / 2
 
     elif 'SENSOR' in attrib_dic and 'OLI_TIRS' in attrib_dic['SENSOR']:
-        nir_band_nm = 'band05'
-        r_band_nm = 'band04'
-        qa_band_nm = 'QA'
+        bands = ('band05', 'band04', 'QA')
         if ";" in attrib_dic['LANDSAT_SCENE_ID']:
             scene_name = attrib_dic['LANDSAT_SCENE_ID'].split(';')[0]
         else:
             scene_name = attrib_dic['LANDSAT_SCENE_ID']
 
-        n_rows = attrib_dic['NROWS']
-        n_cols = attrib_dic['NCOLS']
-        sp_res = attrib_dic['SPATIAL_RESOLUTION']
-        ul_x = int(attrib_dic['ULX'])
-        ul_y = int(attrib_dic['ULY'])
-        lr_x = int(ul_x + n_cols * sp_res)
-        lr_y = int(ul_y - n_rows * sp_res)
-
         s_time = attrib_dic['SENSING_TIME']
         if ";" in s_time:
             s_time = s_time.split(';')
@@ -125,139 +587,157 @@ def _get_hls(path):
     else:
         return
 
-    # NIR band
-    nir_band = hdf.select(nir_band_nm)
-    nir_add_offset, nir_scale_factor = _scale(nir_band)
+    n_rows = int(attrib_dic['NROWS'])
+    n_cols = int(attrib_dic['NCOLS'])
+    sp_res = int(attrib_dic['SPATIAL_RESOLUTION'])
+    ul_x = int(attrib_dic['ULX'])
+    ul_y = int(attrib_dic['ULY'])
+    lr_x = int(ul_x + n_cols * sp_res)
+    lr_y = int(ul_y - n_rows * sp_res)
 
-    # Red band
-    r_band = hdf.select(r_band_nm)
-    r_add_offset, r_scale_factor = _scale(r_band)
+    # naive UTC time as the other inputs
+    s_time = pd.Timestamp(s_time)
+    if s_time.tzinfo is not None:
+        s_time = s_time.tz_convert(None)
 
-    # QA mask application
-    q_band = hdf.select(qa_band_nm)
+    return {'bands': bands,
+            'name': scene_name,
+            'time': s_time,
+            # X/Y array for the DataArray
+            'x': np.linspace(ul_x, lr_x, n_cols, endpoint=False),
+            'y': np.linspace(ul_y, lr_y, n_rows, endpoint=False)}
 
-    # x_arr, y_arr = [None] * 2
 
-    # X/Y array for the DataArray
-    x_arr = np.linspace(ul_x, lr_x, n_cols, endpoint=False)
-    y_arr = np.linspace(ul_y, lr_y, n_rows, endpoint=False)
+def _hls_cache_path(path):
+    return os.path.splitext(path)[0] + '.ndvi.npz'
 
-    # Nir_band
-    nir = nir_band.get()
-    nir = (ma.array(nir, mask=np.isin(nir, np.array([-1000]))) - nir_add_offset) * nir_scale_factor
 
-    # Red_band
-    r = r_band.get()
-    r = (ma.array(r, mask=np.isin(r, np.array([-1000]))) - r_add_offset) * r_scale_factor
+def _hls_read(path):
+    """
+    NDVI of an HLS scene as int16 plus a bit mask
 
-    # Q_mask
-    q_mask = np.invert(np.isin(q_band.get(), np.array([128, 192, 64, 4, 68, 132, 196, 0])))
+    :param path: path of the HDF file
+    :return: (meta, ndvi, mask), None if the sensor is not supported
+    """
+    hdf = SD(path, SDC.READ)
+    try:
+        meta = _hls_meta(hdf)
+        if meta is None:
+            return
+
+        nir_band_nm, r_band_nm, qa_band_nm = meta['bands']
+
+        bands = []
+        mask = np.zeros((meta['y'].size, meta['x'].size), dtype=np.uint8)
+        for band_nm in (nir_band_nm, r_band_nm):
+            band = hdf.select(band_nm)
+            add_offset, scale_factor = _scale(band)
+            raw = np.asarray(band.get())
+            mask[raw == _HLS_NODATA] |= _HLS_MSK_NODATA
+            bands.append((raw.astype(np.float32) - (add_offset or 0)) * (scale_factor or 1))
+
+        # QA mask application
+        mask[~np.isin(np.asarray(hdf.select(qa_band_nm).get()), _HLS_CLEAR)] |= _HLS_MSK_QA
+    finally:
+        hdf.end()
+
+    nir, r = bands
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ndvi = (nir - r) / (nir + r)
 
-    r = ma.array(r, mask=q_mask)
-    nir = ma.array(nir, mask=q_mask)
+    # NDVI Outlayer removal
+    mask[~(np.abs(ndvi) <= 1)] |= _HLS_MSK_RANGE
+    ndvi = np.where(mask == 0, np.rint(ndvi * _HLS_NDVI_SCALE), 0).astype(np.int16)
 
-    # NDVI calculation and 3d dimension expantion
-    ndvi = np.expand_dims(((nir - r) / (nir + r)), 2)
+    return meta, ndvi, mask
 
-    # NDVI Outlayer removal
-    ndvi_msk = ma.masked_outside(ndvi, -1, 1)
-
-    data_array = xr.DataArray(ndvi_msk, coords=[y_arr, x_arr, [pd.to_datetime(s_time)]],
-                              dims=['N', 'E', 'Time'], name=scene_name)
-
-    # region old script
-    # if _coord['E'] is not None:
-    #     # Tests area
-    #     dat = xr.DataArray(ndvi_msk, coords=[Y_arr, X_arr, [pd.to_datetime(TIME)]],
-    #                        dims=['N', 'E', 'Time'], name=scene_name)
-    #     # attrs=attrib_dic)
-    #
-    #     dat = dat.sel(E=_coord['E'], N=_coord['N'])
-    # else:
-    #     dat = xr.DataArray(ndvi_msk, coords=[Y_arr, X_arr, [pd.to_datetime(TIME)]],
-    #                        dims=['N', 'E', 'Time'], name=scene_name)
-    #     # attrs=attrib_dic)
-
-    # if isinstance(dim['x'], slice) is False and _coord['E'] is not None:
-    #     x = int((_coord['E'] - UL_X) / SP_RES)
-    #     y = int((UL_Y - _coord['N']) / SP_RES)
-    #
-    #     # X/Y array for the DataArray
-    #     X_arr = [_coord['E']]
-    #     Y_arr = [_coord['N']]
-    #
-    #     # Nir band
-    #     nir = np.array(nir_band[y, x])
-    #     nir = (ma.array(nir, mask=np.isin(nir, np.array([-1000]))) - add_offset) * scale_factor
-    #     # Red band
-    #     r = np.array(r_band[y, x])
-    #     r = (ma.array(r, mask=np.isin(r, np.array([-1000]))) - add_offset) * scale_factor
-    #     # Q_mask
-    #     q_band = np.array(q_band[x, y])
-    #     q_mask = np.invert(np.isin(q_band, np.array([128, 192, 64, 4, 68, 132, 196, 0])))
-    #
-    #     # NDVI calculation and 3d dimension expantion
-    #
-    #     ndvi = np.atleast_3d(((nir - r) / (nir + r)))
-    #
-    #     # NDVI Outlayer removal
-    #     ndvi_msk = ma.masked_outside(ndvi, -1, 1)
-    #
-    #     # Tests area
-    #     dat = xr.DataArray(ndvi_msk, coords=[Y_arr, X_arr, [pd.to_datetime(TIME)]],
-    #                        dims=['N', 'E', 'Time'], name=scene_name)
-    #     # attrs=attrib_dic)
-    #
-    #
-    # else:
-    #     # X/Y array for the DataArray
-    #     X_arr = np.linspace(UL_X, LR_X, NCOLS, endpoint=False)
-    #     Y_arr = np.linspace(UL_Y, LR_Y, NROWS, endpoint=False)
-    #
-    #     # Nir_band
-    #     nir = nir_band.get()
-    #     nir = (ma.array(nir, mask=np.isin(nir, np.array([-1000]))) - add_offset) * scale_factor
-    #
-    #     # Red_band
-    #     r = r_band.get()
-    #     r = (ma.array(r, mask=np.isin(r, np.array([-1000]))) - add_offset) * scale_factor
-    #
-    #     # Q_mask
-    #     q_mask = np.invert(np.isin(q_band.get(), np.array([128, 192, 64, 4, 68, 132, 196, 0])))
-    #
-    #     r = ma.array(r, mask=q_mask)
-    #     nir = ma.array(nir, mask=q_mask)
-    #
-    #     # NDVI calculation and 3d dimension expantion
-    #     ndvi = np.expand_dims(((nir - r) / (nir + r)), 2)
-    #
-    #     # NDVI Outlayer removal
-    #     ndvi_msk = ma.masked_outside(ndvi, -1, 1)
-    #
-    #     if _coord['E'] is not None:
-    #         # Tests area
-    #         dat = xr.DataArray(ndvi_msk, coords=[Y_arr, X_arr, [pd.to_datetime(TIME)]],
-    #                            dims=['N', 'E', 'Time'], name=scene_name)
-    #         # attrs=attrib_dic)
-    #
-    #         dat = dat.sel(E=_coord['E'], N=_coord['N'])
-    #     else:
-    #         dat = xr.DataArray(ndvi_msk, coords=[Y_arr, X_arr, [pd.to_datetime(TIME)]],
-    #                            dims=['N', 'E', 'Time'], name=scene_name)
-    #         # attrs=attrib_dic)
-    #
-    # return dat
-    # end region
-
-    return data_array
-
-
-def _get_multi_hdf(f_list, dim):
-    hls_lst = [_get_hls(file) for file in f_list]
-
-    data_array = xr.concat(hls_lst, dim='Time', **{'decode_cfbool': False})
-
-    cube = _slice_cube(data_array, dim)
+
+def _hls_decode(path):
+    """
+    Compute the NDVI of an HLS scene and store it next to the file as int16 plus a bit mask
+
+    :param path: path of the HDF file
+    :return: path of the cache, None if the sensor is not supported
+    """
+    scene = _hls_read(path)
+    if scene is None:
+        return
+    meta, ndvi, mask = scene
+
+    cache = _hls_cache_path(path)
+    with open(cache, 'wb') as f:
+        np.savez(f, ndvi=ndvi, mask=mask, x=meta['x'], y=meta['y'],
+                 time=np.array(meta['time'].isoformat()), name=np.array(meta['name']))
+    return cache
+
+
+def _hls_cached(path):
+    """Cache of the scene if it is not older than the HDF file"""
+    cache = _hls_cache_path(path)
+    if os.path.isfile(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+        return cache
+
+
+def _hls_float(ndvi, mask):
+    return np.where(mask == 0, ndvi / np.float32(_HLS_NDVI_SCALE), np.float32(np.nan))
+
+
+def _hls_ndvi(cache, rows=slice(None), cols=slice(None)):
+    """Float NDVI of a cached scene, masked pixels as nan"""
+    with np.load(cache) as npz:
+        return _hls_float(npz['ndvi'][rows, cols], npz['mask'][rows, cols])
+
+
+def _get_multi_hdf(f_list, dim, workers=None):
+    """
+    Stack of HLS scenes.
+
+    Scenes without an up to date NDVI cache are decoded in parallel by a process pool, the stack is
+    then read lazily from the caches. The cache always holds the whole scene, so it serves any later
+    extent, and only the window of the extent requested is read from it.
+
+    :param f_list: list of HDF files
+    :param dim: slicers as by _get_slicers
+    :param workers: number of processes, all the cpus if None
+    :return: xarray DataArray
+    """
+    import dask
+    import dask.array as da
+    from concurrent.futures import ProcessPoolExecutor
+
+    f_list = sorted(f_list)
+    caches = dict((path, _hls_cached(path)) for path in f_list)
+
+    new = [path for path, cache in caches.items() if cache is None]
+    if new:
+        logger.info(f'Decoding {len(new)} of {len(f_list)} HLS scenes')
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            caches.update(zip(new, pool.map(_hls_decode, new)))
+
+    hls_lst = []
+    rel_dim = dim
+    for path in f_list:
+        if caches[path] is not None:
+            with np.load(caches[path]) as npz:
+                x_arr, y_arr = npz['x'], npz['y']
+                s_time, scene_name = str(npz['time']), str(npz['name'])
+
+            rows, cols, rel_dim = _window(dim, y_arr, x_arr)
+            x_arr, y_arr = x_arr[cols], y_arr[rows]
+            ndvi = da.from_delayed(dask.delayed(_hls_ndvi)(caches[path], rows, cols),
+                                   shape=(y_arr.size, x_arr.size), dtype=np.float32)
+
+        else:
+            logger.debug(f'{path} sensor not supported, skipped')
+            continue
+
+        hls_lst.append(xr.DataArray(ndvi[np.newaxis], coords=[[pd.to_datetime(s_time)], y_arr, x_arr],
+                                    dims=['Time', 'N', 'E'], name=scene_name))
+
+    data_array = xr.concat(hls_lst, dim='Time').sortby('Time')
+    data_array.name = 'NDVI'
+
+    cube = _slice_cube(data_array, rel_dim)
 
     return cube
 
@@ -498,20 +978,75 @@ def _get_slicers(prmts):
     return {'time': time_slice, 'x': x_slice, 'y': y_slice}
 
 
+def _ard_path(in_pth):
+    """
+    Default position of the analysis ready store of an input, without extension
+
+    :param in_pth: input path as in the settings (file or glob)
+    :return: path of the store without the .zarr/.nc extension
+    """
+    if '*' in in_pth:
+        return os.path.join(os.path.dirname(in_pth), 'phenolo_ard')
+    return os.path.splitext(in_pth.rstrip('/\\'))[0] + '_ard'
+
+
+def _ard_store(in_pth):
+    """Analysis ready store to be used in place of the input, None if there isn't one"""
+    if in_pth.rstrip('/\\').endswith('.zarr') and os.path.isdir(in_pth):
+        return in_pth
+
+    base = _ard_path(in_pth)
+    for store in (base + '.zarr', base + '.nc'):
+        if os.path.exists(store):
+            if _input_mtime(in_pth) > os.path.getmtime(store):
+                logger.info(f'Analysis ready store {store} is older than the input, ignored')
+                continue
+            return store
+    return None
+
+
+def _input_mtime(in_pth):
+    """Last modification of the input, the newest of the files of a glob"""
+    if os.path.isfile(in_pth):
+        return os.path.getmtime(in_pth)
+    return max((os.path.getmtime(i) for i in glob.glob(in_pth)), default=0)
+
+
+def _get_ard(path, dim, prmts):
+    """Open an analysis ready store with chunks made of whole store chunks (full time series, small tiles)"""
+    if path.rstrip('/\\').endswith('.zarr'):
+        dataset = xr.open_zarr(path, chunks=None, mask_and_scale=False)
+    else:
+        dataset = xr.open_dataset(path, mask_and_scale=False)
+
+    return _slice_cube(_chunk_data(dataset.NDVI, prmts), dim)
+
+
 def _dasker(dataset, dim_bloks, col_bloks, row_bloks):
     crd_y, crd_x, crd_t = _coord_names(dataset)
     return dataset.chunk({crd_t: dim_bloks, crd_x: row_bloks, crd_y: col_bloks})
 
 
-def ingest(prmts):
+def ingest(prmts, ard=True):
+    """
+    Read the input cube described by the parameters
+
+    :param prmts: ProjectParameters object
+    :param ard: prefer the analysis ready store of the input when available (see phenolo.ard)
+    :return: xarray DataArray
+    """
     start = time.time()
 
     dim = _get_slicers(prmts)
 
     try:
         cube = None
+        ard_pth = _ard_store(prmts.inFilePth) if ard else None
         # TODO adapt to GCFS file
-        if os.path.isfile(prmts.inFilePth) or 'gs://' in prmts.inFilePth:
+        if ard_pth is not None:
+            logger.info(f'Analysis ready store in use: {ard_pth}')
+            cube = _get_ard(ard_pth, dim, prmts)
+        elif os.path.isfile(prmts.inFilePth) or 'gs://' in prmts.inFilePth:
             if fnmatch.fnmatch(prmts.inFilePth, '*.nc'):
                 cube = _get_netcdf(prmts, dim)
             elif fnmatch.fnmatch(prmts.inFilePth, '*.hdf'):
@@ -521,14 +1056,14 @@ def ingest(prmts):
             elif fnmatch.fnmatch(prmts.inFilePth, '*.img'):
                 cube = _get_img(prmts, dim)
             else:
-                cube = _get_rasterio(prmts.inFilePth, dim)
+                cube = _get_rasterio(prmts, dim)
         elif os.path.isdir(os.path.dirname(prmts.inFilePth)):
             if '*.nc' in prmts.inFilePth:
                 cube = _get_multi_netcdf(prmts.inFilePth, dim, prmts)
             elif '*.hdf' in prmts.inFilePth:
-                cube = _get_multi_hdf(glob.glob(os.path.join(prmts.inFilePth, '*.hdf')), dim)
+                cube = _get_multi_hdf(glob.glob(prmts.inFilePth), dim, prmts.n_workers)
             else:
-                cube = _get_rasterio(prmts.inFilePth, dim)
+                cube = _get_multi_raster(prmts, dim)
         else:
             logger.info('File or directory not found')
             raise FileNotFoundError
@@ -539,10 +1074,10 @@ def ingest(prmts):
             prmts.add_dims(cube)
 
             if cube.chunks is None:
-                col_blocks = prmts.col_val.size
-                row_blocks = 1  # prmts.row_val.size
-                dim_blocks = prmts.dim_val.size
-                cube = _dasker(cube, dim_blocks, col_blocks, row_blocks)
+                plan = _chunk_plan((prmts.dim_nm, prmts.row_nm, prmts.col_nm),
+                                   (prmts.dim_val.size, prmts.row_val.size, prmts.col_val.size),
+                                   cube.dtype.itemsize, {}, prmts.chunk_mem, name=cube.name)
+                cube = _dasker(cube, plan[prmts.dim_nm], plan[prmts.col_nm], plan[prmts.row_nm])
 
             return cube
 
@@ -553,4 +1088,116 @@ def ingest(prmts):
             return cube
 
     except Exception as ex:
-        raise ex
\ No newline at end of file
+        raise ex
+
+def _pixel_index(value, crd):
+    """Position of a single pixel coordinate (index if int, nearest label if float), as checked by _axis_window"""
+    crd = np.asarray(crd)
+    if isinstance(value, int):
+        if not 0 <= value < crd.size:
+            raise ValueError('Coordinates out of range')
+        return value
+    if not _inside(value, crd):
+        raise ValueError('Extent outside the data')
+    return int(np.abs(crd - value).argmin())
+
+
+def _pixel_nc(files, grid, dim):
+    """Series of a pixel from netCDF files described by their index entries, a read per file"""
+    crd_t, crd_y, crd_x = grid['dims']
+    y_crd, x_crd = np.asarray(grid['coords'][crd_y]), np.asarray(grid['coords'][crd_x])
+    row, col = _pixel_index(dim['y'].start, y_crd), _pixel_index(dim['x'].start, x_crd)
+
+    values = np.concatenate([catalog.NcArray(pth, entry)[:, row, col] for pth, entry in files])
+    times = [i for _, entry in files for i in entry['time']]
+    if isinstance(times[0], str):
+        times = pd.DatetimeIndex(times)
+
+    return xr.DataArray(values, dims=(crd_t,), coords={crd_t: times, crd_y: y_crd[row], crd_x: x_crd[col]},
+                        attrs=grid['attrs'], name=files[0][1]['variable'])
+
+
+def _pixel_raster(files, dates, dim):
+    """Series of a pixel from rasters (a band per date or a file per date), only a 1 x 1 window is read"""
+    from concurrent.futures import ThreadPoolExecutor
+    import rasterio as rs
+
+    with rs.open(files[0], 'r') as src:
+        lat, lon = _raster_coords(src.transform, src.height, src.width)
+        profile = (src.count, src.height, src.width, np.dtype(src.dtypes[0]))
+    row, col = _pixel_index(dim['y'].start, lat), _pixel_index(dim['x'].start, lon)
+
+    def read(path):
+        # the folder of the file is not listed looking for side car files
+        with rs.Env(GDAL_DISABLE_READDIR_ON_OPEN='EMPTY_DIR'):
+            return RasterArray(path, slice(row, row + 1), slice(col, col + 1), profile)[:, 0, 0]
+
+    # GDAL releases the GIL, the files are read concurrently
+    with ThreadPoolExecutor() as pool:
+        values = np.concatenate(list(pool.map(read, files)))
+
+    return xr.DataArray(values, dims=('time',), coords={'time': dates, 'lat': lat[row], 'lon': lon[col]},
+                        name='NDVI')
+
+
+def read_pixel(prmts):
+    """
+    Read the time series of the single pixel of the extent without building the dask graph of the cube.
+
+    The coordinate is mapped to a pixel index with the grid of the input (the index of a netCDF stack,
+    the transform of a raster) and only that pixel is read from every file. The result is the same
+    of ingest for a single point extent.
+
+    :param prmts: ProjectParameters object, ext with two coordinates
+    :return: xarray DataArray (time) in memory, None if the input has no point read (HLS, remote files)
+    """
+    start = time.time()
+    dim = _get_slicers(prmts)
+    pth = prmts.inFilePth
+
+    ard_pth = _ard_store(pth)
+    if ard_pth is not None and ard_pth.rstrip('/\\').endswith('.zarr'):
+        data = xr.open_zarr(ard_pth, chunks=None, mask_and_scale=False).NDVI
+        crd_x, crd_y, crd_t = _coord_names(data)
+        row, col = _pixel_index(dim['y'].start, data[crd_y].values), _pixel_index(dim['x'].start, data[crd_x].values)
+        pixel = data.isel(dict([(crd_y, row), (crd_x, col)])).load()
+    elif ard_pth is not None or (os.path.isfile(pth) and fnmatch.fnmatch(pth, '*.nc')):
+        path = ard_pth or pth
+        entry = catalog.scan(path)
+        pixel = _pixel_nc([(path, entry)], catalog.grid(path, entry), dim)
+    elif '*.nc' in pth and os.path.isdir(os.path.dirname(pth)):
+        pixel = _pixel_nc(*catalog.load_index(pth), dim)
+    elif os.path.isfile(pth) and fnmatch.fnmatch(pth, '*.img'):
+        hdr_pth = os.path.splitext(pth)[0] + '.hdr'
+        hdr = _read_envi_hdr(hdr_pth if os.path.isfile(hdr_pth) else pth + '.hdr')
+        envi = EnviArray(pth, hdr)
+        lat, lon = _envi_coords(hdr, envi.shape[1], envi.shape[2])
+        row, col = _pixel_index(dim['y'].start, lat), _pixel_index(dim['x'].start, lon)
+        pixel = xr.DataArray(np.array(envi[:, row, col]), dims=('time',),
+                             coords={'time': _time_domain(prmts, hdr.get('band names'), envi.shape[0]),
+                                     'lat': lat[row], 'lon': lon[col]},
+                             name=os.path.splitext(os.path.basename(pth))[0])
+    elif os.path.isfile(pth) and not fnmatch.fnmatch(pth, '*.hdf'):
+        import rasterio as rs
+
+        with rs.open(pth, 'r') as src:
+            names = src.descriptions if any(src.descriptions) else None
+            count = src.count
+        pixel = _pixel_raster([pth], _time_domain(prmts, names, count), dim)
+    elif os.path.isdir(os.path.dirname(pth)) and '*.hdf' not in pth and 'gs://' not in pth:
+        files = sorted(glob.glob(pth))
+        if not files:
+            raise FileNotFoundError(pth)
+        dates = _file_dates(files, prmts.date_format or '%Y%m%d')
+        order = np.argsort(dates, kind='stable')
+        pixel = _pixel_raster([files[i] for i in order], dates[order], dim)
+    else:
+        return None
+
+    crd_t = pixel.dims[0]
+    if dim['time'] != slice(None):
+        pixel = pixel.sel(dict([(crd_t, dim['time'])]))
+
+    prmts.add_dims(pixel)
+    logger.info(f'Pixel read in {time.time() - start:.3f}s')
+    return pixel
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from phenolo import output
+
+logger = logging.getLogger(__name__)
+
+# size of a block of rows read at a time
+_BLOCK_BYTES = 4 * 2 ** 20
+
+
+class Results(object):
+    """
+    Query API over a finished output (dense or sparse netCDF).
+
+    The file is opened once, blocks of rows are decoded to float (nan where missing) and kept in a
+    LRU cache, so repeated queries on the same area don't touch the disk again. Variables can be named
+    as in the file (StartWeek) or as in the executor (sb).
+
+    :param path: path of the netCDF output
+    :param cache_size: size cap of the decoded blocks in MiB
+    """
+
+    def __init__(self, path, cache_size=256):
+        from netCDF4 import Dataset
+
+        self.path = path
+        self.root = Dataset(path, 'r')
+        self.cache_size = cache_size * 2 ** 20
+        self.__cache = OrderedDict()
+        self.__used = 0
+
+        self.sparse = 'pixel' in self.root.variables
+        if self.sparse:
+            self.row_nm, self.col_nm = self.root['pixel'].compress.split()
+        else:
+            self.row_nm, self.col_nm = self.root['PixelCriticalError'].dimensions
+
+        self.y = np.asarray(self.root[self.row_nm][:], dtype=float)
+        self.x = np.asarray(self.root[self.col_nm][:], dtype=float)
+        time_nm = self.root['StartWeek'].dimensions[-1]
+        self.years = np.asarray(self.root[time_nm][:]).astype(int)
+
+        if self.sparse:
+            pixel = np.asarray(self.root['pixel'][:])
+            self.__order = np.argsort(pixel, kind='stable')
+            self.__pixel = pixel[self.__order]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.root.close()
+        self.__cache.clear()
+
+    def __name(self, name):
+        return output.OutputCointainer._variables.get(name, name)
+
+    def __store(self, key, values):
+        """Add a decoded block to the cache, the least recently used are dropped above the cap"""
+        self.__cache[key] = values
+        self.__used += values.nbytes
+        while self.__used > self.cache_size and len(self.__cache) > 1:
+            _, old = self.__cache.popitem(last=False)
+            self.__used -= old.nbytes
+        return values
+
+    def __decoded(self, var, key):
+        values = var[key]
+        return np.ma.filled(np.ma.asarray(values).astype(float), np.nan)
+
+    def __block_rows(self, var):
+        """Rows of a block, whole chunks up to _BLOCK_BYTES"""
+        chunking = var.chunking()
+        chunk = 1 if chunking == 'contiguous' else chunking[0]
+        row_bytes = 8 * int(np.prod(var.shape[1:]))
+        return max(chunk, _BLOCK_BYTES // row_bytes // chunk * chunk)
+
+    def __block(self, name, i):
+        """Block i of a dense variable, as float"""
+        key = (name, i)
+        if key in self.__cache:
+            self.__cache.move_to_end(key)
+            return self.__cache[key]
+
+        var = self.root[name]
+        rows = self.__block_rows(var)
+        return self.__store(key, self.__decoded(var, slice(i * rows, (i + 1) * rows)))
+
+    def __gathered(self, name):
+        """Stored pixels of a sparse variable, as float in the order of the pixel ids"""
+        key = (name, None)
+        if key in self.__cache:
+            self.__cache.move_to_end(key)
+            return self.__cache[key]
+        return self.__store(key, self.__decoded(self.root[name], slice(None))[self.__order])
+
+    def __values(self, name, rows, cols):
+        """Values of a variable for pixel positions, nan where missing"""
+        var = self.root[name]
+        shape = (rows.size,) + ((len(self.years),) if len(var.dimensions) > (1 if self.sparse else 2) else ())
+        # season lengths have no missing values in the dense layout
+        values = np.full(shape, 0.0 if name == output.OutputCointainer._variables['sl'] else np.nan)
+
+        if self.sparse:
+            if self.__pixel.size:
+                ids = rows * self.x.size + cols
+                pos = np.minimum(np.searchsorted(self.__pixel, ids), self.__pixel.size - 1)
+                found = self.__pixel[pos] == ids
+                values[found] = self.__gathered(name)[pos[found]]
+            return values
+
+        block_rows = self.__block_rows(var)
+        blocks = rows // block_rows
+        for i in np.unique(blocks):
+            sel = blocks == i
+            values[sel] = self.__block(name, i)[rows[sel] - i * block_rows, cols[sel]]
+        return values
+
+    def locate(self, x, y):
+        """
+        Nearest pixels of a list of coordinates, as in points.locate coordinates further than half a pixel
+        from the grid have no pixel
+
+        :param x: x coordinates (columns)
+        :param y: y coordinates (rows)
+        :return: (rows, cols) arrays of int, -1 for the coordinates outside the grid
+        """
+        x, y = np.atleast_1d(x).astype(float), np.atleast_1d(y).astype(float)
+        rows, cols = nearest(self.y, y), nearest(self.x, x)
+
+        outside = ~(inside(self.y, y) & inside(self.x, x))
+        if outside.any():
+            logger.info(f'{outside.sum()} points outside the grid of {self.path}')
+            rows[outside], cols[outside] = -1, -1
+        return rows, cols
+
+    def pixels(self, rows, cols, variables=('sb', 'se', 'sl', 'spi', 'si', 'cf', 'afi', 'err')):
+        """
+        Per year history of a list of pixels
+
+        :param rows: rows of the pixels
+        :param cols: columns of the pixels
+        :param variables: variables to be read, per pixel ones (err, n_seasons) are repeated for every year
+        :return: pandas DataFrame indexed by (point, year) with a column per variable, nan for the pixels
+                 outside the grid (negative positions)
+        """
+        rows, cols = np.atleast_1d(rows).astype(int), np.atleast_1d(cols).astype(int)
+        index = pd.MultiIndex.from_product([range(rows.size), self.years], names=['point', 'year'])
+        inside = (rows >= 0) & (rows < self.y.size) & (cols >= 0) & (cols < self.x.size)
+
+        table = {}
+        for name in variables:
+            found = self.__values(self.__name(name), rows[inside], cols[inside])
+            values = np.full((rows.size,) + found.shape[1:], np.nan)
+            values[inside] = found
+            if values.ndim == 1:
+                values = np.repeat(values[:, np.newaxis], len(self.years), axis=1)
+            table[name] = values.ravel()
+        return pd.DataFrame(table, index=index)
+
+    def points(self, x, y, variables=('sb', 'se', 'sl', 'spi', 'si', 'cf', 'afi', 'err')):
+        """
+        Per year history of the pixels nearest to a list of coordinates, see pixels
+
+        :param x: x coordinates (columns)
+        :param y: y coordinates (rows)
+        :param variables: variables to be read
+        :return: pandas DataFrame indexed by (point, year) with a column per variable and the flag inside,
+                 points outside the grid have nan values and inside False
+        """
+        rows, cols = self.locate(x, y)
+        table = self.pixels(rows, cols, variables=variables)
+        table['inside'] = np.repeat(rows >= 0, len(self.years))
+        return table
+
+    def bbox(self, variable, x_min, y_min, x_max, y_max, year=None):
+        """
+        Values of a variable inside a bounding box
+
+        :param variable: name of the variable
+        :param x_min: left coordinate
+        :param y_min: bottom coordinate
+        :param x_max: right coordinate
+        :param y_max: top coordinate
+        :param year: year of the slice, all the years if None
+        :return: (values as float array (rows x cols [x years]), y coordinates, x coordinates)
+        """
+        rows = np.nonzero((self.y >= y_min) & (self.y <= y_max))[0]
+        cols = np.nonzero((self.x >= x_min) & (self.x <= x_max))[0]
+        values = self.__window(self.__name(variable), rows, cols)
+        if year is not None and values.ndim == 3:
+            values = values[..., self.__year(year)]
+        return values, self.y[rows], self.x[cols]
+
+    def year(self, variable, year):
+        """
+        Map of a variable for a year
+
+        :param variable: name of the variable
+        :param year: year of the slice
+        :return: float array (rows x cols)
+        """
+        values = self.__window(self.__name(variable), np.arange(self.y.size), np.arange(self.x.size))
+        return values[..., self.__year(year)] if values.ndim == 3 else values
+
+    def __year(self, year):
+        if year not in self.years:
+            raise ValueError(f'Year {year} not in {self.path}')
+        return int(np.nonzero(self.years == year)[0][0])
+
+    def __window(self, name, rows, cols):
+        """Values of the rows x cols window of a variable"""
+        grid_r, grid_c = np.meshgrid(rows, cols, indexing='ij')
+        values = self.__values(name, grid_r.ravel(), grid_c.ravel())
+        return values.reshape((rows.size, cols.size) + values.shape[1:])
+
+
+def nearest(coords, values):
+    """Index of the nearest coordinate, for increasing or decreasing coordinates"""
+    if coords.size == 1:
+        return np.zeros(values.size, dtype=int)
+
+    order = np.argsort(coords)
+    srt = coords[order]
+    pos = np.clip(np.searchsorted(srt, values), 1, srt.size - 1)
+    left = np.abs(values - srt[pos - 1]) <= np.abs(srt[pos] - values)
+    return order[np.where(left, pos - 1, pos)]
+
+
+def inside(coords, values):
+    """Values inside the extent of the pixels centred on coords (half a pixel beyond the first and last ones)"""
+    half = abs(coords[1] - coords[0]) / 2 if coords.size > 1 else 0
+    return (values >= coords.min() - half) & (values <= coords.max() + half)
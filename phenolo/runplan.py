@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy.signal import savgol_coeffs
+
+from phenolo import chronos, nodata
+
+logger = logging.getLogger(__name__)
+
+
+class RunPlan(object):
+    """
+    Constants of a run, they depend only on the parameters and on the time axis of the cube.
+
+    The plan is built once on the driver, scattered to every worker and shared by all the pixels
+    processed there.
+
+    Attributes:
+        time: time axis of the cube
+        years: years of the output
+        climate: climatological slots of the time axis (nodata.ClimateAxis)
+        decoder: decode descriptor of the raw values (nodata.RawDecoder)
+        daily: daily time axis between the first and the last observation
+        posix: daily time axis as POSIX seconds
+        yr_dys: days per observation
+        yr_dek: observations per year
+        sg_coeffs: Savitzky-Golay coefficients, None if the filter is not used
+        mpd_frc: fraction of the season length used as minimum valley distance for long seasons
+
+    :param param: ProjectParameters object
+    :param dim_val: time axis of the cube, param.dim_val if not provided
+    """
+
+    def __init__(self, param, dim_val=None):
+        if dim_val is None:
+            dim_val = param.dim_val
+
+        self.time = pd.DatetimeIndex(dim_val)
+        self.years = self.time.year.unique()
+        self.climate = nodata.ClimateAxis(self.time)
+        self.decoder = nodata.RawDecoder(param)
+
+        self.daily = pd.date_range(self.time.min(), self.time.max(), freq='D')
+        self.posix = np.asarray((self.daily - pd.Timestamp(0)).total_seconds())
+
+        self.yr_dys, self.yr_dek = chronos.day_calc(param.dek)
+
+        self.sg_coeffs = None
+        if param.smp and param.medspan > param.smp:
+            self.sg_coeffs = savgol_coeffs(param.medspan, param.smp)
+
+        self.mpd_frc = (param.ovrlp - param.ovrlp * 1 / 3) / 100
+
+        logger.debug(f'Run plan ready: {self.time.size} observations, {self.daily.size} days')
+
+    def mpd(self, season_lng):
+        """Minimum distance between two valleys in days"""
+        if 200.0 < season_lng < 400.0:
+            return int(season_lng * 2 / 3)
+        elif season_lng < 200:
+            return int(season_lng * 1 / 3)
+        else:
+            return int(season_lng * self.mpd_frc)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+import glob
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from phenolo import atoms, metrics, parts
+
+logger = logging.getLogger(__name__)
+
+# intermediate series of a pixel drill kept in the store
+SERIES = ('ts_raw', 'ts', 'ts_resc', 'ts_cleaned', 'ts_filtered', 'ts_d', 'ps', 'pks',
+          'sb', 'se', 'sl', 'spi', 'si', 'cf', 'afi')
+
+_CHUNK = 4096
+
+
+class ScratchStore(parts.PartWriter):
+    """
+    Append only columnar store of the intermediate results of the pixel drills.
+
+    Every process appends to its own part file (netCDF4/HDF5, see parts.PartWriter). A part file has
+    a group per series with the columns time and value along an unlimited dimension, a "cycles" group
+    with the per cycle table (metrics.CYCLE_COLUMNS) and a "pixels" group with row, col and the
+    start/count of the pixel in every other group.
+    Time is stored in days since 1970-01-01 for dates, as is for the years of the metrics.
+
+    :param root: folder of the store
+    """
+
+    # pixels buffered before an append to the part file
+    limit = 64
+
+    def __init__(self, root):
+        super(ScratchStore, self).__init__(root)
+        self.__index = None
+
+    def append(self, pxldrl):
+        """
+        Add a pixel drill, written with the next flush
+
+        :param pxldrl: processed pixel drill
+        """
+        row, col = (int(i) for i in pxldrl.position)
+        series = {}
+        for name in SERIES:
+            ts = getattr(pxldrl, name, None)
+            if isinstance(ts, pd.Series) and len(ts):
+                series[name] = (_to_days(ts.index), np.asarray(ts.values, dtype=float))
+        cycles = metrics.cycle_table(pxldrl) if pxldrl.phen else {}
+        self.push((row, col, series, cycles))
+
+    def _write(self, items):
+        """Append the buffered pixels to the part file of the process, a single write per column of every group"""
+        from netCDF4 import Dataset
+
+        os.makedirs(self.root, exist_ok=True)
+        part = os.path.join(self.root, self.part + '.nc')
+        with Dataset(part, 'a' if os.path.isfile(part) else 'w', format='NETCDF4') as nc:
+            pixels = _group(nc, 'pixels', ('row', 'col'), 'i4')
+            n = pixels.dimensions['n'].size
+            pixels['row'][n:] = [item[0] for item in items]
+            pixels['col'][n:] = [item[1] for item in items]
+
+            names = [name for name in SERIES if any(name in item[2] for item in items)]
+            for name in names:
+                grp = _group(nc, name, ('time', 'value'), 'f8')
+                located = [(i, item[2][name]) for i, item in enumerate(items) if name in item[2]]
+                _set(pixels, name, n, len(items), grp.dimensions['n'].size,
+                     [(i, len(values)) for i, (_, values) in located])
+                start = grp.dimensions['n'].size
+                grp['time'][start:] = np.concatenate([time for _, (time, _) in located])
+                grp['value'][start:] = np.concatenate([values for _, (_, values) in located])
+
+            located = [(i, item[3]) for i, item in enumerate(items) if item[3]]
+            if located:
+                grp = _group(nc, 'cycles', metrics.CYCLE_COLUMNS, 'f8')
+                _set(pixels, 'cycles', n, len(items), grp.dimensions['n'].size,
+                     [(i, len(cycles[metrics.CYCLE_COLUMNS[0]])) for i, cycles in located])
+                start = grp.dimensions['n'].size
+                for name in metrics.CYCLE_COLUMNS:
+                    grp[name][start:] = np.concatenate([np.asarray(cycles[name], dtype=float)
+                                                        for _, cycles in located])
+
+    def __locate(self, row, col):
+        """(part file, position in its pixels group) of a pixel, the index is read at the first call"""
+        if self.__index is None:
+            from netCDF4 import Dataset
+
+            self.__index = {}
+            for part in sorted(glob.glob(os.path.join(self.root, 'part-*.nc'))):
+                with Dataset(part, 'r') as nc:
+                    if 'pixels' not in nc.groups:
+                        continue
+                    pixels = nc['pixels']
+                    for i, key in enumerate(zip(pixels['row'][:].tolist(), pixels['col'][:].tolist())):
+                        self.__index[key] = (part, i)
+
+        if (row, col) not in self.__index:
+            raise KeyError(f'Pixel {row}, {col} not in the scratch store {self.root}')
+        return self.__index[(row, col)]
+
+    def series(self, row, col, name):
+        """
+        Intermediate series of a pixel
+
+        :param row: row of the pixel
+        :param col: column of the pixel
+        :param name: name of the series (SERIES)
+        :return: pandas Series, None if not stored
+        """
+        from netCDF4 import Dataset
+
+        part, i = self.__locate(row, col)
+        with Dataset(part, 'r') as nc:
+            start, count = _get(nc['pixels'], name, i)
+            if not count:
+                return None
+            grp = nc[name]
+            time = grp['time'][start:start + count].filled(np.nan)
+            index = _from_days(time) if grp.dates else pd.Index(time.astype(int))
+            return pd.Series(grp['value'][start:start + count].filled(np.nan), index=index, name=name)
+
+    def cycles(self, row, col):
+        """
+        Per cycle table of a pixel
+
+        :param row: row of the pixel
+        :param col: column of the pixel
+        :return: pandas DataFrame with the columns metrics.CYCLE_COLUMNS
+        """
+        from netCDF4 import Dataset
+
+        part, i = self.__locate(row, col)
+        with Dataset(part, 'r') as nc:
+            start, count = _get(nc['pixels'], 'cycles', i)
+            if not count:
+                return pd.DataFrame(columns=metrics.CYCLE_COLUMNS)
+            grp = nc['cycles']
+            return pd.DataFrame({name: grp[name][start:start + count].filled(np.nan)
+                                 for name in metrics.CYCLE_COLUMNS})
+
+    def pixel(self, row, col):
+        """
+        Pixel drill rebuilt from the store, as used by viz.plot
+
+        Series are read at the first access of the attribute, the cycles are available only as table
+        (see cycles).
+
+        :param row: row of the pixel
+        :param col: column of the pixel
+        :return: PixelDrill object
+        """
+        self.__locate(row, col)
+        return StoredPixel(self, (row, col))
+
+
+class StoredPixel(atoms.PixelDrill):
+    """
+    Pixel drill of a ScratchStore, the series (SERIES) are read from the store when first accessed
+
+    :param store: ScratchStore of the pixel
+    :param px: (row, col) of the pixel
+    """
+
+    __slots__ = ('store',)
+
+    def __init__(self, store, px):
+        for ith in atoms.PixelDrill.__slots__:
+            if ith not in SERIES:
+                setattr(self, ith, None)
+
+        self.store = store
+        self.position = px
+        self.sincys = []
+        self.phen = []
+        self.error = False
+
+    def __getattr__(self, name):
+        # called only for the slots not set yet, the series not read
+        if name not in SERIES:
+            raise AttributeError(name)
+        ts = self.store.series(*self.position, name)
+        setattr(self, name, ts)
+        return ts
+
+
+def store(root):
+    """Scratch store of the process for a folder"""
+    return ScratchStore.get(root)
+
+
+def _to_days(index):
+    """Dates as days since 1970-01-01, other indexes as they are"""
+    if isinstance(index, pd.DatetimeIndex):
+        return np.asarray((index - pd.Timestamp(0)) / pd.Timedelta(1, unit='D'))
+    return np.asarray(index, dtype=float)
+
+
+def _from_days(values):
+    return pd.DatetimeIndex(pd.Timestamp(0) + pd.to_timedelta(values, unit='D'))
+
+
+def _group(nc, name, columns, dtype):
+    """Group of appendable columns, created if missing"""
+    if name in nc.groups:
+        return nc[name]
+
+    grp = nc.createGroup(name)
+    grp.createDimension('n', None)
+    for column in columns:
+        grp.createVariable(column, dtype, ('n',), zlib=True, chunksizes=(_CHUNK,))
+    if name in SERIES:
+        # dates or years of the metrics
+        grp.dates = int(name.startswith('ts') or name in ('ps', 'pks'))
+    return grp
+
+
+def _set(pixels, name, n, size, start, located):
+    """
+    Start and count in a group of the pixels appended from position n of the pixels group
+
+    :param size: number of pixels appended
+    :param start: size of the group before the append
+    :param located: (position in the append, count) of the pixels with values in the group
+    """
+    if f'{name}_start' not in pixels.variables:
+        pixels.createVariable(f'{name}_start', 'i8', ('n',), zlib=True, chunksizes=(_CHUNK,), fill_value=-1)
+        pixels.createVariable(f'{name}_count', 'i4', ('n',), zlib=True, chunksizes=(_CHUNK,), fill_value=0)
+
+    counts = np.zeros(size, dtype='i4')
+    present = np.zeros(size, dtype=bool)
+    for i, count in located:
+        counts[i] = count
+        present[i] = True
+    starts = np.where(present, start + np.cumsum(counts) - counts, -1)
+    pixels[f'{name}_start'][n:n + size] = starts
+    pixels[f'{name}_count'][n:n + size] = counts
+
+
+def _get(pixels, name, i):
+    if f'{name}_start' not in pixels.variables:
+        return 0, 0
+    count = pixels[f'{name}_count'][i]
+    if np.ma.is_masked(count) or not count:
+        return 0, 0
+    return int(pixels[f'{name}_start'][i]), int(count)
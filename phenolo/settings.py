@@ -32,6 +32,16 @@ class ProjectParameters(object):
         ScratchPath =
         Sensor_type = Right now the only option is Spot but if not specyfy only the specific cleaning for
                       that particular sensor isn't applayed
+        # Date in the names of a file per date input (strftime format, default %Y%m%d)
+        date_format =
+        # Update an existing output processing only the trailing window of the pixels (True/False)
+        incremental = False
+        # netcdf, zarr (written by the workers) or zarr_netcdf (zarr converted to netCDF at the end)
+        out_format = netcdf
+        # Per cycle table as Parquet dataset next to the output (True/False)
+        cycle_table = False
+        # Cloud Optimized GeoTIFF per variable and year next to the netCDF output (True/False)
+        cog_export = False
 
         [RUN_PARAMETERS_INPUT]
         # time span in format dd/mm/yyyy,dd/mm/yyyy
@@ -43,6 +53,8 @@ class ProjectParameters(object):
         area                  =
         # Single point (E, N) , Area (Top left E, N ; Bottom right E, N)
         extent                =
+        # List of points (CSV with x, y [id] columns or GeoJSON of points), the extent is ignored
+        points                =
         # temporal range (decad) of input values (s10, s15, s30, ...)
         dek                   = s10
         # data range of values (comma separated 2 values max)
@@ -57,6 +69,8 @@ class ProjectParameters(object):
 
         [RUN_PARAMETERS_FILTER]
         mad_power = 1.5
+        # Window of the local double MAD filter in years (empty for a global filter)
+        mad_window =
 
         [RUN_PARAMETERS_SEGMENTATION]
         # Detect peaks that are at least separated by the minimum peak distance, expressed in % of the estimated season length
@@ -74,6 +88,16 @@ class ProjectParameters(object):
         #Maximum window multiplication value to calculate outlayer
         outmax                = 4
 
+        [OUTPUT_ENCODING]
+        # compression of the output (zlib level, byte shuffle) and rows per chunk
+        complevel             = 4
+        shuffle               = True
+        chunk_rows            = 1
+        # only the pixels with results are stored (compression by gathering)
+        sparse                = False
+        # encoding of a variable (dtype, fill_value, scale_factor, add_offset, least_significant_digit)
+        SeasonIntegral        = dtype=u2, scale_factor=0.5, fill_value=65535
+
         :param kwargs:
         """
 
@@ -124,6 +148,19 @@ class ProjectParameters(object):
 
                 self.decode = self.__read(config, section, 'data_decode').lower()
 
+                self.date_format = self.__read(config, section, 'date_format', fallback='') or None
+
+                self.incremental = self.__read(config, section, 'incremental', fallback='false').lower() == 'true'
+
+                self.cycle_out = self.__read(config, section, 'cycle_table', fallback='false').lower() == 'true'
+
+                self.cog_export = self.__read(config, section, 'cog_export', fallback='false').lower() == 'true'
+
+                self.out_format = self.__read(config, section, 'out_format', fallback='netcdf').lower()
+                if self.out_format not in ('netcdf', 'zarr', 'zarr_netcdf'):
+                    print('Output format unrecognised, please check: ' + str(self.out_format))
+                    sys.exit(0)
+
                 # [INFRASTRUCTURE_PARAMETERS]
                 section = 'INFRASTRUCTURE_PARAMETERS'
 
@@ -147,6 +184,12 @@ class ProjectParameters(object):
                 else:
                     self.threads_per_worker = None
 
+                chunk_memory = self.__read(config, section, 'chunk_memory', type='int')
+                self.chunk_mem = (chunk_memory or 256) * 2 ** 20
+
+                chunk_cache = self.__read(config, section, 'chunk_cache', type='int')
+                self.cache_size = (chunk_cache or 0) * 2 ** 20
+
                 # [RUN_PARAMETERS_INPUT]
                 # Time dimension
                 section = 'RUN_PARAMETERS_INPUT'
@@ -168,6 +211,11 @@ class ProjectParameters(object):
 
                 self.ext = ext
 
+                # list of points
+                self.points = self.__read(config, section, 'points', fallback='') or None
+                if self.points is not None:
+                    self.ext = None
+
                 # dekad
                 dek = self.__read(config, section, 'dek')
                 if dek in ['s5', 's10', 's15', 's30']:
@@ -216,6 +264,11 @@ class ProjectParameters(object):
                 # [RUN_PARAMETERS_FILTER]
                 section = 'RUN_PARAMETERS_FILTER'
                 self.mad_pwr = self.__read(config, section, "mad_power", type='float')
+                mad_window = self.__read(config, section, "mad_window", type='float')
+                if mad_window:
+                    self.mad_wnd = int(np.ceil(mad_window * self.yr_dek)) // 2 * 2 + 1
+                else:
+                    self.mad_wnd = None
 
                 # [RUN_PARAMETERS_SEGMENTATION]
                 section = 'RUN_PARAMETERS_SEGMENTATION'
@@ -235,6 +288,19 @@ class ProjectParameters(object):
                 self.smp = self.__read(config, section, "smp", type='int')
                 self.outmax = self.__read(config, section, "outmax", type='int')
 
+                # [OUTPUT_ENCODING] (optional)
+                section = 'OUTPUT_ENCODING'
+                out_complevel = self.__read(config, section, 'complevel', type='int')
+                self.out_complevel = 4 if out_complevel is None else out_complevel
+                self.out_shuffle = self.__read(config, section, 'shuffle', fallback='true').lower() == 'true'
+                self.out_chunk_rows = self.__read(config, section, 'chunk_rows', type='int') or 1
+                self.out_sparse = self.__read(config, section, 'sparse', fallback='false').lower() == 'true'
+                self.out_encoding = {}
+                if config.has_section(section):
+                    for name, value in config.items(section):
+                        if name not in ('complevel', 'shuffle', 'chunk_rows', 'sparse') and value != '':
+                            self.out_encoding[name] = self.__encoding(value)
+
                 self.row_nm, self.col_nm, self.dim_nm, = [None] * 3
                 self.row_val, self.col_val, self.dim_val = [None] * 3
                 self.pixel_list = None
@@ -255,6 +321,20 @@ class ProjectParameters(object):
 
         else:
             logger.debug('Default parameters loaded')
+            self.mad_wnd = None
+            self.chunk_mem = 256 * 2 ** 20
+            self.cache_size = 0
+            self.date_format = None
+            self.incremental = False
+            self.out_format = 'netcdf'
+            self.cycle_out = False
+            self.cog_export = False
+            self.points = None
+            self.out_complevel = 4
+            self.out_shuffle = True
+            self.out_chunk_rows = 1
+            self.out_sparse = False
+            self.out_encoding = {}
             self.ovrlp = 75
             self.mavspan = 180
             self.mavmet = 1.5
@@ -321,9 +401,25 @@ class ProjectParameters(object):
                     return pd.to_datetime(config.get(section, parameter))
             else:
                 return config.get(section, parameter)
+        elif 'fallback' in kwargs:
+            return config.get(section, parameter, fallback=kwargs['fallback'])
         else:
             return config.get(section, parameter)
 
+    @staticmethod
+    def __encoding(value):
+        """Encoding of an output variable from "dtype=i2, scale_factor=0.01, fill_value=-32767" """
+        encoding = {}
+        for item in value.split(','):
+            key, _, val = [i.strip() for i in item.partition('=')]
+            if key == 'dtype':
+                encoding[key] = val
+            elif key in ('least_significant_digit', 'significant_digits'):
+                encoding[key] = int(val)
+            else:
+                encoding[key] = float(val)
+        return encoding
+
     @staticmethod
     def __coord_names(data):
 
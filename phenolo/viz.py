@@ -12,10 +12,13 @@ def plot(pxldrl):
 
     # pxldrl.ts_cleaned.plot(ax=axes[1], style='y', title='TS interplated')
 
-    gaps = pxldrl.ts_filtered[~(pxldrl.ts_filtered.shift(-1).notnull() & pxldrl.ts_filtered.shift(1).notnull())][1:-1]
+    # pixels read from the scratch store may lack some of the series
+    if pxldrl.ts_filtered is not None:
+        gaps = pxldrl.ts_filtered[~(pxldrl.ts_filtered.shift(-1).notnull() &
+                                    pxldrl.ts_filtered.shift(1).notnull())][1:-1]
 
-    if len(gaps.values) > 0:
-        gaps.plot(ax=axes[1], style='ro', title='TS without strong outlayers')
+        if len(gaps.values) > 0:
+            gaps.plot(ax=axes[1], style='ro', title='TS without strong outlayers')
 
     pxldrl.ps.plot(ax=axes[2], style='g', title='TS smoothed with Savinsky Golet and braking points')
 
@@ -24,29 +27,30 @@ def plot(pxldrl):
 
     plt.tight_layout()
 
-    import math
-    col = 3
-    rows = math.ceil(len(pxldrl.phen) / col)
-
-    fig, axes = plt.subplots(rows, col, figsize=(22, 10))
-    plt.tight_layout()
-
-    for i in range(0, len(pxldrl.phen)):
-        phency = pxldrl.phen[i]
-        plt.subplot(rows, col, i + 1)
-
-        if phency.buffered is not None:
-            phency.mms.plot(style='b', title='{}'.format(phency.ref_yr.values[0]))
-        if phency.back is not None:
-            phency.back.plot(style='-', color='gold')
-        if phency.forward is not None:
-            phency.forward.plot(style='-', color='olive')
-        if phency.sb is not None:
-            phency.sbd.plot(style='r>', )
-        if phency.se is not None:
-            phency.sed.plot(style='r<', )
-        if phency.max_idx is not None:
-            phency.mms.loc[[phency.max_idx]].plot(style='rD')
+    if pxldrl.phen:
+        import math
+        col = 3
+        rows = math.ceil(len(pxldrl.phen) / col)
+
+        fig, axes = plt.subplots(rows, col, figsize=(22, 10))
+        plt.tight_layout()
+
+        for i in range(0, len(pxldrl.phen)):
+            phency = pxldrl.phen[i]
+            plt.subplot(rows, col, i + 1)
+
+            if phency.buffered is not None:
+                phency.mms.plot(style='b', title='{}'.format(phency.ref_yr.values[0]))
+            if phency.back is not None:
+                phency.back.plot(style='-', color='gold')
+            if phency.forward is not None:
+                phency.forward.plot(style='-', color='olive')
+            if phency.sb is not None:
+                phency.sbd.plot(style='r>', )
+            if phency.se is not None:
+                phency.sed.plot(style='r<', )
+            if phency.max_idx is not None:
+                phency.mms.loc[[phency.max_idx]].plot(style='rD')
 
     fig, axes = plt.subplots(7, 1, figsize=(22, 10))
     plt.tight_layout()
@@ -4,6 +4,8 @@
 """
 from __future__ import division
 
+from functools import lru_cache
+
 import numpy as np
 import scipy.signal
 
@@ -106,7 +108,8 @@ def periodogram(data, min_period=4, max_period=None):
         max_period = int(min(len(data) / MIN_FFT_CYCLES, MAX_FFT_PERIOD))
     nperseg = min(max_period * 2, len(data) // 2)  # FFT window
     freqs, power = scipy.signal.welch(
-        data, 1.0, scaling='spectrum', nperseg=nperseg)
+        data, 1.0, window=_welch_window(nperseg), scaling='spectrum',
+        nperseg=nperseg)
     periods = np.array([int(round(1.0 / freq)) for freq in freqs[1:]])
     power = power[1:]
     # take the max among frequencies having the same integer part
@@ -123,3 +126,9 @@ def periodogram(data, min_period=4, max_period=None):
     periods, power = periods[min_i: -max_i], power[min_i: -max_i]
 
     return periods, power
+
+
+@lru_cache(maxsize=16)
+def _welch_window(nperseg):
+    """Welch segment window, series of a run share the same length."""
+    return scipy.signal.get_window('hann', nperseg)
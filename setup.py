@@ -13,6 +13,11 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/pypa/Phenolo",
     packages=setuptools.find_packages(),
+    install_requires=['pandas', 'numpy', 'xarray', 'rasterio', 'netCDF4', 'dask[complete]', 'scipy', 'pyhdf',
+                      'matplotlib', 'zarr', 'numcodecs', 'pyarrow'],
+    entry_points={
+        'console_scripts': ['phenolo=phenolo.__main__:main'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: GPL-3.0-or-later",
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import configparser as cp
+import os
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(ROOT, 'Data')
+
+# options of settings.ini for the chianti sample (ENVI, 10 days SPOT NDVI)
+_CHIANTI = {'GENERAL_SETTINGS': {'in_file': os.path.join(DATA, 'chianti.img')},
+            'INFRASTRUCTURE_PARAMETERS': {'cluster': 'False', 'processes': 'False', 'n_workers': '1'},
+            'RUN_PARAMETERS_INPUT': {'extent': '', 'dek': 's10', 'rng': '0, 250', 'msk': '251, 255', 'cloud': '252',
+                                     'snow': '253', 'sea': '254'}}
+
+
+@pytest.fixture
+def parameters(tmp_path):
+    """
+    Factory of the configuration of a run on the chianti sample, written in a temporary folder
+
+    :return: function (**{section: {option: value}}) -> settings.ProjectParameters
+    """
+    from phenolo import settings
+
+    def make(**sections):
+        config = cp.ConfigParser(interpolation=None)
+        config.read(os.path.join(ROOT, 'settings.ini'))
+        config['GENERAL_SETTINGS']['out_file'] = str(tmp_path / 'out' / 'test.nc')
+        config['GENERAL_SETTINGS']['scratch_path'] = str(tmp_path / 'scratch') + os.sep
+        for values in (_CHIANTI, sections):
+            for section, options in values.items():
+                config[section].update(options)
+
+        pth = tmp_path / 'settings.ini'
+        with open(pth, 'w') as f:
+            config.write(f)
+        return settings.ProjectParameters(path=str(pth), type='ini')
+
+    return make
+
+
+def tiles(param, seed=0):
+    """
+    Row tiles of synthetic results on the grid of param, as written by the executor: a third of the pixels
+    and every fifth row have no results
+
+    :return: list of (rows slice, tile)
+    """
+    from phenolo import atoms, output
+
+    rng = np.random.default_rng(seed)
+    n_cols, n_yrs = len(param.col_val), len(output.OutputCointainer._yrs_reducer(param.dim_val))
+    written = []
+    for row in range(len(param.row_val)):
+        valid = (rng.random(n_cols) > 1 / 3) & (row % 5 != 0)
+        tile = {}
+        for i, name in enumerate(atoms.PixelRecord.metrics):
+            values = rng.integers(1, 365, (1, n_cols, n_yrs)).astype(float) if i < 3 or name == 'warn' \
+                else rng.normal(100, 30, (1, n_cols, n_yrs)).round(2)
+            tile[name] = np.where(valid[np.newaxis, :, np.newaxis], values, np.nan)
+        tile['n_seasons'] = np.where(valid, rng.integers(1, 20, n_cols), np.nan)[np.newaxis]
+        tile['err'] = np.where(valid, 0, np.nan)[np.newaxis]
+        tile['period'] = np.where(valid, 36, 0)[np.newaxis]
+        tile['valley'] = np.where(valid, 15000.0, np.nan)[np.newaxis]
+        tile['tail'] = np.where(valid[:, np.newaxis], rng.normal(100, 30, (n_cols, param.yr_dek)), np.nan)[np.newaxis]
+        written.append((slice(row, row + 1), tile))
+    return written
+
+
+@pytest.fixture
+def outputs(parameters):
+    """
+    Dense and sparse outputs of the same synthetic results on the grid of the chianti sample
+
+    :return: (param, path of the dense output, path of the sparse output)
+    """
+    from phenolo import output, reader
+
+    param = parameters()
+    cube = reader.ingest(param)
+    os.makedirs(param.outFilePth, exist_ok=True)
+
+    paths = []
+    for name, sparse in (('dense', False), ('sparse', True)):
+        param.out_sparse = sparse
+        out = output.OutputCointainer(cube, param, name=name)
+        for rows, tile in tiles(param):
+            out.fill(rows, tile)
+        out.close()
+        paths.append(os.path.join(param.outFilePth, name + '.nc'))
+    param.out_sparse = False
+    return (param, *paths)
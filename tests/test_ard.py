@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+
+import numpy as np
+
+from phenolo import ard, reader
+from tests.conftest import DATA
+
+
+def test_store_whole_input(parameters, tmp_path):
+    """The store of a run with extent and time window serves the whole input"""
+    for ext in ('.img', '.hdr'):
+        shutil.copy(os.path.join(DATA, 'chianti' + ext), tmp_path)
+    in_file = {'in_file': str(tmp_path / 'chianti.img')}
+
+    cropped = parameters(GENERAL_SETTINGS=in_file,
+                         RUN_PARAMETERS_INPUT={'extent': '11.2,43.5;11.3,43.45', 'exm_start': '01/01/2005',
+                                               'exm_end': '31/12/2005'})
+    store = ard.rechunk(cropped, tile=16)
+    assert os.path.isdir(store)
+
+    param = parameters(GENERAL_SETTINGS=in_file)
+    expected = reader.ingest(param, ard=False).values
+    assert reader._ard_store(param.inFilePth) == store
+    np.testing.assert_array_equal(reader.ingest(param).values, expected)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+from types import SimpleNamespace
+
+import dask.array as da
+import numpy as np
+import pytest
+import xarray as xr
+
+from phenolo import executor
+
+
+@pytest.mark.parametrize('budget', [1, 3, 7, 100])
+def test_blocks_within_memory(budget):
+    """Blocks follow the dask chunks, cover all the rows once and stay within chunk_memory"""
+    cube = xr.DataArray(da.zeros((20, 37, 11), dtype='u1', chunks=(20, 10, 11)), dims=('time', 'lat', 'lon'))
+    param = SimpleNamespace(row_nm='lat', chunk_mem=budget * 20 * 11)
+
+    n_block = executor._block_rows(cube, param)
+    blocks = list(executor._row_blocks(cube, param.row_nm, 0, n_block))
+
+    assert n_block == budget
+    np.testing.assert_array_equal(np.concatenate([np.arange(i.start, i.stop) for i in blocks]), np.arange(37))
+    assert all(i.stop - i.start <= budget for i in blocks)
+    # no block spans two chunks
+    assert all(i.start // 10 == (i.stop - 1) // 10 for i in blocks)
+
+
+def test_block_of_a_row():
+    """A row larger than chunk_memory is read alone"""
+    cube = xr.DataArray(np.zeros((20, 5, 11), dtype='u2'), dims=('time', 'lat', 'lon'))
+    param = SimpleNamespace(row_nm='lat', chunk_mem=10)
+
+    assert executor._block_rows(cube, param) == 1
+    assert list(executor._row_blocks(cube, param.row_nm, 2, 1)) == [slice(2, 3), slice(3, 4), slice(4, 5)]
+    assert list(executor._row_blocks(cube, param.row_nm, 2)) == [slice(2, 5)]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+
+from phenolo import export, results
+
+
+@pytest.mark.parametrize('kind', ['dense', 'sparse'])
+def test_export_cogs(outputs, tmp_path, kind):
+    """A GeoTIFF per variable and year with the values of the output at the coordinates of its pixels"""
+    param, dense, sparse = outputs
+    pth = dense if kind == 'dense' else sparse
+    written = export.export_cogs(pth, folder=str(tmp_path / 'cog'), workers=1,
+                                 variables=['StartWeek', 'SeasonIntegral', 'PixelCriticalError'])
+
+    import rasterio
+
+    with results.Results(pth) as res:
+        assert sorted(os.path.basename(i) for i in written) == sorted(
+            ['PixelCriticalError.tif'] + [f'{name}_{year}.tif' for name in ('StartWeek', 'SeasonIntegral')
+                                          for year in res.years])
+
+        for name, variable, dtype, nodata in (('StartWeek_2005', 'sb', 'int16', -32767),
+                                              ('SeasonIntegral_2005', 'si', 'float32', None),
+                                              ('PixelCriticalError', 'err', 'int16', -32767)):
+            with rasterio.open(str(tmp_path / 'cog' / f'{name}.tif')) as tif:
+                assert tif.dtypes[0] == dtype
+                assert tif.nodata == nodata or np.isnan(tif.nodata) and nodata is None
+                assert tif.crs.to_epsg() == 4326
+                rows = [tif.index(res.x[0], y)[0] for y in res.y]
+                cols = [tif.index(x, res.y[0])[1] for x in res.x]
+                values = tif.read(1, masked=True)[np.ix_(rows, cols)].astype(float).filled(np.nan)
+
+            expected = res.year(variable, 2005) if variable != 'err' else res.year(variable, None)
+            np.testing.assert_array_equal(values, expected, err_msg=name)
+
+
+def test_write_cog(tmp_path):
+    """A south up output larger than a tile is written north up, tiled, with overviews and its nodata"""
+    from netCDF4 import Dataset
+    import rasterio
+
+    lat, lon = 40 + np.arange(1100) * 0.01, 10 + np.arange(1300) * 0.01
+    values = np.arange(lat.size * lon.size * 2).reshape(lat.size, lon.size, 2) % 365
+    mask = np.zeros(values.shape, dtype=bool)
+    mask[:100, :200] = True
+
+    pth = str(tmp_path / 'south_up.nc')
+    with Dataset(pth, 'w') as root:
+        for name, coord in (('lat', lat), ('lon', lon), ('time', [2001, 2002])):
+            root.createDimension(name, len(coord))
+            root.createVariable(name, 'f8', (name,))[:] = coord
+        root.createVariable('PixelCriticalError', 'i2', ('lat', 'lon'), fill_value=-32767)[:] = 0
+        var = root.createVariable('StartWeek', 'i2', ('lat', 'lon', 'time'), fill_value=-32767)
+        var[:] = np.ma.masked_array(values, mask)
+
+    dst = export._write_cog(pth, 'StartWeek', 1, str(tmp_path / 'StartWeek_2002.tif'), 'EPSG:4326')
+    assert not os.path.exists(dst + '.tmp.tif')
+
+    with rasterio.open(dst) as tif:
+        assert tif.tags(ns='IMAGE_STRUCTURE')['LAYOUT'] == 'COG'
+        assert tif.block_shapes == [(512, 512)]
+        assert tif.compression.name == 'deflate'
+        # overviews down to a single tile
+        assert tif.overviews(1) and max(tif.shape) / tif.overviews(1)[-1] <= 512
+        assert tif.nodata == -32767
+
+        assert tif.transform.e < 0
+        np.testing.assert_allclose(tif.xy(0, 0), (lon[0], lat[-1]))
+        np.testing.assert_allclose(tif.xy(lat.size - 1, lon.size - 1), (lon[-1], lat[0]))
+
+        band = tif.read(1)
+        np.testing.assert_array_equal(band[::-1][~mask[..., 1]], values[..., 1][~mask[..., 1]])
+        assert (band[::-1][mask[..., 1]] == -32767).all()
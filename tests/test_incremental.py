@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+
+from phenolo import analysis, atoms, executor, output, reader, runplan
+
+# pixels of the chianti sample, a grid over the whole sample
+_PIXELS = [(row, col) for row in range(2, 37, 12) for col in range(3, 66, 13)]
+
+
+def _record(param, plan, data, row, col, window=None):
+    return executor.process(col, window, data=data[:, row, :], row=row, param=param, plan=plan,
+                            action=analysis.phenolo)
+
+
+def _window(record, plan, param):
+    tail = np.full(plan.yr_dek, np.nan, dtype=np.float32) if record.tail is None else record.tail
+    return output.window(record.period, record.valley, tail, plan.yr_dys, param)
+
+
+@pytest.mark.parametrize('cut', [9, 30])
+def test_update_within_tolerance(parameters, cut):
+    """The years computed again by an incremental update are the ones of a full run within the tolerance of
+    analysis.phenolo: days within 10 for most of the pixel years, integrals within 5%"""
+    param = parameters()
+    data = reader.ingest(param).transpose(param.dim_nm, param.row_nm, param.col_nm).values
+    full = runplan.RunPlan(param)
+    previous = runplan.RunPlan(param, full.time[:-cut])
+
+    days = {name: [] for name in ('sb', 'se', 'sl')}
+    ratio = []
+    for row, col in _PIXELS:
+        before = _record(param, previous, data[:-cut], row, col)
+        window = _window(before, full, param)
+        assert window is not None
+
+        expected = _record(param, full, data, row, col)
+        updated = _record(param, full, data, row, col, window)
+        assert updated.since > 0, 'the window has been processed as a whole series'
+        assert updated.since == full.years.searchsorted(window['start'].year + 1)
+
+        values, reference = updated.values[:, updated.since:], expected.values[:, updated.since:]
+        for name in days:
+            i = atoms.PixelRecord.metrics.index(name)
+            diff = np.abs(values[i] - reference[i])
+            if name != 'sl':
+                # days of the year, a season starting at the end of December is close to one in January
+                diff = np.minimum(diff, 365 - diff)
+            days[name] += np.where(np.isnan(values[i]) & np.isnan(reference[i]), 0, diff).tolist()
+
+        i = atoms.PixelRecord.metrics.index('si')
+        both = np.isfinite(values[i]) & np.isfinite(reference[i])
+        ratio += (np.abs(values[i] - reference[i])[both] / np.abs(reference[i][both])).tolist()
+
+    for name, diff in days.items():
+        diff = np.nan_to_num(diff, nan=np.inf)
+        assert np.mean(diff == 0) > 0.5, name
+        assert np.mean(diff <= 10) > 0.8, name
+    assert np.mean(np.asarray(ratio) <= 0.05) > 0.8
+
+
+def test_state_of_the_update(parameters):
+    """The state written by an update restarts from a valley not earlier than the previous one"""
+    param = parameters()
+    data = reader.ingest(param).transpose(param.dim_nm, param.row_nm, param.col_nm).values
+    full = runplan.RunPlan(param)
+    previous = runplan.RunPlan(param, full.time[:-30])
+
+    for row, col in _PIXELS[:4]:
+        before = _record(param, previous, data[:-30], row, col)
+        updated = _record(param, full, data, row, col, _window(before, full, param))
+        assert updated.period == before.period
+        assert updated.valley >= before.valley
+        assert updated.tail.shape == (full.yr_dek,) and np.isfinite(updated.tail).any()
+        if updated.valley == before.valley:
+            # the tail is the smoothed series of the previous run at the same observations
+            np.testing.assert_allclose(updated.tail, before.tail, rtol=1e-6)
+
+
+def test_new_year_full_run(parameters):
+    """An output can not be updated with an input that has years it doesn't have"""
+    param = parameters()
+    cube = reader.ingest(param)
+    os.makedirs(param.outFilePth, exist_ok=True)
+
+    dim_val = param.dim_val
+    param.dim_val = dim_val[dim_val < np.datetime64('2013-01-01')]
+    output.OutputCointainer(cube, param, name=param.outName).close()
+    assert output.OutputCointainer._resumable(os.path.join(param.outFilePth, param.outName + '.nc'), param)
+
+    param.dim_val = dim_val
+    assert not output.OutputCointainer._resumable(os.path.join(param.outFilePth, param.outName + '.nc'), param)
+
+
+def test_shorter_input_full_run(parameters):
+    """An output can not be updated with an input that ends before its last observation"""
+    param = parameters()
+    cube = reader.ingest(param)
+    os.makedirs(param.outFilePth, exist_ok=True)
+    output.OutputCointainer(cube, param, name=param.outName).close()
+
+    param.dim_val = param.dim_val[:-3]
+    assert not output.OutputCointainer._resumable(os.path.join(param.outFilePth, param.outName + '.nc'), param)
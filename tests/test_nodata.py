@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from phenolo import nodata
+
+_TIME = pd.date_range('2001-01-01', periods=36 * 4, freq='10D')
+
+
+def _climate_fx(ts):
+    """Gap filling of a single series as done before the vectorised climate_fill (SPOT codes)"""
+    tsm = ts.mask(ts > 250)
+
+    # interpolate single values
+    ts_s = tsm.where(~(tsm.shift(-1).notnull() & tsm.shift(1).notnull()), tsm.interpolate(method='linear'))
+
+    tsm = ts_s.mask(ts == 253, 0)
+
+    if ts_s.isnull().sum():
+        # Rough climatic indices without nan included
+        count = tsm.groupby([ts.index.month, ts.index.day]).count()
+        cl = tsm.groupby([ts.index.month, ts.index.day]).median()
+        clm = cl.mask(count < count.max() * 0.2)
+
+        # the monthly and quarterly minimum broadcast to the (month, day) slots, pandas doesn't align them
+        months = clm.index.get_level_values(0)
+        if clm.isnull().sum():
+            clm = clm.mask(clm.isnull(), tsm.groupby([ts.index.month]).min().reindex(months).values)
+        if clm.isnull().sum():
+            clm = clm.mask(clm.isnull(), tsm.groupby([ts.index.quarter]).min().reindex((months - 1) // 3 + 1).values)
+        if clm.isnull().sum():
+            clm = clm.mask(clm.isnull(), tsm.min())
+
+        nans = ts.where(tsm.isnull()).dropna()
+
+        for ith in nans.index:
+            tsm.loc[ith] = clm.loc[ith.month, ith.day]
+
+    return tsm
+
+
+def test_climate_fx_as_before():
+    """The vectorised gap filling gives the values of the per series one, from a few codes to mostly codes"""
+    # dekads of 8 years
+    time = pd.DatetimeIndex([pd.Timestamp(year, month, day) for year in range(2001, 2009) for month in range(1, 13)
+                             for day in (1, 11, 21)])
+    rng = np.random.default_rng(0)
+    axis = nodata.ClimateAxis(time)
+    for i in range(300):
+        raw = rng.integers(0, 251, time.size).astype(np.uint8)
+        gaps = rng.random(time.size) < i / 300
+        raw[gaps] = rng.integers(251, 256, gaps.sum())
+        ts = pd.Series(raw, index=time)
+
+        expected = _climate_fx(ts)
+        filled = nodata.climate_fx(ts, axis=axis)
+        np.testing.assert_array_equal(filled.values, expected.values.astype(float), err_msg=str(i))
+
+
+def test_codes_above_spot_range():
+    """Values above 250 are no data whatever the range of the values, snow is filled as 0"""
+    decoder = nodata.RawDecoder(SimpleNamespace(max=200.0, snow=253))
+    raw = np.tile(np.arange(0, 250, 250 / _TIME.size).astype(np.uint8), (2, 1))
+    raw[0, 10], raw[1, 20], raw[1, 40] = 220, 253, 251
+
+    filled = nodata.climate_fill(raw, nodata.ClimateAxis(_TIME), decoder)
+    assert filled.dtype == np.float32
+    assert filled[0, 10] == 220
+    assert filled[1, 20] == 0
+    # a single gap is interpolated
+    assert filled[1, 40] == (float(raw[1, 39]) + raw[1, 41]) / 2
+
+
+def test_float_values_keep_their_precision():
+    """Float values are filled in their own type"""
+    rng = np.random.default_rng(0)
+    raw = rng.uniform(0, 200, (3, _TIME.size))
+    raw[:, ::7] = 255
+
+    filled = nodata.climate_fill(raw, nodata.ClimateAxis(_TIME), nodata.RawDecoder())
+    assert filled.dtype == np.float64
+    kept = raw <= 250
+    np.testing.assert_array_equal(filled[kept], raw[kept])
+
+
+def test_scale_and_offset():
+    """Scale and offset are applied in double precision to the filled values"""
+    raw = np.tile(np.arange(10, 154, dtype=np.uint8), (2, 1))
+    raw[0, 50] = 252
+    axis = nodata.ClimateAxis(_TIME)
+    plain = nodata.climate_fill(raw, axis, nodata.RawDecoder())
+
+    decoder = nodata.RawDecoder(SimpleNamespace(scale=0.004, offset=0.08, cloud=252))
+    scaled = nodata.climate_fill(raw, axis, decoder)
+    assert scaled.dtype == np.float64
+    np.testing.assert_array_equal(scaled, plain.astype(np.float64) * 0.004 - 0.08)
+
+    # the codes are decoded as nan
+    decoded = decoder.decode(raw)
+    assert np.isnan(decoded[0, 50])
+    np.testing.assert_array_equal(decoded[1], raw[1] * 0.004 - 0.08)
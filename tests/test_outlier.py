@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from phenolo import outlier
+
+
+def _series(x, mad_pwr):
+    """Double MAD of a single series as computed before the batched filter, gaps ignored"""
+    m = np.nanmedian(x)
+    abs_dev = np.abs(x - m)
+    lower = np.nanmedian(np.where(x <= m, abs_dev, np.nan))
+    higher = np.nanmedian(np.where(x >= m, abs_dev, np.nan))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mad = abs_dev / np.where(x < m, lower, higher)
+    mad = np.where(x == m, 0, mad)
+    return x if m == 0 else np.where(mad >= mad_pwr, np.nan, x)
+
+
+def _sliding(x, mad_pwr, window):
+    """Each value filtered with the statistics of the window centred on it, kept inside the series"""
+    n = x.size
+    window = window // 2 * 2 + 1
+    fx = np.empty_like(x)
+    for i in range(n):
+        start = min(max(i - window // 2, 0), n - window)
+        fx[i] = _series(x[start:start + window], mad_pwr)[i - start]
+    return fx
+
+
+@pytest.fixture
+def series():
+    """NDVI like series (integer values, many ties) with spikes and a few gaps"""
+    rng = np.random.default_rng(3)
+    t = np.arange(180)
+    x = np.rint(120 + 60 * np.sin(2 * np.pi * t / 36)[np.newaxis] + rng.normal(0, 8, (40, t.size)))
+    x[rng.random(x.shape) < 0.04] = 250
+    x[rng.random(x.shape) < 0.04] = 0
+    x[rng.random(x.shape) < 0.03] = np.nan
+    x[0] = 0
+    return x
+
+
+def test_batched_as_series(series):
+    fx = outlier.dblMAD(series, 2.8)
+    for x, f in zip(series, fx):
+        np.testing.assert_array_equal(f, _series(x, 2.8))
+        np.testing.assert_array_equal(f, outlier.dblMAD(x, 2.8))
+
+
+@pytest.mark.parametrize('window', [18, 37, 72])
+def test_sliding_as_series(series, window):
+    fx = outlier.dblMAD_local(series, 2.8, window)
+    for x, f in zip(series, fx):
+        np.testing.assert_array_equal(f, _sliding(x, 2.8, window))
+        np.testing.assert_array_equal(f, outlier.dblMAD_local(x, 2.8, window))
+
+
+def test_sliding_longer_than_series(series):
+    np.testing.assert_array_equal(outlier.dblMAD_local(series, 2.8, 500), outlier.dblMAD(series, 2.8))
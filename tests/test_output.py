@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+
+from phenolo import output, reader
+from tests.conftest import tiles
+
+
+@pytest.mark.parametrize('rows', [slice(None), slice(3, 11), slice(30, None)])
+def test_densify_sparse(outputs, rows):
+    """A sparse output read back on the grid is the dense output of the same results"""
+    param, dense, sparse = outputs
+    with Dataset(dense, 'r') as d_root, Dataset(sparse, 'r') as s_root:
+        assert 'pixel' in s_root.dimensions and 'pixel' not in d_root.dimensions
+        # only the pixels with results are stored
+        assert len(s_root.dimensions['pixel']) < len(param.row_val) * len(param.col_val)
+
+        for name in output.OutputCointainer._variables.values():
+            expected = output.densify(d_root[name], rows)
+            values = output.densify(s_root[name], rows)
+            assert values.shape == expected.shape
+            np.testing.assert_array_equal(np.ma.getmaskarray(values), np.ma.getmaskarray(expected), err_msg=name)
+            np.testing.assert_array_equal(values.compressed(), expected.compressed())
+
+        for name in ('Period', 'RestartValley', 'Tail'):
+            expected = np.ma.filled(output.densify(d_root['state'][name], rows).astype(float), np.nan)
+            values = np.ma.filled(output.densify(s_root['state'][name], rows).astype(float), np.nan)
+            np.testing.assert_array_equal(values, expected)
+
+
+def test_zarr_to_netcdf(parameters):
+    """A Zarr store converted to netCDF is the netCDF output of the same results: variables, encodings,
+    values and QC report"""
+    param = parameters()
+    cube = reader.ingest(param)
+    os.makedirs(param.outFilePth, exist_ok=True)
+
+    direct = output.OutputCointainer(cube, param, name='direct')
+    store = output.ZarrContainer(cube, param, name='store')
+    for rows, tile in tiles(param):
+        direct.fill(rows, tile)
+        store.qc.merge(store.write(rows, tile))
+    direct.close()
+    store.close()
+    store.to_netcdf(cube, param, name='converted')
+
+    def qc_report(name):
+        with open(os.path.join(param.outFilePth, name + '_qc.json')) as f:
+            return json.load(f)
+
+    # the report of the store is the one of the netCDF output, see test_qc
+    assert qc_report('converted') == qc_report('store')
+
+    with Dataset(os.path.join(param.outFilePth, 'direct.nc'), 'r') as d_root, \
+            Dataset(os.path.join(param.outFilePth, 'converted.nc'), 'r') as c_root:
+        assert d_root.groups.keys() == c_root.groups.keys()
+        for d_grp, c_grp in ((d_root, c_root), (d_root['state'], c_root['state'])):
+            assert d_grp.variables.keys() == c_grp.variables.keys()
+            for name, expected in d_grp.variables.items():
+                var = c_grp[name]
+                assert (var.dimensions, var.dtype) == (expected.dimensions, expected.dtype), name
+                assert var.filters() == expected.filters(), name
+                assert {i: str(var.getncattr(i)) for i in var.ncattrs()} == \
+                    {i: str(expected.getncattr(i)) for i in expected.ncattrs()}, name
+                np.testing.assert_array_equal(np.ma.getmaskarray(var[:]), np.ma.getmaskarray(expected[:]), name)
+                np.testing.assert_array_equal(var[:].compressed(), expected[:].compressed(), name)
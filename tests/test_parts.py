@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from phenolo import analysis, atoms, cycles, executor, output, reader, runplan, scratch
+
+
+def test_scratch_and_cycles(parameters):
+    """Pixel drills written by the part writers of the process are read back from the store and the table"""
+    param = parameters(GENERAL_SETTINGS={'retain_scratch': 'True', 'cycle_table': 'True'})
+    data = reader.ingest(param).transpose(param.dim_nm, param.row_nm, param.col_nm).values
+    plan = runplan.RunPlan(param)
+
+    records = [executor.process(col, data=data[:, 3, :], row=3, param=param, plan=plan, action=analysis.phenolo)
+               for col in (5, 6, 7)]
+    output.flush()
+
+    store = scratch.ScratchStore(os.path.join(param.scratch_pth, 'scratch'))
+    table = cycles.read(os.path.join(param.outFilePth, param.outName + '_cycles'))
+    for record in records:
+        ts = store.series(3, record.position[1], 'ts_raw')
+        np.testing.assert_array_equal(ts.values, data[:, 3, record.position[1]].astype(float))
+        stored = store.cycles(3, record.position[1])
+        assert len(stored) == (table['col'] == record.position[1]).sum() > 0
+
+    assert len(os.listdir(os.path.join(param.scratch_pth, 'scratch'))) == 1
+
+
+def test_scratch_flush(tmp_path):
+    """Flushes write the buffered pixels at once, a pixel is read back series by series on request"""
+    store = scratch.ScratchStore(str(tmp_path))
+    time = pd.date_range('2001-01-01', periods=6, freq='10D')
+    drills = []
+    for col in range(3):
+        pxldrl = atoms.PixelDrill(pd.Series(np.arange(6.) + col, index=time), (1, col))
+        if col != 1:
+            pxldrl.ps = pd.Series(np.arange(col + 2.), index=time[:col + 2])
+        drills.append(pxldrl)
+        store.append(pxldrl)
+        if not col:
+            # appended to the groups written by the first flush
+            store.flush()
+    store.flush()
+
+    read = []
+    series = store.series
+    store.series = lambda *args: read.append(args[2]) or series(*args)
+    for col, pxldrl in enumerate(drills):
+        stored = store.pixel(1, col)
+        pd.testing.assert_series_equal(stored.ts_raw, pxldrl.ts_raw, check_names=False, check_freq=False)
+        if pxldrl.ps is None:
+            assert stored.ps is None
+        else:
+            pd.testing.assert_series_equal(stored.ps, pxldrl.ps, check_names=False, check_freq=False)
+        assert stored.ps is stored.ps
+    assert read == ['ts_raw', 'ps'] * 3
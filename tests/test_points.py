@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from phenolo import analysis, executor, points, reader, runplan
+
+
+def test_table_round_trip(parameters):
+    """The table of the points written by write is read back as it is"""
+    param = parameters()
+    cube = reader.ingest(param)
+    os.makedirs(param.outFilePth, exist_ok=True)
+    data = cube.transpose(param.dim_nm, param.row_nm, param.col_nm).values
+    plan = runplan.RunPlan(param)
+
+    rows, cols = np.array([2, 17, 30]), np.array([5, 40, 61])
+    frame = pd.DataFrame({'id': ['a', 'b', 'c', 'd'],
+                          'x': np.append(np.asarray(param.col_val)[cols], 0.0),
+                          'y': np.append(np.asarray(param.row_val)[rows], 0.0)})
+    located = points.locate(frame, param)
+    # the last point is outside the grid
+    assert located['id'].tolist() == ['a', 'b', 'c']
+    np.testing.assert_array_equal(located['row'].values, rows)
+    np.testing.assert_array_equal(located['col'].values, cols)
+
+    # the second point is not analysed
+    records = {i: executor.process(col, data=data[:, row, :], row=row, param=param, plan=plan,
+                                   action=analysis.phenolo)
+               for i, (row, col) in enumerate(zip(rows, cols)) if i != 1}
+    table = points.table(located, records, plan.years)
+    assert len(table) == len(located) * len(plan.years)
+    assert table['analysed'].tolist() == np.repeat([True, False, True], len(plan.years)).tolist()
+    assert table.loc[~table['analysed'], 'sb'].isnull().all()
+
+    first = table[table['id'] == 'a']
+    np.testing.assert_array_equal(first['sb'].values, records[0].values[0])
+    assert (first['n_seasons'] == records[0].season).all()
+
+    pth = points.write(table, param)
+    assert pth == os.path.join(param.outFilePth, param.outName + '_points.parquet')
+    pd.testing.assert_frame_equal(pd.read_parquet(pth), table)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+import numpy as np
+
+from phenolo import output, qc, reader
+from tests.conftest import tiles
+
+
+def _close(a, b):
+    """Reports equal but for the rounding of the merged moments"""
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_close(a[i], b[i]) for i in a)
+    if isinstance(a, float):
+        return np.isclose(a, b)
+    return a == b
+
+
+def test_merge(parameters):
+    param = parameters()
+    reader.ingest(param)
+    years = output.OutputCointainer._yrs_reducer(param.dim_val)
+    written = tiles(param)
+
+    whole, merged = (qc.QCStats(years, output.OutputCointainer._variables) for _ in range(2))
+    for rows, tile in written:
+        whole.update(tile, output._valid(tile))
+    for part in (written[:7], written[7:]):
+        stats = qc.QCStats(years, output.OutputCointainer._variables)
+        for rows, tile in part:
+            stats.update(tile, output._valid(tile))
+        merged.merge(stats)
+
+    assert _close(whole.report(), merged.report())
+
+
+def test_zarr_report(outputs):
+    """The report of a zarr output is the one of the netCDF output, every pixel of the grid is counted"""
+    param, dense, sparse = outputs
+    store = output.ZarrContainer(reader.ingest(param), param, name='tiles')
+    for rows, tile in tiles(param):
+        store.qc.merge(store.write(rows, tile))
+    store.close()
+
+    reports = []
+    for name in ('dense', 'sparse', 'tiles'):
+        with open(os.path.join(param.outFilePth, name + '_qc.json')) as f:
+            reports.append(json.load(f))
+
+    assert reports[0]['pixels'] == len(param.row_val) * len(param.col_val)
+    assert _close(reports[0], reports[1]) and _close(reports[0], reports[2])
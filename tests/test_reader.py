@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import re
+
+import numpy as np
+import pytest
+
+from phenolo import reader
+from tests.conftest import DATA
+
+# pixel centres of a 0.5 wide grid, descending as the latitudes of a raster
+_CRD = np.arange(10.25, 5, -0.5)
+
+
+def test_point_window():
+    assert reader._axis_window(slice(7.3, 7.3), _CRD) == slice(6, 7)
+    # up to half a pixel beyond the centre of the edge pixels
+    assert reader._axis_window(slice(10.45, 10.45), _CRD) == slice(0, 1)
+
+
+@pytest.mark.parametrize('value', [10.6, 4.9, 100.0])
+def test_point_outside(value):
+    with pytest.raises(ValueError, match='Extent outside the data'):
+        reader._axis_window(slice(value, value), _CRD)
+    with pytest.raises(ValueError, match='Extent outside the data'):
+        reader._window({'time': slice(None), 'x': slice(value, value), 'y': slice(value, value)}, _CRD, _CRD)
+
+
+def test_extent_clipped(caplog):
+    with caplog.at_level(logging.INFO, logger='phenolo.reader'):
+        assert reader._axis_window(slice(12.0, 9.0), _CRD) == slice(0, 3)
+    assert 'partly outside the data' in caplog.text
+
+    with pytest.raises(ValueError, match='Extent outside the data'):
+        reader._axis_window(slice(20.0, 15.0), _CRD)
+
+
+def _envi(path, hdr_text, data, interleave, dtype):
+    """Write data (bands, lines, samples) as an ENVI file with the header of the chianti sample"""
+    order = {'bsq': (0, 1, 2), 'bil': (1, 0, 2), 'bip': (1, 2, 0)}[interleave]
+    np.ascontiguousarray(data.astype(dtype).transpose(order)).tofile(str(path))
+    codes = {'u1': 1, '>i2': 2, '<i2': 2, '<f4': 4}
+    hdr_text = re.sub(r'interleave = \w+', f'interleave = {interleave}', hdr_text)
+    hdr_text = re.sub(r'data type = \d+', f'data type = {codes[dtype]}', hdr_text)
+    hdr_text = re.sub(r'byte order = \d', f'byte order = {int(dtype.startswith(">"))}', hdr_text)
+    with open(os.path.splitext(str(path))[0] + '.hdr', 'w') as f:
+        f.write(hdr_text)
+    return str(path)
+
+
+@pytest.mark.parametrize('interleave,dtype', [('bsq', 'u1'), ('bil', '>i2'), ('bip', '<f4'), ('bil', '<i2')])
+def test_envi_as_rasterio(tmp_path, interleave, dtype):
+    """The memory mapped ENVI reader returns what GDAL reads, for every interleave and byte order"""
+    import rasterio
+
+    with rasterio.open(os.path.join(DATA, 'chianti.img')) as src:
+        data = src.read()
+    with open(os.path.join(DATA, 'chianti.hdr')) as f:
+        hdr_text = f.read()
+
+    path = _envi(tmp_path / 'stack.img', hdr_text, data, interleave, dtype)
+    envi = reader.EnviArray(path, reader._read_envi_hdr(os.path.splitext(path)[0] + '.hdr'))
+    with rasterio.open(path) as src:
+        expected = src.read()
+        window = src.read(window=rasterio.windows.Window(10, 5, 30, 20))
+
+    np.testing.assert_array_equal(np.asarray(envi[:]), expected)
+    np.testing.assert_array_equal(np.asarray(envi[:, 5:25, 10:40]), window)
+
+    sub = reader.EnviArray(path, reader._read_envi_hdr(os.path.splitext(path)[0] + '.hdr'), slice(5, 25),
+                           slice(10, 40))
+    np.testing.assert_array_equal(np.asarray(sub[100:120]), window[100:120])
+
+
+def test_ingest_envi(parameters):
+    """The cube read from an ENVI file is the GDAL read of the file, also for an extent"""
+    import rasterio
+
+    with rasterio.open(os.path.join(DATA, 'chianti.img')) as src:
+        expected = src.read()
+        transform = src.transform
+
+    cube = reader.ingest(parameters())
+    np.testing.assert_array_equal(cube.transpose('time', 'lat', 'lon').values, expected)
+
+    # an area by its corners (top left, bottom right), pixel centres included
+    x0, y0 = transform * (10.5, 5.5)
+    x1, y1 = transform * (39.5, 24.5)
+    cube = reader.ingest(parameters(RUN_PARAMETERS_INPUT={'extent': f'{x0},{y0};{x1},{y1}'}))
+    np.testing.assert_array_equal(cube.transpose('time', 'lat', 'lon').values, expected[:, 5:25, 10:40])
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from phenolo import results
+
+
+@pytest.mark.parametrize('kind', ['dense', 'sparse'])
+def test_points_outside_grid(outputs, kind):
+    """Points further than half a pixel from the grid have no pixel, nan values and inside False"""
+    param, dense, sparse = outputs
+    with results.Results(dense if kind == 'dense' else sparse) as res:
+        step_x, step_y = abs(res.x[1] - res.x[0]), abs(res.y[1] - res.y[0])
+        x = np.array([res.x[3], res.x.max() + 0.4 * step_x, res.x.max() + 0.6 * step_x, res.x[5]])
+        y = np.array([res.y[1], res.y[2], res.y[2], res.y.min() - 2 * step_y])
+
+        rows, cols = res.locate(x, y)
+        np.testing.assert_array_equal(rows, [1, 2, -1, -1])
+        np.testing.assert_array_equal(cols, [3, res.x.size - 1, -1, -1])
+
+        table = res.points(x, y)
+        inside = table['inside'].groupby(level='point').first()
+        np.testing.assert_array_equal(inside.values, [True, True, False, False])
+        assert table.loc[[2, 3]].drop(columns='inside').isnull().all().all()
+        expected = res.pixels([1, 2], [3, res.x.size - 1])
+        np.testing.assert_array_equal(table.loc[[0, 1]].drop(columns='inside').values, expected.values)
+
+
+def test_sparse_as_dense(outputs):
+    """Queries on a sparse output give the values of the dense output of the same results"""
+    param, dense, sparse = outputs
+    with results.Results(dense) as d_res, results.Results(sparse) as s_res:
+        for name in ('sb', 'se', 'sl', 'spi', 'si', 'cf', 'afi', 'warn', 'n_seasons', 'err'):
+            np.testing.assert_array_equal(s_res.year(name, 2005), d_res.year(name, 2005), err_msg=name)
+            np.testing.assert_array_equal(s_res.bbox(name, 11.2, 43.6, 11.5, 43.75)[0],
+                                          d_res.bbox(name, 11.2, 43.6, 11.5, 43.75)[0], err_msg=name)
+
+        rows, cols = [0, 4, 13, 36], [0, 20, 41, 65]
+        np.testing.assert_array_equal(s_res.pixels(rows, cols).values, d_res.pixels(rows, cols).values)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.signal import savgol_filter
+
+from phenolo import analysis, atoms, chronos, filters, metrics, reader, runplan
+
+# pixels of the chianti sample, a grid over the whole sample
+_PIXELS = [(row, col) for row in range(2, 37, 6) for col in range(3, 66, 8)]
+
+
+def _mpd(season_lng, tr):
+    """Minimum valley distance as computed inline by metrics.valley_detection"""
+    if 200.0 < season_lng < 400.0:
+        return int(season_lng * 2 / 3)
+    elif season_lng < 200:
+        return int(season_lng * 1 / 3)
+    else:
+        return int(season_lng * (tr - tr * 1 / 3) / 100)
+
+
+@pytest.mark.parametrize('dek', ['s5', 's10', 's30'])
+def test_constants(parameters, dek):
+    """The constants of the plan are the ones computed per pixel without it"""
+    param = parameters(RUN_PARAMETERS_INPUT={'dek': dek})
+    cube = reader.ingest(param)
+    plan = runplan.RunPlan(param)
+
+    assert (plan.yr_dys, plan.yr_dek) == chronos.day_calc(dek)
+    np.testing.assert_array_equal(plan.posix, plan.daily.astype(np.int64) / 10 ** 9)
+    np.testing.assert_array_equal(plan.years, np.unique(cube[param.dim_nm].dt.year))
+
+    for season_lng in np.arange(0, 1500, 0.5):
+        assert plan.mpd(season_lng) == _mpd(season_lng, param.ovrlp), season_lng
+
+    pxldrl = atoms.PixelDrill(None, (0, 0))
+    pxldrl.ts_d = pd.Series(np.random.default_rng(0).normal(100, 30, plan.daily.size), index=plan.daily)
+    np.testing.assert_allclose(filters.sv(pxldrl, param, plan.sg_coeffs).values,
+                               savgol_filter(pxldrl.ts_d, param.medspan, param.smp, mode='nearest'))
+
+
+def test_pixels(parameters):
+    """The pixel drills analysed with the plan have the smoothed series, valleys and cycles of the drills
+    analysed by the per pixel computations"""
+    param = parameters()
+    data = reader.ingest(param).transpose(param.dim_nm, param.row_nm, param.col_nm).values
+    plan = runplan.RunPlan(param)
+    # intermediate series kept, the overlap is the percentage of the long seasons
+    param.single_pnt = True
+    param.tr = param.ovrlp
+
+    for row, col in _PIXELS:
+        pxldrl = analysis.phenolo(atoms.PixelDrill(pd.Series(data[:, row, col].astype(float), index=plan.time),
+                                                   (row, col)), settings=param, plan=plan)
+        assert not pxldrl.error, (row, col)
+
+        np.testing.assert_allclose(pxldrl.ps.values,
+                                   savgol_filter(pxldrl.ts_d, param.medspan, param.smp, mode='nearest'))
+        pd.testing.assert_index_equal(pxldrl.pks.index, metrics.valley_detection(pxldrl, param).index)
+
+        expected = metrics.cycle_metrics(pxldrl)
+        assert len(pxldrl.sincys) == len(expected)
+        assert [i.cbc for i in pxldrl.sincys] == pytest.approx([i.cbc for i in expected], rel=1e-12)